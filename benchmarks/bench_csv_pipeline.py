@@ -0,0 +1,162 @@
+# Benchmark of the CSV pipeline (load, header validation and unified conversion) on synthetic
+# exports of every Bank subclass.
+# Each case runs in a fresh process, and data files are generated in their own process too, so the
+# peak RSS of a case is not inflated by the previous cases or by the data generation.
+# Usage:
+#   python benchmarks/bench_csv_pipeline.py [--rows 1e3 1e5 1e6] [--banks N26 DB]
+#   python benchmarks/bench_csv_pipeline.py --save-baseline    # store the results as the baseline
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import banks_format as banks_format
+import synthetic_data as synthetic_data
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Not available on Windows: peak RSS is not reported
+    RESOURCE_AVAILABLE = False
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_ROWS = [1_000, 100_000, 1_000_000]
+# A case fails if it is this many times slower than its baseline
+DEFAULT_TOLERANCE = 1.3
+STAGES = ["load", "validate", "convert"]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Returns the peak resident set size of the current process in MB, or None."""
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+def run_case(bank_name: str, csv_path: str) -> Dict[str, float]:
+    """
+    Runs the pipeline stages on a file and measures them. Meant to run in its own process.
+    Returns:
+        dict: Seconds per stage, rows, file size and peak RSS
+    """
+    # Imported here so the start-up cost is not part of the parent's measurements
+    import csv_processor as csv_processor
+    logging.disable(logging.WARNING)
+    bank = synthetic_data.get_bank(bank_name)
+    result = {"file_mb": os.path.getsize(csv_path) / (1024 * 1024)}
+
+    start = time.perf_counter()
+    df = csv_processor.load_csv_file(csv_path, bank)
+    result["load"] = time.perf_counter() - start
+
+    # load_csv_file validates the headers too; time that stage on its own
+    start = time.perf_counter()
+    csv_processor._validate_csv_headers(df, bank)
+    result["validate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    unified_df = csv_processor.create_unified_dataframe(df, bank)
+    result["convert"] = time.perf_counter() - start
+
+    result["rows"] = len(unified_df)
+    result["total"] = sum(result[stage] for stage in STAGES)
+    result["rows_per_s"] = result["rows"] / result["total"] if result["total"] > 0 else 0.0
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def generate_data_file(bank_name: str, csv_path: str, rows: int, seed: int) -> str:
+    synthetic_data.write_bank_export(synthetic_data.get_bank(bank_name), csv_path, rows, seed)
+    return csv_path
+
+def run_isolated(function, *args):
+    """
+    Runs a function in a new process. ru_maxrss only ever grows within a process and survives
+    exec on Linux, so the parent has to stay small too.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(function, *args).result()
+
+def get_data_file(data_dir: str, bank: banks_format.Bank, rows: int, seed: int) -> str:
+    """Returns the synthetic export for a case, generating it if it does not exist yet."""
+    csv_path = os.path.join(data_dir, f"{bank.name}-{rows}-{seed}.csv")
+    if not os.path.exists(csv_path):
+        start = time.perf_counter()
+        run_isolated(generate_data_file, bank.name, csv_path, rows, seed)
+        print(f"Generated {csv_path} in {time.perf_counter() - start:.1f} s")
+    return csv_path
+
+def load_baseline(baseline_path: str) -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_baseline(baseline_path: str, results: Dict[str, Dict[str, float]]) -> None:
+    baseline = load_baseline(baseline_path)
+    baseline.update(results)
+    with open(baseline_path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f"Saved {len(results)} cases to {baseline_path}")
+
+def print_report(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Prints one line per case and returns the cases slower than `tolerance` times their baseline.
+    """
+    regressions = []
+    print(f"{'case':<16}{'rows':>11}{'MB':>8}{'load s':>9}{'valid s':>9}{'conv s':>9}{'rows/s':>12}{'RSS MB':>9}{'vs base':>9}")
+    for case, result in results.items():
+        rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+        ratio = "-"
+        if case in baseline and baseline[case]["total"] > 0:
+            relative = result["total"] / baseline[case]["total"]
+            ratio = f"{relative:.2f}x"
+            if relative > tolerance:
+                regressions.append(case)
+                ratio += " !"
+        print(f"{case:<16}{result['rows']:>11,}{result['file_mb']:>8.1f}{result['load']:>9.3f}{result['validate']:>9.3f}"
+              f"{result['convert']:>9.3f}{result['rows_per_s']:>12,.0f}{rss:>9}{ratio:>9}")
+    return regressions
+
+def main():
+    bank_names = list(banks_format.Bank.get_banks())
+    parser = argparse.ArgumentParser(description="Benchmark of the CSV pipeline on synthetic bank exports.")
+    parser.add_argument("--rows", type=float, nargs="+", default=DEFAULT_ROWS, help="Rows per file (1e3 - 1e7)")
+    parser.add_argument("--banks", nargs="+", default=bank_names, choices=bank_names, help="Banks to benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "bank_benchmarks"),
+                        help="Directory where the synthetic exports are kept between runs")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fail if a case is this many times slower than its baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for bank_name in args.banks:
+        bank = synthetic_data.get_bank(bank_name)
+        for rows in sorted(int(r) for r in args.rows):
+            csv_path = get_data_file(args.data_dir, bank, rows, args.seed)
+            results[f"{bank.name}/{rows}"] = run_isolated(run_case, bank.name, csv_path)
+
+    regressions = print_report(results, load_baseline(args.baseline), args.tolerance)
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+    elif regressions:
+        print(f"Slower than {args.tolerance:.2f}x the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
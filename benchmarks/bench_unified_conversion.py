@@ -0,0 +1,63 @@
+# Benchmark of csv_processor.create_unified_dataframe on a synthetic DB export.
+# Usage: python benchmarks/bench_unified_conversion.py [rows]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+import pandas as pd
+import banks_format as banks_format
+import csv_processor as csv_processor
+
+# Conversion time allowed per million rows
+MAX_SECONDS_PER_MILLION_ROWS = 10.0
+
+
+def make_db_dataframe(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds a DataFrame as pd.read_csv returns it for a DB export: every column is text.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3650, rows), unit="D")
+    cents = rng.integers(-500_000, 500_000, rows)
+    # German number format: "." for thousands and "," for decimals
+    amounts = pd.Series([f"{c / 100:,.2f}" for c in cents]).str.translate(str.maketrans(",.", ".,"))
+    is_debit = cents < 0
+
+    bank = banks_format.DB()
+    df = pd.DataFrame({header: pd.Series(np.nan, index=range(rows), dtype=object) for header in bank.header_map})
+    df["Buchungstag"] = days.strftime("%d.%m.%Y")
+    df["Wert"] = df["Buchungstag"]
+    df["Umsatzart"] = rng.choice(["Lastschrift", "Überweisung", "Kartenzahlung", "Gutschrift"], rows)
+    df["Begünstigter / Auftraggeber"] = rng.choice([f"Händler {i}" for i in range(500)], rows)
+    df["Verwendungszweck"] = rng.choice([f"Einkauf Referenz {i}" for i in range(5000)], rows)
+    df["IBAN"] = rng.choice([f"DE8937040044053201{i:04d}" for i in range(300)], rows)
+    df["BIC"] = "COBADEFFXXX"
+    df["Kundenreferenz"] = rng.choice([f"REF{i}" for i in range(2000)], rows)
+    df["Betrag"] = amounts.where(~is_debit)
+    df["Soll"] = amounts.where(is_debit)
+    df["Währung"] = "EUR"
+    return df
+
+
+def main():
+    rows = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1_000_000
+    bank = banks_format.DB()
+    df = make_db_dataframe(rows)
+
+    start = time.perf_counter()
+    unified_df = csv_processor.create_unified_dataframe(df, bank)
+    elapsed = time.perf_counter() - start
+
+    limit = max(1.0, MAX_SECONDS_PER_MILLION_ROWS * rows / 1_000_000)
+    print(f"Converted {len(unified_df):,} rows in {elapsed:.2f} s ({len(unified_df) / elapsed:,.0f} rows/s, limit {limit:.2f} s)")
+    assert unified_df["amount"].notna().all(), "Every row should have an amount"
+    assert unified_df["date"].notna().all(), "Every row should have a date"
+    if elapsed > limit:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# Generator of synthetic bank exports (BD1) for benchmarks.
+# The files follow the configuration of each Bank subclass: encoding, delimiter, decimal separator,
+# date format, preamble rows, footer rows and the header_map columns, with values generated
+# according to the unified column each header is mapped to.
+# Usage: python benchmarks/synthetic_data.py OUTPUT_DIR [rows] [bank ...]
+import csv
+import os
+import re
+import sys
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+import pandas as pd
+import banks_format as banks_format
+import unified_format as udb
+
+# Rows generated and written at a time, so 1e7-row files do not need to fit in memory
+BLOCK_ROWS = 100_000
+# Date format of the banks that let the loader detect it (csv_date_format=None)
+DEFAULT_DATE_FORMAT = "%d-%m-%Y"
+# Quoting of the exported values, for the banks that do not use minimal quoting
+QUOTING = {"N26": csv.QUOTE_ALL}
+
+# Values of unused headers that banks do fill in: another date or the currency
+_UNUSED_COLUMNS = {
+    "Value Date": "date",
+    "Fecha valor": "date",
+    "Wert": "date",
+    "Account Name": "Main Account",
+    "Moneda": "EUR",
+    "Moneda.1": "EUR",
+    "Moneda 2": "EUR",
+    "Währung": "EUR",
+}
+# Vocabulary of the text columns. Values repeat, as in real exports
+_MERCHANTS = ["Mercadona", "Edeka Straße", "Amazon Müller", "Café Olé", "Lidl", "Renfe", "Deutsche Bahn", "Peña Ñandú"]
+_TRANSACTION_TYPES = ["Lastschrift", "Überweisung", "Kartenzahlung", "Gutschrift", "Presentment", "Transferencia"]
+_DISTINCT_DESCRIPTIONS = 5_000
+_DISTINCT_ORIGINS = 500
+_DISTINCT_IBANS = 300
+
+
+def get_bank(bank_name: str) -> banks_format.Bank:
+    """Returns an instance of the Bank subclass with the given name."""
+    return banks_format.Bank.get_bank(bank_name)
+
+def write_bank_export(bank: banks_format.Bank, csv_path: str, rows: int, seed: int = 0,
+                      start_date: str = "2015-01-01", opening_balance_cents: int = 100_000) -> str:
+    """
+    Writes a synthetic export of `bank` with `rows` transactions sorted by date.
+    Args:
+        bank (banks_format.Bank): Bank whose configuration the file follows
+        csv_path (str): Path of the file to write
+        rows (int): Number of transactions
+        seed (int): Seed of the random generator; the same seed writes the same file
+        start_date (str): Date of the first transaction
+        opening_balance_cents (int): Balance before the first transaction, in cents
+    Returns:
+        str: Path of the written file
+    """
+    if not isinstance(rows, int) or rows <= 0:
+        raise ValueError(f"Invalid number of rows '{rows}'. It should be a positive integer.")
+    rng = np.random.default_rng(seed)
+    date_format = bank.csv_date_format or DEFAULT_DATE_FORMAT
+    # About 30 transactions a day, at least a year
+    days = max(365, rows // 30)
+    first_day = pd.Timestamp(start_date)
+    day_strings = pd.date_range(first_day, periods=days + 1, freq="D").strftime(date_format).to_numpy(dtype=object)
+    day_offsets = np.sort(rng.integers(0, days + 1, rows))
+
+    os.makedirs(os.path.dirname(os.path.abspath(csv_path)), exist_ok=True)
+    balance = opening_balance_cents
+    with open(csv_path, "w", encoding=bank.csv_encoding, newline="") as f:
+        last_day = day_strings[day_offsets[-1]]
+        for line in _preamble_lines(bank, day_strings[0], last_day, opening_balance_cents):
+            f.write(line + "\n")
+        f.write(bank.csv_delimiter.join(_quote(header, bank) for header in _export_headers(bank)) + "\n")
+        for block_start in range(0, rows, BLOCK_ROWS):
+            block_offsets = day_offsets[block_start:block_start + BLOCK_ROWS]
+            block, balance = _make_block(bank, rng, day_strings, block_offsets, balance)
+            block.to_csv(f, sep=bank.csv_delimiter, header=False, index=False,
+                         quoting=QUOTING.get(bank.name, csv.QUOTE_MINIMAL), lineterminator="\n")
+        for line in _footer_lines(bank, last_day, balance):
+            f.write(line + "\n")
+    return csv_path
+
+def _make_block(bank: banks_format.Bank, rng: np.random.Generator, day_strings: np.ndarray,
+                day_offsets: np.ndarray, balance: int):
+    """
+    Builds the rows of a block as text, the way they appear in the file.
+    Returns:
+        tuple: (DataFrame with one column per export header, balance after the block in cents)
+    """
+    rows = len(day_offsets)
+    cents = rng.integers(-50_000, 20_000, rows)
+    # Some large incomes, so balances and thousands separators show up
+    cents[rng.random(rows) < 0.02] = rng.integers(100_000, 500_000)
+    balances = balance + np.cumsum(cents)
+    amount_headers = [header for header, column in bank.header_map.items() if column == udb.UnifiedHeaders.amount]
+
+    columns: Dict[str, object] = {}
+    for header, column in bank.header_map.items():
+        if column == udb.UnifiedHeaders.date:
+            columns[header] = day_strings[day_offsets]
+        elif column == udb.UnifiedHeaders.amount:
+            values = _format_amounts(cents, bank)
+            if len(amount_headers) > 1:
+                # Banks with several amount columns fill one of them: credits the first, debits the last
+                is_debit = cents < 0
+                keep = ~is_debit if header == amount_headers[0] else is_debit if header == amount_headers[-1] else np.zeros(rows, dtype=bool)
+                values = np.where(keep, values, "")
+            columns[header] = values
+        elif column == udb.UnifiedHeaders.balance:
+            columns[header] = _format_amounts(balances, bank)
+        elif column == udb.UnifiedHeaders.unused:
+            kind = _UNUSED_COLUMNS.get(header)
+            if kind == "date":
+                columns[header] = day_strings[day_offsets]
+            else:
+                columns[header] = kind or ""
+        else:
+            columns[header] = _make_text(column, header, rng, rows)
+    return pd.DataFrame(columns), int(balances[-1])
+
+def _make_text(column: udb.BankEntryType, header: str, rng: np.random.Generator, rows: int) -> np.ndarray:
+    if column == udb.UnifiedHeaders.origin:
+        choices = [f"{_MERCHANTS[i % len(_MERCHANTS)]} {i}" for i in range(_DISTINCT_ORIGINS)]
+    elif column == udb.UnifiedHeaders.transaction_type:
+        choices = _TRANSACTION_TYPES
+    elif column == udb.UnifiedHeaders.iban:
+        choices = [f"DE8937040044053201{i:04d}" for i in range(_DISTINCT_IBANS)]
+    elif column == udb.UnifiedHeaders.description:
+        choices = [f"Compra {_MERCHANTS[i % len(_MERCHANTS)]} ref. {i}" for i in range(_DISTINCT_DESCRIPTIONS)]
+    else:
+        choices = [f"{header} {i}" for i in range(_DISTINCT_DESCRIPTIONS // 10)]
+    values = np.array(choices, dtype=object)[rng.integers(0, len(choices), rows)]
+    # Optional columns are sometimes empty
+    if not column.mandatory:
+        values[rng.random(rows) < 0.05] = ""
+    return values
+
+def _format_amounts(cents: np.ndarray, bank: banks_format.Bank) -> np.ndarray:
+    """
+    Formats amounts in cents with the decimal separator of the bank. Banks with "," for
+    decimals use "." for thousands ("-1.234,56").
+    """
+    if bank.csv_decimal == ",":
+        table = str.maketrans(",.", ".,")
+        return np.array([f"{c / 100:,.2f}".translate(table) for c in cents.tolist()], dtype=object)
+    return np.array([f"{c / 100:.2f}" for c in cents.tolist()], dtype=object)
+
+def _export_headers(bank: banks_format.Bank) -> List[str]:
+    """
+    Returns the header line of the export. Repeated headers appear in the header_map the way
+    pandas renames them ("Moneda.1"), so the suffix is removed.
+    """
+    headers = []
+    for header in bank.header_map:
+        match = re.fullmatch(r"(.+)\.(\d+)", header)
+        headers.append(match.group(1) if match and match.group(1) in bank.header_map else header)
+    return headers
+
+def _preamble_lines(bank: banks_format.Bank, first_day: str, last_day: str, opening_balance_cents: int) -> List[str]:
+    """Returns the csv_header_row lines before the header line: period and opening balance."""
+    lines = [f"Umsätze Girokonto{bank.csv_delimiter}Zeitraum: {first_day} - {last_day}",
+             "",
+             f"Kontostand vom {first_day}:{bank.csv_delimiter * 3}{_format_amounts(np.array([opening_balance_cents]), bank)[0]} EUR"]
+    lines = lines[:bank.csv_header_row]
+    return lines + [""] * (bank.csv_header_row - len(lines))
+
+def _footer_lines(bank: banks_format.Bank, last_day: str, balance_cents: int) -> List[str]:
+    """Returns the lines after the last transaction: the closing balance."""
+    closing = _format_amounts(np.array([balance_cents]), bank)[0]
+    return [bank.csv_delimiter.join(["Kontostand", last_day, "", "", closing, "EUR"])] * -bank.csv_last_row
+
+def _quote(value: str, bank: banks_format.Bank) -> str:
+    if QUOTING.get(bank.name) == csv.QUOTE_ALL:
+        return f'"{value}"'
+    return value
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Usage: python benchmarks/synthetic_data.py OUTPUT_DIR [rows] [bank ...]")
+        sys.exit(2)
+    output_dir = argv[0]
+    rows = int(float(argv[1])) if len(argv) > 1 else 1_000
+    bank_names = argv[2:] or list(banks_format.Bank.get_banks())
+    for bank_name in bank_names:
+        bank = get_bank(bank_name)
+        csv_path = write_bank_export(bank, os.path.join(output_dir, bank.name, bank.csv_filename), rows)
+        print(f"Wrote {rows:,} {bank.name} rows to {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
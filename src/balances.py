@@ -0,0 +1,186 @@
+# Running balances of the bank accounts.
+# The balance after each transaction is the opening balance plus the cumulative sum of the amounts.
+# Balances given by the bank (the 'balance' column, e.g. Abanca's Saldo, and the balance rows of
+# the statement preamble and footer) are checkpoints: mismatches are reported, and the running
+# balance continues from the bank's value. The end-of-day balances are kept in a sorted index per
+# account, so the balance on a date is a binary search.
+import bisect
+import os
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from utils.json_files import load_json, save_json_atomic
+from utils.utils import log, to_date
+
+
+@dataclass(frozen=True)
+class BalanceMismatch:
+    date: date
+    expected: int  # Balance given by the bank, in cents
+    computed: int  # Running balance, in cents
+
+    def __str__(self):
+        return f"{self.date}: the bank states {self.expected / 100:.2f}, computed {self.computed / 100:.2f}"
+
+
+@dataclass
+class BalanceReport:
+    """Running balances of the transactions of one import of an account."""
+    bank: str
+    account: str
+    opening: int
+    # Day whose end-of-day balance the opening balance is
+    opening_date: date
+    # Balance at the end of each day with transactions, sorted by date
+    daily: pd.Series
+    mismatches: List[BalanceMismatch] = field(default_factory=list)
+
+    @property
+    def closing(self) -> int:
+        return int(self.daily.iloc[-1]) if len(self.daily) else self.opening
+
+    def log_summary(self) -> None:
+        account = f" ({self.account})" if self.account else ""
+        for mismatch in self.mismatches:
+            log.warning(f"{self.bank}{account} balance mismatch on {mismatch}")
+        log.info(f"{self.bank}{account}: balance {self.opening / 100:.2f} -> {self.closing / 100:.2f}, "
+                 f"{len(self.mismatches)} mismatches with the bank balances")
+
+
+def sort_chronologically(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sorts transactions by date, keeping the order of the transactions of the same day.
+    Exports listed newest first are reversed before, so their same-day transactions end up in
+    chronological order too.
+    """
+    dates = df["date"].dropna()
+    if len(dates) > 1 and dates.iloc[0] > dates.iloc[-1]:
+        df = df.iloc[::-1]
+    return df.sort_values("date", kind="stable", na_position="last")
+
+def compute_balances(df: pd.DataFrame, bank: str, account: str = "", opening: Optional[int] = None,
+                     closing_balances: Optional[List[Tuple[pd.Timestamp, int]]] = None,
+                     previous_balances: Optional["BalanceIndex"] = None, continues: bool = False) -> Optional[BalanceReport]:
+    """
+    Computes the running balance of the transactions of one account.
+    The opening balance is, in this order: `opening`, the balance column of the first transaction
+    minus its amount, or the indexed balance at the end of the day before the first transaction.
+    Without any of them, the balance is unknown.
+    Args:
+        df (pd.DataFrame): Unified transactions, with 'date', 'amount' and optionally 'balance'
+        bank (str): Bank name
+        account (str): Account within the bank; empty if the bank has a single account
+        opening (int, optional): Balance before the first transaction, in cents, e.g. from the
+            statement preamble (see csv_processor.read_statement_balances)
+        closing_balances (list, optional): (date, cents) balances at the end of a day, e.g. from the
+            statement footer
+        previous_balances (BalanceIndex, optional): Balances of the previous imports
+        continues (bool): The transactions continue the indexed ones, e.g. rows appended to an
+            imported file, so their first day may already have a balance from its earlier rows
+    Returns:
+        BalanceReport, or None if there are no dated transactions or the opening balance is unknown
+    """
+    df = sort_chronologically(df[df["date"].notna()])
+    if df.empty:
+        return None
+    days = df["date"].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    first_day = pd.Timestamp(days[0]).date()
+    opening_date = first_day if continues else first_day - timedelta(days=1)
+    amounts = pd.array(df["amount"], dtype="Int64").fillna(0).to_numpy(dtype=np.int64)
+    if "balance" in df.columns:
+        provided = pd.array(df["balance"], dtype="Int64")
+    else:
+        provided = pd.array([pd.NA] * len(df), dtype="Int64")
+
+    mismatches = []
+    if opening is None and not pd.isna(provided[0]):
+        opening = int(provided[0]) - int(amounts[0])
+    indexed = previous_balances.balance_at(opening_date, account) if previous_balances is not None else None
+    if opening is None:
+        if indexed is None:
+            return None
+        opening = indexed
+    elif indexed is not None and previous_balances.covers(opening_date, account) and indexed != opening:
+        mismatches.append(BalanceMismatch(opening_date, int(opening), int(indexed)))
+
+    running = opening + np.cumsum(amounts)
+    # Drift between the bank balance and the running balance at each checkpoint row. Each row
+    # continues from the drift of the last checkpoint at or before it
+    checkpoints = ~provided.isna()
+    drift = np.zeros(len(df), dtype=np.int64)
+    drift[checkpoints] = provided[checkpoints].to_numpy(dtype=np.int64) - running[checkpoints]
+    last_checkpoint = np.maximum.accumulate(np.where(checkpoints, np.arange(len(df)), -1))
+    carried = np.where(last_checkpoint >= 0, drift[np.maximum(last_checkpoint, 0)], 0)
+    previous_drift = np.concatenate(([0], carried[:-1]))
+    for row in np.flatnonzero(checkpoints & (drift != previous_drift)):
+        mismatches.append(BalanceMismatch(pd.Timestamp(days[row]).date(), int(provided[row]), int(running[row] + previous_drift[row])))
+    balance = running + carried
+
+    # Balance at the end of each day: the balance after its last transaction
+    last_of_day = np.append(days[1:] != days[:-1], True)
+    daily = pd.Series(balance[last_of_day], index=pd.DatetimeIndex(days[last_of_day]))
+
+    for day, cents in closing_balances or []:
+        position = daily.index.searchsorted(pd.Timestamp(day), side="right") - 1
+        computed = int(daily.iloc[position]) if position >= 0 else opening
+        if computed != cents:
+            mismatches.append(BalanceMismatch(pd.Timestamp(day).date(), int(cents), computed))
+    mismatches.sort(key=lambda mismatch: mismatch.date)
+    return BalanceReport(bank, account, int(opening), opening_date, daily, mismatches)
+
+
+class BalanceIndex:
+    """
+    Persistent end-of-day balances of the accounts of a bank. Each account keeps its dates (as
+    ordinals) and balances in two sorted lists, so the balance on a date is a binary search for
+    the last day with a balance at or before it.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        # Account -> (sorted date ordinals, balance in cents at the end of each date)
+        self._balances: Dict[str, Tuple[List[int], List[int]]] = {}
+        if os.path.exists(index_path):
+            data = load_json(index_path)
+            for account, entries in data.items():
+                self._balances[account] = ([date.fromisoformat(day).toordinal() for day, _ in entries],
+                                           [int(cents) for _, cents in entries])
+
+    def balance_at(self, day, account: str = "") -> Optional[int]:
+        """
+        Returns the balance in cents at the end of a day, or None if nothing is known before it.
+        """
+        days, balances = self._balances.get(account, ([], []))
+        position = bisect.bisect_right(days, to_date(day).toordinal()) - 1
+        return balances[position] if position >= 0 else None
+
+    def covers(self, day, account: str = "") -> bool:
+        """Returns True if a day is within the first and the last day with a known balance."""
+        days, _ = self._balances.get(account, ([], []))
+        ordinal = to_date(day).toordinal()
+        return bool(days) and days[0] <= ordinal <= days[-1]
+
+    def add(self, report: BalanceReport) -> None:
+        """
+        Adds the end-of-day balances of an import, and its opening balance as the balance of the
+        day before its first transaction. They replace the known balances of those days.
+        """
+        if report.daily.empty:
+            return
+        new_days = [day.toordinal() for day in report.daily.index.date]
+        new_balances = [int(cents) for cents in report.daily.to_numpy()]
+        if report.opening_date.toordinal() < new_days[0]:
+            new_days.insert(0, report.opening_date.toordinal())
+            new_balances.insert(0, report.opening)
+        days, balances = self._balances.setdefault(report.account, ([], []))
+        lo = bisect.bisect_left(days, new_days[0])
+        hi = bisect.bisect_right(days, new_days[-1])
+        days[lo:hi] = new_days
+        balances[lo:hi] = new_balances
+
+    def save(self) -> None:
+        data = {account: [[date.fromordinal(day).isoformat(), cents] for day, cents in zip(days, balances)]
+                for account, (days, balances) in self._balances.items()}
+        save_json_atomic(self.index_path, data)
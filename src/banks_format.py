@@ -1,18 +1,31 @@
 # This file contains a list of banks and their configurations for CSV processing.
 # E.g. each bank has a name, CSV encoding, delimiter, header mapping, and other configurations.
-# To add support for a new bank, create a new subclass of the Bank class with the appropriate configurations.
-# Each bank is represented as a subclass of the Bank class.
+# To add support for a new bank, create a new subclass of the Bank class with the appropriate configurations,
+# or define it in banks.yaml (see yaml_config.load_bank_definitions), which needs no Python code.
+# Each built-in bank is represented as a subclass of the Bank class.
 
+import os
 from dataclasses import dataclass
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Tuple
 import unified_format as udb
 
+# Optional file with the banks defined in YAML, relative to the working directory like local_settings.yaml.
+# Its banks replace the built-in banks with the same name
+BANK_DEFINITIONS_PATH = "banks.yaml"
+# Configuration keys of a bank defined in YAML, besides header_map
+_CONFIG_KEYS = ["description", "csv_encoding", "csv_delimiter", "csv_header_row", "csv_last_row", "csv_filename",
+                "csv_decimal", "csv_date_format"]
+
 @dataclass
 class Bank:
     CSV_ENCODINGS = ["utf-8", "cp1252", "ISO-8859-1"]
     CSV_DELIMITERS = [";", ","]
+    CSV_DECIMALS = [".", ","]
+    # Date formats tried, in order, when a bank does not define its csv_date_format
+    DATE_FORMATS = ["%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%y", "%d/%m/%y", "%d-%m-%y"]
     
-    def __init__(self, name="Bank",  header_map=None, csv_encoding="utf-8", csv_delimiter=",", description="", csv_header_row=0, csv_last_row=0, csv_filename="importar.csv"):
+    def __init__(self, name="Bank",  header_map=None, csv_encoding="utf-8", csv_delimiter=",", description="", csv_header_row=0, csv_last_row=0, csv_filename="importar.csv", csv_decimal=".", csv_date_format=None):
         self.name = name
         self.description = description
         if header_map is None:
@@ -31,6 +44,16 @@ class Bank:
         if csv_delimiter not in self.CSV_DELIMITERS:
             raise ValueError(f"Invalid delimiter '{csv_delimiter}' for bank '{name}'. Available options: {self.CSV_DELIMITERS}")
         
+        self.csv_decimal = csv_decimal
+        if csv_decimal not in self.CSV_DECIMALS:
+            raise ValueError(f"Invalid decimal separator '{csv_decimal}' for bank '{name}'. Available options: {self.CSV_DECIMALS}")
+        if csv_decimal == csv_delimiter:
+            raise ValueError(f"Decimal separator and delimiter of bank '{name}' cannot be the same ('{csv_decimal}').")
+        
+        self.csv_date_format = csv_date_format
+        if csv_date_format is not None and (not isinstance(csv_date_format, str) or "%" not in csv_date_format):
+            raise ValueError(f"Invalid date format '{csv_date_format}' for bank '{name}'. It should be a strptime format such as '%d.%m.%Y', or None to detect it.")
+        
         self.csv_header_row = csv_header_row
         if not isinstance(csv_header_row, int) or csv_header_row < 0:
             raise ValueError(f"Invalid header row index '{csv_header_row}' for bank '{name}'. It should be a non-negative integer.")
@@ -39,6 +62,7 @@ class Bank:
         if not isinstance(csv_last_row, int) or csv_last_row > 0:
             raise ValueError(f"Invalid last row index '{csv_last_row}' for bank '{name}'. It should be a negative or 0 integer (e.g., -1 for last row) or zero.")
         
+        # May be a glob pattern such as "export_*.csv" to import several exports of the bank together
         self.csv_filename = csv_filename
         if (
             not isinstance(csv_filename, str)
@@ -55,8 +79,65 @@ class Bank:
         return f"{self.name}"
 
     @classmethod
-    def get_banks_list(cls):
-        return [subcls.__name__ for subcls in cls.__subclasses__()]
+    def from_config(cls, name: str, config: Dict) -> "Bank":
+        """
+        Builds a bank from its declarative configuration, as loaded by yaml_config.load_bank_definitions.
+        The header_map values are names of UnifiedHeaders columns, e.g. "date" or "unused".
+        Raises:
+            ValueError: If the configuration is invalid
+        """
+        arguments = dict(config)
+        header_map = arguments.pop("header_map", None)
+        if not isinstance(header_map, dict) or not header_map:
+            raise ValueError(f"Bank '{name}' should have a non-empty header_map.")
+        unified_columns = udb.UnifiedHeaders.get_all_columns()
+        mapped = {}
+        for header, column in header_map.items():
+            if column not in unified_columns:
+                raise ValueError(f"Invalid unified column '{column}' for header '{header}' of bank '{name}'. Available options: {list(unified_columns)}")
+            mapped[str(header)] = unified_columns[column]
+        unknown = [key for key in arguments if key not in _CONFIG_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown configuration keys {unknown} for bank '{name}'. Available options: {_CONFIG_KEYS}")
+        return cls(name=str(name), header_map=mapped, **arguments)
+
+    @classmethod
+    def get_banks_list(cls) -> List[str]:
+        """
+        Returns the names of the valid banks, the subclasses and the banks defined in YAML, as
+        get_banks does.
+        """
+        return list(_load_registry(cls)[0])
+
+    @classmethod
+    def get_banks(cls) -> Dict[str, "Bank"]:
+        """
+        Returns an instance of every bank subclass, by bank name. The subclasses are instantiated
+        and validated once; banks with an invalid configuration are left out (see get_bank_errors).
+        """
+        return dict(_load_registry(cls)[0])
+
+    @classmethod
+    def get_bank_errors(cls) -> Dict[str, str]:
+        """
+        Returns the configuration error of every bank subclass that could not be instantiated,
+        by class name.
+        """
+        return dict(_load_registry(cls)[1])
+
+    @classmethod
+    def get_bank(cls, name: str) -> "Bank":
+        """
+        Returns the registered instance of a bank.
+        Raises:
+            ValueError: If there is no valid bank with that name
+        """
+        banks, errors = _load_registry(cls)
+        if name in banks:
+            return banks[name]
+        if name in errors:
+            raise ValueError(f"Invalid configuration of bank '{name}': {errors[name]}")
+        raise ValueError(f"Unknown bank '{name}'. Available banks: {list(banks)}")
     
     @classmethod
     def get_encodings_options(cls):
@@ -72,7 +153,9 @@ class Bank:
             "csv_encoding": self.csv_encoding,
             "csv_delimiter": self.csv_delimiter,
             "csv_header_row": self.csv_header_row,
-            "csv_filename": self.csv_filename
+            "csv_filename": self.csv_filename,
+            "csv_decimal": self.csv_decimal,
+            "csv_date_format": self.csv_date_format
         }
     
 
@@ -84,6 +167,8 @@ class N26(Bank):
             csv_delimiter=",",
             csv_header_row=0,
             csv_filename="importar.csv",
+            csv_decimal=".",
+            csv_date_format="%Y-%m-%d",
             header_map = {
                 #"Date":                     udb.columns.date,
                 #"Account number":           udb.columns.iban,
@@ -115,13 +200,14 @@ class Abanca(Bank):
             csv_delimiter=";",
             csv_header_row=0,
             csv_filename="importar.csv",
+            csv_decimal=",",
             header_map = {
                 "Fecha ctble":      udb.UnifiedHeaders.date,
                 "Fecha valor":      udb.UnifiedHeaders.unused,
                 "Concepto":         udb.UnifiedHeaders.description,
                 "Importe":          udb.UnifiedHeaders.amount,
                 "Moneda":           udb.UnifiedHeaders.unused,
-                "Saldo":            udb.UnifiedHeaders.unused, # TODO saldo!
+                "Saldo":            udb.UnifiedHeaders.balance,
                 "Moneda.1":         udb.UnifiedHeaders.unused,
                 "Moneda 2":         udb.UnifiedHeaders.unused,
                 "Concepto ampliado":udb.UnifiedHeaders.info_extended,
@@ -138,6 +224,8 @@ class DB(Bank):
             csv_header_row=4,
             csv_last_row=-1,
             csv_filename="importar.csv",
+            csv_decimal=",",
+            csv_date_format="%d.%m.%Y",
             header_map = {
                 "Buchungstag":                  udb.UnifiedHeaders.date,
                 "Wert":                         udb.UnifiedHeaders.unused, #Date 2
@@ -159,4 +247,28 @@ class DB(Bank):
                 "Haben":                        udb.UnifiedHeaders.unused,
                 "Währung":                      udb.UnifiedHeaders.unused
             }
-        )
\ No newline at end of file
+        )
+
+
+@lru_cache(maxsize=None)
+def _load_registry(base_cls: type) -> Tuple[Dict[str, Bank], Dict[str, str]]:
+    banks, errors = {}, {}
+    for bank_cls in base_cls.__subclasses__():
+        try:
+            bank = bank_cls()
+        except ValueError as e:
+            errors[bank_cls.__name__] = str(e)
+            continue
+        banks[bank.name] = bank
+    if os.path.exists(BANK_DEFINITIONS_PATH):
+        # yaml is only needed, and imported, when there are banks defined in YAML
+        from utils import yaml_config
+        for bank_name, config in yaml_config.load_bank_definitions(BANK_DEFINITIONS_PATH).items():
+            banks.pop(str(bank_name), None)
+            try:
+                bank = base_cls.from_config(bank_name, config)
+            except ValueError as e:
+                errors[str(bank_name)] = str(e)
+                continue
+            banks[bank.name] = bank
+    return banks, errors
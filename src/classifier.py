@@ -0,0 +1,279 @@
+# Keyword classification of the unified transactions (Classify-app).
+# All keywords of all categories are compiled into a single Aho-Corasick automaton, expanded into a
+# dense transition table. The distinct texts of a column are then run through it all at once with
+# numpy, one character position per step, so no Python code runs per text or per character and
+# the cost does not grow with the number of keywords.
+import sys
+import unicodedata
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+import unified_dtypes as unified_dtypes
+from utils.utils import log
+
+# Unified columns searched for keywords
+TEXT_COLUMNS = ("description", "origin", "info_extended")
+# Characters of the texts run through the automaton at once, as a matrix of code points
+BATCH_CHARS = 1 << 22
+
+
+@dataclass(frozen=True)
+class CategoryRule:
+    """
+    A user-defined category with its group category and keywords.
+    When keywords of several rules match, the rule with the highest priority wins; on equal
+    priority, the rule defined first wins.
+    """
+    category: str
+    group: str
+    keywords: Tuple[str, ...]
+    priority: int = 0
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text for keyword matching: case-folded (ß -> ss), without accents (é -> e) and
+    with collapsed whitespace.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.split())
+
+def fold_texts(values: pd.Series) -> pd.Series:
+    """
+    Normalizes a column of texts like normalize_text, but without collapsing the whitespace,
+    which KeywordAutomaton does. ASCII texts only need to be lower-cased; the others are also
+    decomposed and stripped of their accents.
+    """
+    text = values.astype(unified_dtypes.STRING_DTYPE)
+    folded = text.str.lower()
+    non_ascii = ~text.str.isascii().fillna(True).to_numpy(dtype=bool)
+    if non_ascii.any():
+        folded[non_ascii] = text[non_ascii].str.casefold().str.normalize("NFKD").str.replace(_combining_class() + "+", "", regex=True)
+    return folded
+
+@lru_cache(maxsize=None)
+def _combining_class() -> str:
+    """
+    Returns a regex character class of the characters stripped by normalize_text, valid for
+    both re and RE2.
+    """
+    ranges: List[List[int]] = []
+    for code_point in range(sys.maxunicode + 1):
+        if not unicodedata.combining(chr(code_point)):
+            continue
+        if ranges and code_point == ranges[-1][1] + 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return "[" + "".join(chr(first) if first == last else f"{chr(first)}-{chr(last)}" for first, last in ranges) + "]"
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a list of keywords.
+    Each keyword has a rank (lower is better); search returns the best rank found in each text.
+    """
+    # Rank of the states where no keyword ends
+    NO_MATCH = np.iinfo(np.int32).max
+    # Symbols of the characters that no keyword has, and of those that leave the state unchanged:
+    # the padding of the texts and the whitespace that follows whitespace
+    _OTHER, _STAY = 0, 1
+
+    def __init__(self, keywords: Sequence[str], ranks: Sequence[int]):
+        goto: List[Dict[str, int]] = [{}]
+        fail: List[int] = [0]
+        # Best rank of the keywords ending at each state, including the ones reached through fail links
+        best: List[int] = [self.NO_MATCH]
+
+        for keyword, rank in zip(keywords, ranks):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    fail.append(0)
+                    best.append(self.NO_MATCH)
+                state = next_state
+            best[state] = min(best[state], rank)
+
+        # Symbol of each character of the keywords. A space of a keyword matches any whitespace
+        alphabet = sorted(set("".join(keywords)) | {" "})
+        symbols = {char: symbol for symbol, char in enumerate(alphabet, start=2)}
+        self._space = symbols[" "]
+        # All the whitespace characters are in the Basic Multilingual Plane
+        whitespace = [code_point for code_point in range(0x10000) if chr(code_point).isspace()]
+        # Code point -> symbol. Code points past the table are clipped to its last entry, _OTHER
+        self._symbols = np.full(max(max(map(ord, alphabet)), max(whitespace)) + 2, self._OTHER, dtype=np.int32)
+        self._symbols[[ord(char) for char in alphabet]] = list(symbols.values())
+        self._symbols[whitespace] = self._space
+        self._symbols[0] = self._STAY
+
+        # Dense transitions, built in breadth-first order so the state of a fail link is complete
+        # before the states that fall back to it
+        table = np.zeros((len(goto), len(alphabet) + 2), dtype=np.int32)
+        table[:, self._STAY] = np.arange(len(goto))
+        for char, next_state in goto[0].items():
+            table[0, symbols[char]] = next_state
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            table[state, 2:] = table[fail[state], 2:]
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fail[next_state] = table[fail[state], symbols[char]] if state else 0
+                best[next_state] = min(best[next_state], best[fail[next_state]])
+                table[state, symbols[char]] = next_state
+        # Transitions as flat offsets (state * number of symbols), and the rank reached by each one
+        self._num_symbols = table.shape[1]
+        self._table = (table * self._num_symbols).ravel()
+        self._ranks = np.asarray(best, dtype=np.int32)[table].ravel()
+
+    def __len__(self):
+        return len(self._table) // self._num_symbols
+
+    def best_match(self, text: str) -> Optional[int]:
+        """
+        Returns the best (lowest) rank of the keywords found in `text`, or None.
+        """
+        rank = self.best_matches(np.array([text], dtype=object))[0]
+        return None if rank == self.NO_MATCH else int(rank)
+
+    def best_matches(self, texts: np.ndarray) -> np.ndarray:
+        """
+        Returns the best rank of the keywords found in each text, NO_MATCH where none is found.
+        Args:
+            texts (np.ndarray): Texts normalized with fold_texts
+        """
+        ranks = np.full(len(texts), self.NO_MATCH, dtype=np.int32)
+        if len(texts) == 0:
+            return ranks
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        # Texts of similar lengths are batched together, so little padding is matched
+        order = np.argsort(lengths, kind="stable")
+        start = 0
+        while start < len(texts):
+            # As many texts as fit in BATCH_CHARS once padded to the longest one
+            end = min(len(texts), start + max(1, BATCH_CHARS // max(1, lengths[order[start]])))
+            end = start + max(1, min(end - start, BATCH_CHARS // max(1, lengths[order[end - 1]])))
+            batch = order[start:end]
+            ranks[batch] = self._match_batch(texts[batch])
+            start = end
+        return ranks
+
+    def _match_batch(self, texts: np.ndarray) -> np.ndarray:
+        # Symbols of the texts as a (position, text) matrix, padded with _STAY
+        code_points = np.array(texts.tolist(), dtype=str)
+        code_points = code_points.view(np.uint32).reshape(len(texts), -1)
+        symbols = self._symbols[np.minimum(code_points, len(self._symbols) - 1)].T.copy()
+        # Runs of whitespace match like a single space
+        is_space = symbols == self._space
+        symbols[1:][is_space[1:] & is_space[:-1]] = self._STAY
+
+        states = np.zeros(len(texts), dtype=np.int32)
+        ranks = np.full(len(texts), self.NO_MATCH, dtype=np.int32)
+        for position_symbols in symbols:
+            transitions = states + position_symbols
+            np.minimum(ranks, self._ranks[transitions], out=ranks)
+            states = self._table[transitions]
+        return ranks
+
+
+class Classifier:
+    """
+    Compiled ruleset. Use compile_rules to get a cached instance.
+    """
+
+    def __init__(self, rules: Sequence[CategoryRule]):
+        self.rules = tuple(rules)
+        # Rank of each rule: by descending priority, then by definition order
+        order = sorted(range(len(self.rules)), key=lambda i: (-self.rules[i].priority, i))
+        self._ranked_rules = [self.rules[i] for i in order]
+        rank_of = {rule_index: rank for rank, rule_index in enumerate(order)}
+
+        keywords, ranks = [], []
+        for rule_index, rule in enumerate(self.rules):
+            for keyword in rule.keywords:
+                normalized = normalize_text(keyword)
+                if not normalized:
+                    raise ValueError(f"Empty keyword in category '{rule.category}'.")
+                keywords.append(normalized)
+                ranks.append(rank_of[rule_index])
+        self._automaton = KeywordAutomaton(keywords, ranks)
+        log.info(f"Compiled {len(self.rules)} categories with {len(keywords)} keywords into {len(self._automaton)} states")
+
+    def classify_text(self, text: str) -> Optional[CategoryRule]:
+        """
+        Returns the winning rule for a single text, or None.
+        """
+        rank = self._automaton.best_match(normalize_text(text))
+        return None if rank is None else self._ranked_rules[rank]
+
+    def classify(self, df: pd.DataFrame, columns: Iterable[str] = TEXT_COLUMNS) -> pd.DataFrame:
+        """
+        Classifies the transactions of a unified DataFrame.
+        Each text column is scanned once per distinct value, and the best rule of a row is the
+        best rule over its columns.
+        Args:
+            df (pd.DataFrame): Unified DataFrame
+            columns (list): Text columns to search. Missing columns are ignored.
+        Returns:
+            pd.DataFrame: 'category' and 'group' columns, <NA> where no keyword matched
+        """
+        # Rank of the best rule of each row, len(rules) where nothing matched
+        no_match = len(self._ranked_rules)
+        row_ranks = np.full(len(df), no_match, dtype=np.int64)
+        for column in columns:
+            if column not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[column], use_na_sentinel=True)
+            texts = fold_texts(pd.Series(uniques)).to_numpy(dtype=object)
+            # Missing values (code -1) pick the trailing no_match
+            unique_ranks = np.append(np.minimum(self._automaton.best_matches(texts), no_match), no_match)
+            np.minimum(row_ranks, unique_ranks[codes], out=row_ranks)
+
+        categories = pd.array([rule.category for rule in self._ranked_rules] + [None], dtype="string")
+        groups = pd.array([rule.group for rule in self._ranked_rules] + [None], dtype="string")
+        return pd.DataFrame({
+            "category": categories.take(row_ranks),
+            "group": groups.take(row_ranks),
+        }, index=df.index)
+
+@lru_cache(maxsize=8)
+def _compile_cached(rules: Tuple[CategoryRule, ...]) -> Classifier:
+    return Classifier(rules)
+
+def compile_rules(rules: Iterable[CategoryRule]) -> Classifier:
+    """
+    Returns the compiled Classifier of a ruleset. Compiled rulesets are cached, so classifying
+    several imports with the same rules builds the automaton once.
+    """
+    return _compile_cached(tuple(rules))
+
+def rules_from_config(categories: Dict) -> List[CategoryRule]:
+    """
+    Builds the rules from the categories configuration, as loaded by yaml_config.load_categories:
+        {group: {category: {"keywords": [...], "priority": int}}}
+    A category may also be given directly as a list of keywords.
+    """
+    rules = []
+    for group, group_categories in categories.items():
+        if not isinstance(group_categories, dict):
+            raise ValueError(f"Group category '{group}' should map category names to their keywords.")
+        for category, definition in group_categories.items():
+            if isinstance(definition, dict):
+                keywords = definition.get("keywords", [])
+                priority = definition.get("priority", 0)
+            else:
+                keywords, priority = definition, 0
+            if not isinstance(keywords, list) or not keywords:
+                raise ValueError(f"Category '{category}' of group '{group}' should have a non-empty list of keywords.")
+            if not isinstance(priority, int):
+                raise ValueError(f"Invalid priority '{priority}' for category '{category}'. It should be an integer.")
+            rules.append(CategoryRule(str(category), str(group), tuple(str(keyword) for keyword in keywords), priority))
+    return rules
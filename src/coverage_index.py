@@ -0,0 +1,127 @@
+# Index of the date ranges covered by the imported transactions, per bank.
+# Each bank keeps a sorted list of disjoint date intervals, so checking a new import for gaps
+# and overlaps is a binary search instead of a scan of the stored history. The exports carry no
+# account of their own, so the transactions of a bank are one account.
+import bisect
+import os
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from utils.json_files import load_json, save_json_atomic
+from utils.utils import to_date
+
+# A new import that starts more than this many days after the covered range (or ends more than
+# this many days before it) leaves a potential gap
+DEFAULT_MAX_GAP_DAYS = 31
+
+
+@dataclass(frozen=True)
+class CoverageWarning:
+    kind: str  # "gap" or "overlap"
+    bank: str
+    start: date
+    end: date
+
+    def __str__(self):
+        if self.kind == "gap":
+            return f"{self.bank}: no data between {self.start} and {self.end}"
+        return f"{self.bank}: new data overlaps the data imported between {self.start} and {self.end}"
+
+
+class CoverageIndex:
+
+    def __init__(self, index_path: str, max_gap_days: int = DEFAULT_MAX_GAP_DAYS):
+        if not isinstance(max_gap_days, int) or max_gap_days < 1:
+            raise ValueError(f"Invalid maximum gap '{max_gap_days}'. It should be a positive number of days.")
+        self.index_path = index_path
+        self.max_gap_days = max_gap_days
+        # Bank -> (sorted interval starts, matching interval ends), as date ordinals
+        self._intervals: Dict[str, Tuple[List[int], List[int]]] = {}
+        if os.path.exists(index_path):
+            data = load_json(index_path)
+            for key, intervals in data.items():
+                self._intervals[key] = ([date.fromisoformat(start).toordinal() for start, _ in intervals],
+                                        [date.fromisoformat(end).toordinal() for _, end in intervals])
+
+    def get_intervals(self, bank: str) -> List[Tuple[date, date]]:
+        """Returns the covered date ranges of a bank, sorted by date."""
+        starts, ends = self._intervals.get(bank, ([], []))
+        return [(date.fromordinal(start), date.fromordinal(end)) for start, end in zip(starts, ends)]
+
+    def check(self, bank: str, first_date: date, last_date: date,
+              own_range: Optional[Tuple[date, date]] = None) -> List[CoverageWarning]:
+        """
+        Checks a new import of [first_date, last_date] against the covered ranges of the bank.
+        Reports a gap if the import is more than max_gap_days away from the closest covered range
+        before or after it, and an overlap for each covered range it intersects.
+        Args:
+            bank (str): Bank name
+            first_date, last_date (date): Date range of the new import
+            own_range (tuple, optional): (first_date, last_date) already imported from the same
+                file, e.g. the head of an appended file. Overlapping it is expected, so only the
+                overlaps outside of it are reported.
+        Returns:
+            list: CoverageWarning for every gap and overlap found
+        """
+        first, last = to_date(first_date).toordinal(), to_date(last_date).toordinal()
+        if last < first:
+            raise ValueError(f"Invalid date range {first_date} - {last_date}.")
+        starts, ends = self._intervals.get(bank, ([], []))
+        if not starts:
+            return []
+
+        warnings = []
+        # Intervals [lo, hi) are the ones that intersect the new range
+        lo = bisect.bisect_left(ends, first)
+        hi = bisect.bisect_right(starts, last)
+        if lo > 0 and lo == hi and first - ends[lo - 1] > self.max_gap_days:
+            warnings.append(CoverageWarning("gap", bank, date.fromordinal(ends[lo - 1] + 1), date.fromordinal(first - 1)))
+        if hi < len(starts) and lo == hi and starts[hi] - last > self.max_gap_days:
+            warnings.append(CoverageWarning("gap", bank, date.fromordinal(last + 1), date.fromordinal(starts[hi] - 1)))
+        for i in range(lo, hi):
+            start, end = max(starts[i], first), min(ends[i], last)
+            parts = [(start, end)]
+            if own_range is not None:
+                # Only the parts of the overlap before and after the range of the file itself
+                own_first, own_last = to_date(own_range[0]).toordinal(), to_date(own_range[1]).toordinal()
+                parts = [(start, min(end, own_first - 1)), (max(start, own_last + 1), end)]
+            for part_start, part_end in parts:
+                if part_start <= part_end:
+                    warnings.append(CoverageWarning("overlap", bank, date.fromordinal(part_start), date.fromordinal(part_end)))
+        return warnings
+
+    def add(self, bank: str, first_date: date, last_date: date) -> None:
+        """
+        Adds [first_date, last_date] to the covered ranges, merging it with the ranges it
+        overlaps or touches.
+        """
+        first, last = to_date(first_date).toordinal(), to_date(last_date).toordinal()
+        if last < first:
+            raise ValueError(f"Invalid date range {first_date} - {last_date}.")
+        starts, ends = self._intervals.setdefault(bank, ([], []))
+        # Intervals [lo, hi) overlap or touch the new range
+        lo = bisect.bisect_left(ends, first - 1)
+        hi = bisect.bisect_right(starts, last + 1)
+        if lo < hi:
+            first, last = min(first, starts[lo]), max(last, ends[hi - 1])
+        starts[lo:hi] = [first]
+        ends[lo:hi] = [last]
+
+    def check_and_add(self, bank: str, first_date: Optional[str], last_date: Optional[str],
+                      own_range: Optional[Tuple[Optional[str], Optional[str]]] = None) -> List[CoverageWarning]:
+        """
+        Checks a new import and then adds it to the index. Imports without dates are ignored, and
+        so is an own_range without dates (see check).
+        """
+        if first_date is None or last_date is None:
+            return []
+        if own_range is not None and None in own_range:
+            own_range = None
+        warnings = self.check(bank, first_date, last_date, own_range)
+        self.add(bank, first_date, last_date)
+        return warnings
+
+    def save(self) -> None:
+        data = {key: [[date.fromordinal(start).isoformat(), date.fromordinal(end).isoformat()] for start, end in zip(starts, ends)]
+                for key, (starts, ends) in self._intervals.items()}
+        save_json_atomic(self.index_path, data, indent=2)
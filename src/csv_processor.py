@@ -1,57 +1,347 @@
 # Functions to process CSV files with the bank transactions
+import codecs
+import io
+import mmap
 import os
+import re
+import numpy as np
 import pandas as pd
 import banks_format as banks_format
+import parse_plan as parse_plan
+import unified_dtypes as unified_dtypes
 import unified_format as udb
-from typing import Dict, List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
+from utils import metrics, validation
 from utils.utils import log
 
+# Minimum number of data rows a bank CSV file must contain
+MIN_CSV_ROWS = 5
+# Default number of rows per chunk when streaming a CSV file
+DEFAULT_CHUNK_SIZE = 50_000
+# pandas CSV engines that can parse the bank files. The slow "python" engine is never needed,
+# since footer rows are cut off before parsing
+CSV_ENGINES = ["c", "pyarrow"]
+# Bytes sampled at the start and at the end of a file to detect its encoding
+_ENCODING_SAMPLE_SIZE = 64 * 1024
+_READ_BUFFER_SIZE = 1024 * 1024
+# Words of the preamble or footer rows that state a balance, e.g. "Kontostand vom 29.02.2024:;;;1.234,56 EUR"
+STATEMENT_BALANCE_WORDS = ("kontostand", "saldo", "balance")
+_STATEMENT_DATE_PATTERN = r"\d{4}-\d{2}-\d{2}|\d{1,2}[./-]\d{1,2}[./-]\d{2,4}"
 
-def load_csv_file(csv_path: str, bank: banks_format.Bank) -> pd.DataFrame:
+
+def load_csv_file(csv_path: str, bank: banks_format.Bank, engine: str = "c") -> pd.DataFrame:
     """
     Loads a CSV file with specified encodings.
+    The file is memory-mapped: header and footer rows are cut off at byte level and the
+    encoding is detected once on a sample, so the file is decoded a single time by the fast
+    CSV engine. Only the columns of the bank's parse plan are parsed.
     Args:
         csv_path (str): Path to the CSV file.
         bank (banks_format.Bank): Bank instance for logging purposes.
+        engine (str): pandas CSV engine, "c" or "pyarrow". The pyarrow engine does not rename
+            repeated headers, so it is only suitable for banks without them.
     Returns:
         pd.DataFrame: Loaded DataFrame from the CSV file.
     Raises:
         FileNotFoundError: If the CSV file does not exist
-        ValueError: If the CSV file cannot be decoded with the specified encoding
+        ValueError: If the CSV file cannot be decoded with any of the bank encodings
+    """
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Invalid CSV engine '{engine}'. Available options: {CSV_ENGINES}")
+    with _CsvSource(csv_path, bank) as source:
+        df = None
+        for encoding in source.encodings:
+            try:
+                headers = source.headers(encoding)
+                df = pd.read_csv(source.open(), encoding=encoding, engine=engine, **source.plan.read_csv_kwargs(headers))
+                break
+            except UnicodeDecodeError:
+                log.warning(f"CSV at {csv_path} is not valid '{encoding}' beyond the sampled bytes, trying the next encoding.")
+        if df is None:
+            log.error(f"Failed to load CSV at {csv_path} with delimiter '{bank.csv_delimiter}' and encodings {source.encodings}.")
+            raise ValueError(f"Could not decode CSV file: {csv_path}")
+
+    log.info(f"Loaded CSV file for {bank} at {csv_path}")
+    source.log_trimmed_rows()
+
+    _print_csv_info(df, bank.name)
+    with metrics.stage(bank.name, "validate"):
+        _validate_csv_headers(df, bank, headers=headers)
+      
+    return df
+
+def iter_csv_chunks(csv_path: str, bank: banks_format.Bank, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Streams a CSV file in chunks of at most `chunksize` rows, so memory use stays bounded
+    no matter how big the file is.
+    Headers are validated on the first chunk, while the row count check and the CSV
+    information use running counters over all chunks.
+    Args:
+        csv_path (str): Path to the CSV file.
+        bank (banks_format.Bank): Bank instance with the CSV configuration.
+        chunksize (int): Maximum number of rows per chunk.
+    Yields:
+        pd.DataFrame: Consecutive chunks of the CSV file.
+    Raises:
+        FileNotFoundError: If the CSV file does not exist
+        ValueError: If the CSV file cannot be decoded or has too few rows
+    """
+    if not isinstance(chunksize, int) or chunksize <= 0:
+        raise ValueError(f"Invalid chunk size '{chunksize}'. It should be a positive integer.")
+
+    # Chunks are held back only until the minimum number of rows has been seen
+    pending = []
+    first_chunk = None
+    row_count = 0
+    with _CsvSource(csv_path, bank) as source:
+        # Chunks already yielded cannot be decoded again, so only the sampled encoding is used
+        encoding = source.encodings[0]
+        try:
+            headers = source.headers(encoding)
+            with pd.read_csv(source.open(), encoding=encoding, chunksize=chunksize, **source.plan.read_csv_kwargs(headers)) as reader:
+                for chunk in reader:
+                    row_count += len(chunk)
+                    if first_chunk is None:
+                        pending.append(chunk)
+                        if row_count < MIN_CSV_ROWS:
+                            continue
+                        first_chunk = pending[0]
+                        log.info(f"Streaming CSV file for {bank} at {csv_path} in chunks of {chunksize} rows")
+                        source.log_trimmed_rows()
+                        with metrics.stage(bank.name, "validate"):
+                            _validate_csv_headers(first_chunk, bank, row_count=row_count, headers=headers)
+                        yield from pending
+                        pending = []
+                        continue
+                    yield chunk
+        except UnicodeDecodeError:
+            log.error(f"Failed to load CSV at {csv_path} with delimiter '{bank.csv_delimiter}' and encoding '{encoding}'.")
+            raise ValueError(f"Could not decode CSV file: {csv_path}")
+
+    if first_chunk is None:
+        # The file ended before reaching the minimum number of rows
+        _validate_csv_headers(pending[0] if pending else pd.DataFrame(), bank, row_count=row_count, headers=headers)
+
+    _print_csv_info(first_chunk, bank.name, row_count=row_count)
+
+class _CsvSource:
+    """
+    Memory-mapped CSV file of a bank.
+    On opening, the byte range of the table is found (without the preamble and footer rows of
+    the bank's parse plan) and the encodings to try are ordered: the first one that
+    decodes a sample of the start and the end of the table, then the remaining ones.
+    """
+
+    def __init__(self, csv_path: str, bank: banks_format.Bank):
+        self.csv_path = csv_path
+        self.bank = bank
+        self.plan = parse_plan.get_parse_plan(bank)
+        self._file = None
+        self._mapped = None
+        self.start = 0
+        self.end = 0
+        self.encodings: List[str] = []
+
+    def __enter__(self) -> "_CsvSource":
+        if not os.path.exists(self.csv_path):
+            log.error(f"CSV file not found: {self.csv_path}")
+            raise FileNotFoundError(f"CSV file not found: {self.csv_path}")
+        if os.path.getsize(self.csv_path) == 0:
+            raise ValueError(f"CSV file is empty: {self.csv_path}")
+        self._file = open(self.csv_path, "rb")
+        self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.start = _skip_lines(self._mapped, 0, self.plan.header_rows)
+        self.end = _trim_lines(self._mapped, self.start, len(self._mapped), self.plan.footer_rows)
+        self.encodings = self._order_encodings()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._mapped.close()
+        self._file.close()
+
+    def open(self) -> io.BufferedReader:
+        """Returns a new binary file object over the table bytes."""
+        return io.BufferedReader(_MappedRangeReader(self._mapped, self.start, self.end), buffer_size=_READ_BUFFER_SIZE)
+
+    def headers(self, encoding: str) -> List[str]:
+        """Returns every header of the table, named as pd.read_csv names them."""
+        return list(pd.read_csv(self.open(), delimiter=self.plan.delimiter, encoding=encoding, nrows=0).columns)
+
+    def statement_lines(self) -> Tuple[List[str], List[str]]:
+        """Returns the non-empty preamble lines and footer lines cut off the table, decoded."""
+        def decode(data: bytes) -> List[str]:
+            return [line for line in data.decode(self.encodings[0], errors="replace").splitlines() if line.strip()]
+        return decode(self._mapped[:self.start]), decode(self._mapped[self.end:])
+
+    def log_trimmed_rows(self) -> None:
+        if self.plan.header_rows > 0:
+            log.info(f"Skipped {self.plan.header_rows} header rows")
+        if self.plan.footer_rows > 0:
+            log.info(f"Skipped {self.plan.footer_rows} footer rows")
+
+    def _order_encodings(self) -> List[str]:
+        candidates = [self.bank.csv_encoding] + [encoding for encoding in self.bank.get_encodings_options()
+                                                 if encoding != self.bank.csv_encoding]
+        head = self._mapped[self.start:min(self.end, self.start + _ENCODING_SAMPLE_SIZE)]
+        tail_start = max(self.start, self.end - _ENCODING_SAMPLE_SIZE)
+        tail = b""
+        if tail_start > self.start + len(head):
+            # Start the tail sample on a new line, never in the middle of a character
+            newline = self._mapped.find(b"\n", tail_start, self.end)
+            tail = self._mapped[newline + 1:self.end] if newline >= 0 else b""
+        for i, encoding in enumerate(candidates):
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+                tail.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+            if encoding != self.bank.csv_encoding:
+                log.warning(f"CSV at {self.csv_path} is not '{self.bank.csv_encoding}' encoded, using '{encoding}' instead.")
+            return [encoding] + candidates[:i] + candidates[i + 1:]
+        return candidates
+
+class _MappedRangeReader(io.RawIOBase):
+    """
+    Read-only raw file object over the byte range [start, end) of a memory-mapped file.
+    """
+
+    def __init__(self, mapped: mmap.mmap, start: int, end: int):
+        self._mapped = mapped
+        self._position = start
+        self._end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._end - self._position)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._mapped[self._position:self._position + size]
+        self._position += size
+        return size
+
+def _skip_lines(mapped: mmap.mmap, start: int, count: int) -> int:
+    """Returns the offset after the first `count` lines from `start`."""
+    for _ in range(count):
+        newline = mapped.find(b"\n", start)
+        if newline < 0:
+            return len(mapped)
+        start = newline + 1
+    return start
+
+def _trim_lines(mapped: mmap.mmap, start: int, end: int, count: int) -> int:
+    """Returns the end offset without the last `count` non-empty lines before `end`."""
+    for _ in range(count):
+        # Ignore trailing line breaks and whitespace
+        while end > start and mapped[end - 1:end] in (b"\n", b"\r", b" ", b"\t"):
+            end -= 1
+        newline = mapped.rfind(b"\n", start, end)
+        end = newline + 1 if newline >= 0 else start
+    return end
+
+def load_csv_tail(csv_path: str, bank: banks_format.Bank, offset: int, previous_row_count: int = 0) -> pd.DataFrame:
+    """
+    Loads only the rows after byte `offset` of a CSV file that grew since its last import.
+    The header rows are read from the start of the file and parsed together with the new tail.
+    Args:
+        csv_path (str): Path to the CSV file.
+        bank (banks_format.Bank): Bank instance with the CSV configuration.
+        offset (int): Byte offset where the new rows start. It must be at the start of a line.
+        previous_row_count (int): Rows already imported, for the minimum row check.
+    Returns:
+        pd.DataFrame: The new rows, with the CSV headers.
+    Raises:
+        FileNotFoundError: If the CSV file does not exist
+        ValueError: If the offset is inside the header rows or the tail cannot be decoded
     """
-    # Check if file exists
     if not os.path.exists(csv_path):
         log.error(f"CSV file not found: {csv_path}")
         raise FileNotFoundError(f"CSV file not found: {csv_path}")
+    plan = parse_plan.get_parse_plan(bank)
+    with open(csv_path, "rb") as f:
+        head = b"".join(f.readline() for _ in range(plan.header_rows + 1))
+        if offset < len(head):
+            raise ValueError(f"Offset {offset} is inside the header rows of {csv_path}")
+        f.seek(offset)
+        tail = f.read()
     try:
-        df = pd.read_csv(
-            csv_path, 
-            delimiter=bank.csv_delimiter, 
-            encoding=bank.csv_encoding,
-            skiprows=bank.csv_header_row
-        )
+        headers = list(pd.read_csv(io.BytesIO(head), delimiter=plan.delimiter, encoding=bank.csv_encoding,
+                                   skiprows=plan.header_rows, nrows=0).columns)
+        df = pd.read_csv(io.BytesIO(head + tail), encoding=bank.csv_encoding, skiprows=plan.header_rows, **plan.read_csv_kwargs(headers))
     except UnicodeDecodeError:
         log.error(f"Failed to load CSV at {csv_path} with delimiter '{bank.csv_delimiter}' and encoding '{bank.csv_encoding}'.")
         raise ValueError(f"Could not decode CSV file: {csv_path}")
-      
-    log.info(f"Loaded CSV file for {bank} at {csv_path}")
-    if bank.csv_header_row > 0:
-        log.info(f"Skipped {bank.csv_header_row} header rows")
-      
-    _print_csv_info(df, bank.name)
-    _validate_csv_headers(df, bank)  
-      
+
+    log.info(f"Loaded {len(df)} new rows of the CSV file for {bank} at {csv_path} (from byte {offset})")
+    with metrics.stage(bank.name, "validate"):
+        _validate_csv_headers(df, bank, row_count=previous_row_count + len(df), headers=headers)
     return df
 
-def _print_csv_info(df: pd.DataFrame, bank_name: str) -> None:
+def read_statement_balances(csv_path: str, bank: banks_format.Bank) -> Tuple[List[Tuple[pd.Timestamp, int]], List[Tuple[pd.Timestamp, int]]]:
+    """
+    Reads the balances stated in the preamble and footer rows of a bank CSV file, such as the
+    opening "Kontostand vom 29.02.2024:;;;1.234,56 EUR" and the closing "Kontostand;31.03.2024;;;1.000,00;EUR"
+    of Deutsche Bank.
+    Args:
+        csv_path (str): Path to the CSV file.
+        bank (banks_format.Bank): Bank instance with the CSV configuration.
+    Returns:
+        tuple: (date, balance in cents) of each balance row of the preamble, which are balances
+        before the first transaction, and of the footer, which are balances at the end of their date
+    """
+    if bank.csv_header_row == 0 and bank.csv_last_row == 0:
+        return [], []
+    with _CsvSource(csv_path, bank) as source:
+        preamble, footer = source.statement_lines()
+    return _parse_statement_balances(preamble, bank), _parse_statement_balances(footer, bank)
+
+def _parse_statement_balances(lines: List[str], bank: banks_format.Bank) -> List[Tuple[pd.Timestamp, int]]:
+    balances = []
+    for line in lines:
+        if not any(word in line.lower() for word in STATEMENT_BALANCE_WORDS):
+            continue
+        date_match = re.search(_STATEMENT_DATE_PATTERN, line)
+        if date_match is None:
+            continue
+        # The amount is the last field with digits that is not a date
+        fields = [field.strip() for field in line.split(bank.csv_delimiter)]
+        amounts = [field for field in fields if re.search(r"\d", field) and not re.search(_STATEMENT_DATE_PATTERN, field)]
+        if not amounts:
+            continue
+        balance = parse_amounts(pd.Series(amounts[-1:]), bank.csv_decimal).iloc[0]
+        date = parse_dates(pd.Series([date_match.group()]), bank.csv_date_format).iloc[0]
+        if pd.isna(balance) or pd.isna(date):
+            continue
+        balances.append((date, int(balance)))
+    return balances
+
+def _print_csv_info(df: pd.DataFrame, bank_name: str, row_count: Optional[int] = None,
+                    unified_df: Optional[pd.DataFrame] = None) -> None:
     """
     Displays general information about the DataFrame, such as number of columns and rows.
+    When streaming, `df` is the first chunk and `row_count` the total number of rows read.
+    With `unified_df`, the unified DataFrame converted from `df`, only the memory used before
+    and after the conversion is displayed.
     """
+    loaded = unified_dtypes.memory_usage(df)
+    if unified_df is not None:
+        unified = unified_dtypes.memory_usage(unified_df)
+        log.info(f"{bank_name} memory of {len(df)} rows: {_format_bytes(loaded)} loaded, {_format_bytes(unified)} unified "
+                 f"({loaded / max(unified, 1):.1f}x smaller)")
+        return
+    if row_count is None:
+        row_count = df.shape[0]
     log.info(f"{bank_name} CSV Information:")
-    log.info("\t" + f"Columns x rows: {df.shape[1]} x {df.shape[0]}")
+    log.info("\t" + f"Columns x rows: {df.shape[1]} x {row_count}")
     log.info("\t" + f"Column names: {list(df.columns)}")
+    log.info("\t" + f"Memory{' of the first chunk' if row_count != df.shape[0] else ''}: {_format_bytes(loaded)}")
+
+def _format_bytes(size: int) -> str:
+    return f"{size / 1024 ** 2:.1f} MB" if size >= 1024 ** 2 else f"{size / 1024:.1f} KB"
 
-def _validate_csv_headers(df: pd.DataFrame, bank: banks_format.Bank) -> List[str]:
+def _validate_csv_headers(df: pd.DataFrame, bank: banks_format.Bank, row_count: Optional[int] = None,
+                          headers: Optional[List[str]] = None) -> List[str]:
     """
     Compares the DataFrame column headers, imported from the CSV file, with bank's header_map.
     Returns a tuple of two lists:
@@ -61,18 +351,24 @@ def _validate_csv_headers(df: pd.DataFrame, bank: banks_format.Bank) -> List[str
     Args:
         df (pd.DataFrame): DataFrame containing the CSV data
         bank (Bank): Bank instance containing the header_map
+        row_count (int, optional): Total number of rows when `df` is only the first chunk of the file
+        headers (list, optional): Every header of the CSV file, when `df` has only the columns
+            of the bank's parse plan
     """
     
     # Check minimum rows
-    if len(df) < 5:
-        raise ValueError(f"CSV file has only {len(df)} rows. Minimum required: 5 rows")
+    if row_count is None:
+        row_count = len(df)
+    if row_count < MIN_CSV_ROWS:
+        raise ValueError(f"CSV file has only {row_count} rows. Minimum required: {MIN_CSV_ROWS} rows")
     
-    csv_headers = set(header.strip().lower() for header in df.columns)
-    map_headers = set(header.strip().lower() for header in bank.header_map.keys())
+    if headers is None:
+        headers = list(df.columns)
+    map_headers = set(parse_plan.normalize_header(header) for header in bank.header_map.keys())
     
     # Find headers that exist in CSV but not in header_map
-    unmatched_csv = [header for header in df.columns 
-                     if header.strip().lower() not in map_headers]
+    unmatched_csv = [header for header in headers 
+                     if parse_plan.normalize_header(header) not in map_headers]
 
     # Log results
     if unmatched_csv:
@@ -82,5 +378,126 @@ def _validate_csv_headers(df: pd.DataFrame, bank: banks_format.Bank) -> List[str
         
     return unmatched_csv
 
+def create_unified_dataframe(df: pd.DataFrame, bank: banks_format.Bank) -> pd.DataFrame:
+    """
+    Converts a DataFrame imported from a bank CSV file (BD1) into the unified format (BD2).
+    The bank's header_map decides which CSV columns feed each unified column. When several
+    CSV columns map to the same unified column they are merged: text is joined, while dates
+    and amounts take the first non-empty value.
+    All conversions work on whole columns, so no Python code runs per row. Dates, amounts and
+    texts repeat a lot in bank exports, so each column is converted once per distinct value.
+    Args:
+        df (pd.DataFrame): DataFrame loaded from the bank CSV file
+        bank (banks_format.Bank): Bank instance containing the header_map
+    Returns:
+        pd.DataFrame: DataFrame with one column per unified header. Dates are datetime64,
+        amounts are integer cents and texts have the compact types of unified_dtypes.
+    Raises:
+        ValueError: If a mandatory unified column has no source column in the DataFrame
+    """
+    plan = parse_plan.get_parse_plan(bank)
+    sources = plan.sources(df.columns)
+
+    unified = {}
+    for name, entry in udb.UnifiedHeaders.get_all_columns().items():
+        if entry == udb.UnifiedHeaders.unused:
+            continue
+        if entry == udb.UnifiedHeaders.bank:
+            # Every row has the same bank: a single category
+            unified[name] = pd.Series(pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8),
+                                                                pd.Index([bank.name], dtype=unified_dtypes.STRING_DTYPE)), index=df.index)
+            continue
+        columns = sources.get(entry, [])
+        if not columns:
+            if entry.mandatory:
+                raise ValueError(f"No CSV column found for mandatory column '{name}' of bank '{bank.name}'.")
+            unified[name] = pd.Series(_EMPTY_VALUES[entry.parameter_type], index=df.index,
+                                      dtype=_UNIFIED_DTYPES[entry.parameter_type])
+            continue
+        converter = plan.converters[entry]
+        merged = _convert_distinct(df[columns[0]], converter)
+        for column in columns[1:]:
+            merged = _merge_columns(merged, _convert_distinct(df[column], converter), entry.parameter_type)
+        unified[name] = merged
+
+    unified_df = unified_dtypes.compact(pd.DataFrame(unified, index=df.index))
+    _print_csv_info(df, bank.name, unified_df=unified_df)
+    return unified_df
+
+def _convert_distinct(series: pd.Series, converter) -> pd.Series:
+    """
+    Applies `converter` to the distinct values of a column only and broadcasts the result
+    back to every row. Missing values stay missing.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    converted = converter(pd.Series(uniques))
+    values = pd.api.extensions.take(converted.array, codes, allow_fill=True)
+    return pd.Series(values, index=series.index, name=series.name)
+
+def parse_dates(series: pd.Series, date_format: Optional[str] = None) -> pd.Series:
+    """
+    Parses a column of dates with a strptime format, usually the bank's csv_date_format. Without
+    a format, the first of Bank.DATE_FORMATS that parses most of a sample of the column is used.
+    Values that do not match the format become NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    values = series.astype("string").str.strip()
+    date_format = date_format or validation.detect_date_format(values)
+    return pd.to_datetime(values, format=date_format, errors="coerce")
+
+def parse_amounts(series: pd.Series, decimal: str = ".") -> pd.Series:
+    """
+    Parses a column of amounts into integer cents, using the bank's decimal separator.
+    Thousands separators, spaces and currency symbols are removed. Invalid values become <NA>.
+    Numeric columns are only taken as they are for banks with "." decimals, the only ones the
+    CSV engine parses right.
+    """
+    if pd.api.types.is_numeric_dtype(series) and decimal == ".":
+        values = series.astype("float64")
+    else:
+        text = series.astype("string").str.replace(r"[\s€]|EUR", "", regex=True)
+        thousands = "." if decimal == "," else ","
+        text = text.str.replace(thousands, "", regex=False)
+        if decimal != ".":
+            text = text.str.replace(decimal, ".", regex=False)
+        values = pd.to_numeric(text, errors="coerce")
+    return (values * 100).round().astype("Int64")
+
+def parse_text(series: pd.Series) -> pd.Series:
+    """
+    Strips a column of text. Empty values become <NA>.
+    """
+    text = series.astype("string").str.strip()
+    return text.mask(text == "")
+
+def parse_booleans(series: pd.Series) -> pd.Series:
+    """
+    Parses a column of yes/no values. Unknown values become <NA>.
+    """
+    text = series.astype("string").str.strip().str.lower()
+    return text.map(validation.BOOLEAN_VALUES, na_action="ignore").astype("boolean")
+
+def _merge_columns(first: pd.Series, second: pd.Series, parameter_type: udb.ParameterType) -> pd.Series:
+    """
+    Merges two converted columns that map to the same unified column.
+    Text is joined with a space; any other type keeps the first non-empty value.
+    """
+    if parameter_type == udb.ParameterType.TEXT:
+        joined = first + " " + second
+        return joined.fillna(first).fillna(second)
+    return first.fillna(second)
 
+_UNIFIED_DTYPES = {
+    udb.ParameterType.DATE: "datetime64[ns]",
+    udb.ParameterType.CURRENCY: "Int64",
+    udb.ParameterType.TEXT: "string",
+    udb.ParameterType.BOOLEAN: "boolean",
+}
 
+_EMPTY_VALUES = {
+    udb.ParameterType.DATE: pd.NaT,
+    udb.ParameterType.CURRENCY: pd.NA,
+    udb.ParameterType.TEXT: pd.NA,
+    udb.ParameterType.BOOLEAN: pd.NA,
+}
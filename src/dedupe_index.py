@@ -0,0 +1,299 @@
+# Persistent index of transaction fingerprints, used to detect entries that are already in BD2.
+# A fingerprint is a 64-bit hash of the normalized (bank, date, amount, description, iban) key.
+# The index counts occurrences per fingerprint, so true repeats (identical transactions on the
+# same day) are kept while overlapping re-imports are skipped.
+import os
+import math
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from utils.utils import log
+
+KEY_COLUMNS = ["bank", "date", "amount", "description", "iban"]
+
+# Record layout of the append-only fingerprint file
+_RECORD_DTYPE = np.dtype([("fingerprint", "<u8"), ("count", "<u4")])
+# Header of the Bloom filter file: number of bits, number of hash functions, number of items
+_BLOOM_HEADER_DTYPE = np.dtype([("num_bits", "<u8"), ("num_hashes", "<u8"), ("num_items", "<u8")])
+
+
+def compute_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """
+    Computes the fingerprint of every row of a unified DataFrame.
+    Text is compared case-insensitively with collapsed whitespace, and IBANs without spaces.
+    Args:
+        df (pd.DataFrame): Unified DataFrame with the KEY_COLUMNS
+    Returns:
+        np.ndarray: uint64 fingerprint per row
+    Raises:
+        ValueError: If a key column is missing
+    """
+    missing = [column for column in KEY_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Cannot compute fingerprints without the columns {missing}.")
+
+    bank = _hash_text(df["bank"])
+    date = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+    amount = pd.array(df["amount"], dtype="Int64").fillna(np.iinfo(np.int64).min).to_numpy(dtype=np.int64)
+    description = _hash_text(df["description"])
+    iban = _hash_text(df["iban"], remove_spaces=True)
+    key = pd.DataFrame({"bank": bank, "date": date, "amount": amount, "description": description, "iban": iban})
+    return pd.util.hash_pandas_object(key, index=False).to_numpy(dtype=np.uint64)
+
+def _hash_text(series: pd.Series, remove_spaces: bool = False) -> np.ndarray:
+    """
+    Hashes a normalized text column. Only the distinct values are normalized and hashed.
+    Missing values hash like the empty string.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    text = pd.Series(uniques, dtype=object).astype("string").str.lower()
+    text = text.str.replace(r"\s+", "" if remove_spaces else " ", regex=True).str.strip()
+    hashes = pd.util.hash_array(np.append(text.fillna("").to_numpy(dtype=object), ""))
+    # Code -1 (missing value) picks the hash of the trailing empty string
+    return hashes[codes]
+
+
+class BloomFilter:
+    """
+    Bloom filter over uint64 fingerprints. Membership checks are vectorized with numpy.
+    A negative answer is always right; a positive answer is wrong with about `false_positive_rate`.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, false_positive_rate: float = 0.01):
+        if capacity <= 0 or not 0 < false_positive_rate < 1:
+            raise ValueError(f"Invalid Bloom filter capacity '{capacity}' or false positive rate '{false_positive_rate}'.")
+        num_bits = int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.num_bits = max(8, num_bits)
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.num_items = 0
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, fingerprints: np.ndarray) -> np.ndarray:
+        # Double hashing: position_i = h1 + i * h2, with h1 and h2 the two halves of the fingerprint
+        fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+        h1 = fingerprints & np.uint64(0xFFFFFFFF)
+        h2 = (fingerprints >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def add(self, fingerprints: np.ndarray) -> None:
+        positions = self._positions(fingerprints).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), (1 << (positions & np.uint64(7))).astype(np.uint8))
+        self.num_items += len(fingerprints)
+
+    def contains(self, fingerprints: np.ndarray) -> np.ndarray:
+        positions = self._positions(fingerprints)
+        is_set = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return is_set.all(axis=1)
+
+    def estimated_false_positive_rate(self) -> float:
+        """Returns the false positive rate expected with the number of fingerprints added so far."""
+        return (1 - math.exp(-self.num_hashes * self.num_items / self.num_bits)) ** self.num_hashes
+
+    def save(self, path: str) -> None:
+        header = np.array([(self.num_bits, self.num_hashes, self.num_items)], dtype=_BLOOM_HEADER_DTYPE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(self.bits.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        with open(path, "rb") as f:
+            header = np.frombuffer(f.read(_BLOOM_HEADER_DTYPE.itemsize), dtype=_BLOOM_HEADER_DTYPE)[0]
+            bits = np.frombuffer(f.read(), dtype=np.uint8).copy()
+        bloom = cls.__new__(cls)
+        bloom.num_bits = int(header["num_bits"])
+        bloom.num_hashes = int(header["num_hashes"])
+        bloom.num_items = int(header["num_items"])
+        bloom.bits = bits
+        return bloom
+
+
+class FingerprintIndex:
+    """
+    Persistent fingerprint -> occurrence count index.
+    Stored as an append-only file of (fingerprint, count) records, where the last record of a
+    fingerprint wins, plus an optional Bloom filter. With the Bloom filter the records are only
+    loaded once an import contains a fingerprint that may already be known, so importing rows
+    that are all new never reads the history.
+    """
+    INDEX_EXTENSION = ".idx"
+    BLOOM_EXTENSION = ".bloom"
+
+    def __init__(self, path: str, use_bloom: bool = True, bloom_capacity: int = 1_000_000, false_positive_rate: float = 0.01):
+        """
+        Args:
+            path (str): Path of the index files, without extension
+            use_bloom (bool): Use a Bloom filter to avoid loading the records
+            bloom_capacity (int): Expected number of distinct fingerprints
+            false_positive_rate (float): Target false positive rate of the Bloom filter
+        """
+        self.path = path
+        self.use_bloom = use_bloom
+        self.false_positive_rate = false_positive_rate
+        self._counts: Optional[Dict[int, int]] = None
+        self._pending: Dict[int, int] = {}
+        self._import_counts: Dict[int, int] = {}
+        self._import_baseline: Dict[int, int] = {}
+        self._import_continues = False
+        self._bloom: Optional[BloomFilter] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        if use_bloom:
+            bloom_path = path + self.BLOOM_EXTENSION
+            if os.path.exists(bloom_path):
+                self._bloom = BloomFilter.load(bloom_path)
+            elif os.path.exists(path + self.INDEX_EXTENSION):
+                # Records without a Bloom filter: build it from the records
+                self._bloom = BloomFilter(max(bloom_capacity, 2 * len(self._load_counts())), false_positive_rate)
+                self._bloom.add(np.fromiter(self._counts.keys(), dtype=np.uint64, count=len(self._counts)))
+            else:
+                self._bloom = BloomFilter(bloom_capacity, false_positive_rate)
+        else:
+            self._load_counts()
+
+    def __len__(self):
+        return len(self._load_counts())
+
+    def start_import(self, continues: bool = False) -> None:
+        """
+        Starts a new import. Occurrences are counted per import, so repeats of a transaction
+        within one export are only skipped if the index already holds as many of them.
+        Args:
+            continues (bool): The import is the appended tail of a file whose previous rows are
+                already in the index. Its occurrences are counted on top of the stored ones, so a
+                repeat of a transaction imported from the start of the file is new.
+        """
+        self._import_counts = {}
+        self._import_baseline = {}
+        self._import_continues = continues
+
+    def filter_new(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Returns a boolean mask of the rows that are not in the index yet, and records them.
+        Can be called once per chunk of the same import.
+        Args:
+            df (pd.DataFrame): Unified DataFrame with the KEY_COLUMNS
+        Returns:
+            np.ndarray: True for the rows that are new
+        """
+        fingerprints = compute_fingerprints(df)
+        if len(fingerprints) == 0:
+            return np.zeros(0, dtype=bool)
+
+        # Distinct fingerprints of the chunk, and the occurrence number of each row among the
+        # rows with the same fingerprint
+        codes, keys = pd.factorize(fingerprints)
+        keys = keys.astype(np.uint64)
+        counts = np.bincount(codes, minlength=len(keys))
+        occurrence = pd.Series(codes).groupby(codes, sort=False).cumcount().to_numpy()
+        key_list = keys.tolist()
+
+        # Rows of this import with the same fingerprint seen in previous chunks
+        if self._import_counts:
+            offset = np.fromiter((self._import_counts.get(key, 0) for key in key_list), dtype=np.int64, count=len(key_list))
+        else:
+            offset = np.zeros(len(key_list), dtype=np.int64)
+
+        # Count of each fingerprint in the index before this import started. Only non-zero
+        # baselines are kept for the rest of the import
+        unseen = offset == 0
+        baseline = np.zeros(len(key_list), dtype=np.int64)
+        if self._import_baseline and not unseen.all():
+            baseline[~unseen] = [self._import_baseline.get(key, 0) for key in keys[~unseen].tolist()]
+        lookup = unseen.copy()
+        if self._bloom is not None:
+            lookup &= self._bloom.contains(keys)
+        if lookup.any():
+            stored = self._load_counts()
+            baseline[lookup] = [stored.get(key, 0) for key in keys[lookup].tolist()]
+            known = lookup & (baseline > 0)
+            self._import_baseline.update(zip(keys[known].tolist(), baseline[known].tolist()))
+        if self._import_continues:
+            # The rows of the tail follow the stored occurrences
+            offset[unseen] = baseline[unseen]
+
+        totals = offset + counts
+        self._import_counts.update(zip(key_list, totals.tolist()))
+        grown = totals > baseline
+        self._set_counts(keys[grown].tolist(), totals[grown].tolist())
+
+        new_mask = occurrence + offset[codes] >= baseline[codes]
+        if self._bloom is not None:
+            # Only fingerprints that were neither in the index nor in an earlier chunk are new to
+            # the filter, so num_items counts distinct fingerprints
+            self._bloom.add(keys[grown & unseen & (baseline == 0)])
+        return new_mask
+
+    def save(self) -> None:
+        """
+        Appends the changed counts to the record file and writes the Bloom filter.
+        """
+        if self._pending:
+            records = np.array(list(self._pending.items()), dtype=_RECORD_DTYPE)
+            with open(self.path + self.INDEX_EXTENSION, "ab") as f:
+                f.write(records.tobytes())
+            self._pending = {}
+        if self._bloom is not None:
+            self._bloom.save(self.path + self.BLOOM_EXTENSION)
+
+    def compact_if_needed(self) -> bool:
+        """
+        Compacts the index once the Bloom filter holds more fingerprints than it was sized for, so
+        it would let more and more imports load the records, or once the loaded record file holds
+        more superseded records than current ones.
+        Returns:
+            bool: True if the index was compacted
+        """
+        # The record file is only measured if it was loaded, which the import needed anyway
+        record_count = self._record_count() if self._counts is not None else 0
+        if self._bloom is not None and self._bloom.estimated_false_positive_rate() > self.false_positive_rate:
+            reason = f"the Bloom filter holds {self._bloom.num_items} fingerprints"
+        elif record_count > 2 * len(self._counts or {}):
+            reason = f"{record_count} records hold {len(self._counts)} fingerprints"
+        else:
+            return False
+        log.info(f"Compacting {self.path}: {reason}")
+        self.compact()
+        return True
+
+    def compact(self) -> None:
+        """
+        Rewrites the record file with a single record per fingerprint and, if used, rebuilds
+        the Bloom filter with room for twice the current number of fingerprints.
+        """
+        counts = self._load_counts()
+        if self._bloom is not None:
+            self._bloom = BloomFilter(max(1, 2 * len(counts)), self.false_positive_rate)
+            self._bloom.add(np.fromiter(counts.keys(), dtype=np.uint64, count=len(counts)))
+            self._bloom.save(self.path + self.BLOOM_EXTENSION)
+        records = np.array(list(counts.items()), dtype=_RECORD_DTYPE)
+        tmp_path = self.path + self.INDEX_EXTENSION + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(records.tobytes())
+        os.replace(tmp_path, self.path + self.INDEX_EXTENSION)
+        self._pending = {}
+
+    def _set_counts(self, fingerprints: List[int], counts: List[int]) -> None:
+        if self._counts is not None:
+            self._counts.update(zip(fingerprints, counts))
+        self._pending.update(zip(fingerprints, counts))
+
+    def _record_count(self) -> int:
+        index_path = self.path + self.INDEX_EXTENSION
+        return os.path.getsize(index_path) // _RECORD_DTYPE.itemsize if os.path.exists(index_path) else 0
+
+    def _load_counts(self) -> Dict[int, int]:
+        if self._counts is None:
+            index_path = self.path + self.INDEX_EXTENSION
+            counts = {}
+            if os.path.exists(index_path):
+                records = np.fromfile(index_path, dtype=_RECORD_DTYPE)
+                counts = dict(zip(records["fingerprint"].tolist(), records["count"].tolist()))
+                log.info(f"Loaded {len(counts)} fingerprints from {index_path}")
+            # Counts changed before the records were loaded are more recent
+            counts.update(self._pending)
+            self._counts = counts
+        return self._counts
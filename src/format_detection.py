@@ -0,0 +1,168 @@
+# Automatic detection of the BD1 format of a bank CSV file.
+# Only the first few KB of a file are read: the encoding, delimiter and header row are worked out
+# from that sample, and the header line is matched against the header_map of every Bank subclass.
+import codecs
+import csv
+import os
+import glob
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+import banks_format as banks_format
+from parse_plan import normalize_header
+from utils.utils import log
+
+# Number of bytes read from the start of a file
+SAMPLE_SIZE = 8192
+# Maximum number of preamble rows before the header line
+MAX_HEADER_ROW = 20
+# Minimum share of a bank's headers that must be found in the header line
+MIN_SCORE = 0.6
+
+
+@dataclass(frozen=True)
+class DetectedFormat:
+    bank_name: Optional[str]
+    encoding: str
+    delimiter: str
+    header_row: int
+    score: float
+
+    def matches(self, bank: banks_format.Bank) -> bool:
+        """Returns True if the detected format is the configured format of `bank`."""
+        return (self.bank_name == bank.name
+                and self.encoding == bank.csv_encoding
+                and self.delimiter == bank.csv_delimiter
+                and self.header_row == bank.csv_header_row)
+
+
+def detect_bank_format(csv_path: str, sample_size: int = SAMPLE_SIZE) -> DetectedFormat:
+    """
+    Detects the bank, encoding, delimiter and header row of a CSV file from its first bytes.
+    Args:
+        csv_path (str): Path to the CSV file.
+        sample_size (int): Number of bytes to read.
+    Returns:
+        DetectedFormat: Detected format. bank_name is None if no bank matches the header line.
+    Raises:
+        FileNotFoundError: If the CSV file does not exist
+        ValueError: If the sample cannot be decoded with any of Bank.CSV_ENCODINGS
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"CSV file not found: {csv_path}")
+    with open(csv_path, "rb") as f:
+        sample = f.read(sample_size)
+
+    encoding, text = _detect_encoding(sample)
+    if encoding is None:
+        raise ValueError(f"Could not decode CSV file {csv_path} with any of {banks_format.Bank.get_encodings_options()}")
+
+    lines = text.splitlines()[:MAX_HEADER_ROW + 1]
+    # Drop the last line if the sample cut it
+    if len(sample) == sample_size and len(lines) > 1:
+        lines = lines[:-1]
+
+    best = None
+    for header_row, line in enumerate(lines):
+        for delimiter in banks_format.Bank.get_delimiters_options():
+            bank_name, score = _match_header_line(line, delimiter)
+            if best is None or score > best.score:
+                best = DetectedFormat(bank_name, encoding, delimiter, header_row, score)
+
+    if best is None or best.score < MIN_SCORE:
+        delimiter, header_row = _guess_layout(lines)
+        return DetectedFormat(None, encoding, delimiter, header_row, best.score if best else 0.0)
+    return best
+
+def detect_directory(directory: str, pattern: str = "**/*.csv", sample_size: int = SAMPLE_SIZE) -> Dict[str, DetectedFormat]:
+    """
+    Detects the format of every CSV file in a directory, reading only a sample of each file.
+    Files that cannot be decoded are logged and left out.
+    Returns:
+        dict: Dictionary mapping file paths to their DetectedFormat
+    """
+    results = {}
+    for csv_path in sorted(glob.glob(os.path.join(directory, pattern), recursive=True)):
+        try:
+            results[csv_path] = detect_bank_format(csv_path, sample_size)
+        except ValueError as e:
+            log.warning(f"Could not detect the format of {csv_path}: {str(e)}")
+    return results
+
+@lru_cache(maxsize=None)
+def get_signature_index() -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
+    """
+    Builds, once, the header signatures of every Bank subclass.
+    Returns:
+        tuple: (bank name -> set of normalized headers, normalized header -> set of bank names)
+    """
+    signatures = {}
+    for bank_name, error in banks_format.Bank.get_bank_errors().items():
+        log.warning(f"Bank {bank_name} is left out of format detection: {error}")
+    for bank in banks_format.Bank.get_banks().values():
+        signatures[bank.name] = {normalize_header(header) for header in bank.header_map}
+
+    banks_by_header: Dict[str, Set[str]] = {}
+    for bank_name, headers in signatures.items():
+        for header in headers:
+            banks_by_header.setdefault(header, set()).add(bank_name)
+    return signatures, banks_by_header
+
+def _detect_encoding(sample: bytes) -> Tuple[Optional[str], str]:
+    """
+    Returns the first of Bank.CSV_ENCODINGS that decodes the sample, and the decoded text.
+    The sample may end in the middle of a multi-byte character, so it is decoded incrementally.
+    """
+    for encoding in banks_format.Bank.get_encodings_options():
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            text = decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding, text.lstrip("\ufeff")
+    return None, ""
+
+def _split_header_line(line: str, delimiter: str) -> List[str]:
+    """
+    Splits a header line and renames repeated headers the way pandas does ("Moneda", "Moneda.1").
+    """
+    fields = next(csv.reader([line], delimiter=delimiter), [])
+    seen: Dict[str, int] = {}
+    headers = []
+    for field in fields:
+        count = seen.get(field, 0)
+        seen[field] = count + 1
+        headers.append(field if count == 0 else f"{field}.{count}")
+    return headers
+
+def _match_header_line(line: str, delimiter: str) -> Tuple[Optional[str], float]:
+    """
+    Scores a header line against the signature index.
+    The score of a bank is the share of its headers found in the line.
+    """
+    headers = {normalize_header(header) for header in _split_header_line(line, delimiter)}
+    if len(headers) < 2:
+        return None, 0.0
+    signatures, banks_by_header = get_signature_index()
+    hits: Dict[str, int] = {}
+    for header in headers:
+        for bank_name in banks_by_header.get(header, ()):
+            hits[bank_name] = hits.get(bank_name, 0) + 1
+    if not hits:
+        return None, 0.0
+    bank_name = max(hits, key=lambda name: hits[name] / len(signatures[name]))
+    return bank_name, hits[bank_name] / len(signatures[bank_name])
+
+def _guess_layout(lines: List[str]) -> Tuple[str, int]:
+    """
+    Guesses the delimiter and header row of an unknown format: the header is the first line
+    from which on every line has the same, largest number of fields.
+    """
+    best_delimiter, best_row, best_fields = banks_format.Bank.get_delimiters_options()[0], 0, 0
+    for delimiter in banks_format.Bank.get_delimiters_options():
+        counts = [len(next(csv.reader([line], delimiter=delimiter), [])) for line in lines]
+        for row, count in enumerate(counts):
+            if count > best_fields and all(c == count for c in counts[row:] if c > 1):
+                best_delimiter, best_row, best_fields = delimiter, row, count
+                break
+    return best_delimiter, best_row
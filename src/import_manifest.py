@@ -0,0 +1,150 @@
+# Manifest of the imported bank files, used to skip unchanged files on a rerun.
+# For each file it records the size, modification time, content hash, row count and date range
+# of the last import. A file that only grew gets just its new tail parsed.
+import hashlib
+import os
+from dataclasses import dataclass, asdict
+from enum import Enum
+from typing import Dict, Optional
+from utils.json_files import load_json, save_json_atomic
+from utils.utils import log
+
+# Bytes read at a time when hashing a file
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+class FileStatus(Enum):
+    """State of a bank file compared with its last import."""
+    NEW = "new"
+    UNCHANGED = "unchanged"
+    APPENDED = "appended"
+    CHANGED = "changed"
+
+
+@dataclass
+class ManifestEntry:
+    size: int
+    mtime_ns: int
+    content_hash: str
+    row_count: int
+    first_date: Optional[str] = None
+    last_date: Optional[str] = None
+
+
+@dataclass
+class FileCheck:
+    status: FileStatus
+    size: int
+    mtime_ns: int
+    content_hash: str
+    # Bytes of the file that were already imported; only the rest needs to be parsed
+    offset: int = 0
+    previous: Optional[ManifestEntry] = None
+
+    @property
+    def touched(self) -> bool:
+        """
+        True if the file is UNCHANGED, but its size or modification time are not the recorded
+        ones, e.g. a re-downloaded copy of the same export. It was hashed to find out, so it should
+        be recorded again to be trusted without reading it on the next check.
+        """
+        return (self.status == FileStatus.UNCHANGED and self.previous is not None
+                and (self.size, self.mtime_ns) != (self.previous.size, self.previous.mtime_ns))
+
+
+class ImportManifest:
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.entries: Dict[str, ManifestEntry] = {}
+        if os.path.exists(manifest_path):
+            data = load_json(manifest_path)
+            self.entries = {path: ManifestEntry(**entry) for path, entry in data.items()}
+
+    def check(self, csv_path: str, allow_append: bool = True) -> FileCheck:
+        """
+        Compares a file with its last import.
+        An unchanged size and modification time is trusted without reading the file. Otherwise
+        the file is hashed; if it grew and starts with exactly the previously imported bytes, it
+        is reported as APPENDED with the offset of the new tail.
+        Args:
+            csv_path (str): Path to the CSV file.
+            allow_append (bool): Whether the file may be imported by its tail only. Files with a
+                footer (csv_last_row) cannot, since the old footer is now in the middle.
+        Returns:
+            FileCheck: Status of the file and its current size, modification time and hash
+        """
+        stat = os.stat(csv_path)
+        previous = self.entries.get(self._key(csv_path))
+        if previous is not None and stat.st_size == previous.size and stat.st_mtime_ns == previous.mtime_ns:
+            return FileCheck(FileStatus.UNCHANGED, stat.st_size, stat.st_mtime_ns, previous.content_hash, stat.st_size, previous)
+
+        hasher = hashlib.blake2b()
+        offset = 0
+        with open(csv_path, "rb") as f:
+            if previous is not None and allow_append and stat.st_size > previous.size:
+                prefix_hasher = _hash_stream(f, hashlib.blake2b(), previous.size)
+                if prefix_hasher.hexdigest() == previous.content_hash and _ends_with_newline(f, previous.size):
+                    offset = previous.size
+                # Keep hashing from the end of the prefix to get the hash of the whole file
+                hasher = prefix_hasher
+                f.seek(previous.size)
+            content_hash = _hash_stream(f, hasher).hexdigest()
+
+        if previous is None:
+            status = FileStatus.NEW
+        elif content_hash == previous.content_hash:
+            status = FileStatus.UNCHANGED
+            offset = stat.st_size
+        elif offset > 0:
+            status = FileStatus.APPENDED
+        else:
+            status = FileStatus.CHANGED
+        return FileCheck(status, stat.st_size, stat.st_mtime_ns, content_hash, offset, previous)
+
+    def record(self, csv_path: str, file_check: FileCheck, row_count: int,
+               first_date: Optional[str] = None, last_date: Optional[str] = None) -> None:
+        """
+        Records a successful import. For an appended file, `row_count` and the dates refer to
+        the new tail only and are merged with the previous entry.
+        """
+        previous = file_check.previous
+        if file_check.status == FileStatus.APPENDED and previous is not None:
+            row_count += previous.row_count
+            first_date = min(filter(None, [previous.first_date, first_date]), default=None)
+            last_date = max(filter(None, [previous.last_date, last_date]), default=None)
+        elif file_check.status == FileStatus.UNCHANGED and previous is not None:
+            row_count, first_date, last_date = previous.row_count, previous.first_date, previous.last_date
+        self.entries[self._key(csv_path)] = ManifestEntry(
+            file_check.size, file_check.mtime_ns, file_check.content_hash, row_count, first_date, last_date)
+
+    def save(self) -> None:
+        save_json_atomic(self.manifest_path, {path: asdict(entry) for path, entry in self.entries.items()}, indent=2)
+        log.info(f"Saved import manifest with {len(self.entries)} files to {self.manifest_path}")
+
+    @staticmethod
+    def _key(csv_path: str) -> str:
+        return os.path.abspath(csv_path)
+
+def _hash_stream(f, hasher, length: Optional[int] = None):
+    """
+    Feeds `length` bytes of a file (or the rest of it) to `hasher`.
+    """
+    remaining = length
+    while remaining is None or remaining > 0:
+        block = f.read(_HASH_BLOCK_SIZE if remaining is None else min(_HASH_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        hasher.update(block)
+        if remaining is not None:
+            remaining -= len(block)
+    return hasher
+
+def _ends_with_newline(f, offset: int) -> bool:
+    """
+    Returns True if the byte before `offset` is a line break, so the new tail starts a new row.
+    """
+    if offset == 0:
+        return False
+    f.seek(offset - 1)
+    return f.read(1) == b"\n"
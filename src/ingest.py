@@ -0,0 +1,470 @@
+# Functions to run the ingestion of the bank CSV files, either sequentially or in a worker pool
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+import balances as balances
+import banks_format as banks_format
+import csv_processor as csv_processor
+import transaction_store as transaction_store
+import dedupe_index as dedupe_index
+import classifier as classifier
+import import_manifest as import_manifest
+import coverage_index as coverage_index
+import rollups as rollups
+import search_index as search_index
+import unified_dtypes as unified_dtypes
+from utils import metrics, validation
+from utils.utils import log, setup_logging
+
+# Maximum number of threads reading the export files of one bank
+MAX_READ_THREADS = 4
+
+@dataclass
+class FileResult:
+    """Outcome of the import of one bank file."""
+    row_count: int
+    first_date: Optional[str] = None
+    last_date: Optional[str] = None
+    # Rows with at least one invalid value (see utils.validation)
+    invalid_row_count: int = 0
+    # (bank, stage, StageMetrics) records, if metrics were collected
+    stage_metrics: Optional[List[Tuple[str, str, metrics.StageMetrics]]] = None
+
+
+def process_bank_files(bank: banks_format.Bank, csv_files: List[Tuple[str, int, int]], chunk_size: Optional[int] = None,
+                       store_path: Optional[str] = None, rules: Optional[List[classifier.CategoryRule]] = None,
+                       collect_metrics: bool = False) -> List[FileResult]:
+    """
+    Loads and validates one or several export files of a bank, converts them into the unified
+    format and, if a store is given, appends the transactions that are not in the BD2 transaction
+    store yet. Runs either in the main process or in a worker process of the pool.
+    Several files are read concurrently and merged into a single date-ordered DataFrame, where the
+    transactions of overlapping exports are kept once (see merge_exports).
+    Args:
+        bank (banks_format.Bank): Bank instance with the CSV configuration.
+        csv_files (list): (csv_path, offset, previous_row_count) of each file. If offset is not 0,
+            only the rows after this byte offset are imported; previous_row_count rows were
+            imported before it.
+        chunk_size (int, optional): Stream the files in chunks of this many rows.
+        store_path (str, optional): Base folder of the BD2 transaction store.
+        rules (list, optional): Category rules used to classify the transactions.
+        collect_metrics (bool): Measure the stages of the import and return them in the result.
+    Returns:
+        list: FileResult of each file, in the order of `csv_files`. The metrics of the import
+        are attached to the first one.
+    """
+    with metrics.collecting(collect_metrics) as collector:
+        results = _import_bank_files(bank, csv_files, chunk_size, store_path, rules)
+    if collector is not None:
+        results[0].stage_metrics = collector.get_records()
+    return results
+
+def parse_bank_file(bank: banks_format.Bank, csv_path: str, chunk_size: Optional[int] = None,
+                    rules: Optional[List[classifier.CategoryRule]] = None, offset: int = 0, previous_row_count: int = 0,
+                    collect_metrics: bool = False) -> Tuple[pd.DataFrame, FileResult]:
+    """
+    Loads, validates, converts and classifies a single CSV file of a bank, without storing it.
+    This is the CPU-bound part of an import, meant to run in a worker process; the returned
+    transactions can then be stored with store_new_transactions where the store is kept open.
+    Args are the same as for process_bank_files, with the csv_path, offset and previous_row_count
+    of a single file.
+    Returns:
+        tuple: Unified DataFrame of the file (or of its new tail) and the FileResult
+    """
+    with metrics.collecting(collect_metrics) as collector:
+        result = FileResult(0)
+        chunks = list(_parse_chunks(bank, csv_path, chunk_size, rules, offset, previous_row_count, result))
+    if collector is not None:
+        result.stage_metrics = collector.get_records()
+    unified_df = unified_dtypes.concat(chunks)
+    return unified_df, result
+
+def store_new_transactions(bank: banks_format.Bank, unified_df: pd.DataFrame, fingerprints: dedupe_index.FingerprintIndex,
+                           store: transaction_store.TransactionStore, rollup_index: Optional[rollups.RollupIndex] = None) -> int:
+    """
+    Appends the transactions of a unified DataFrame that are not in BD2 yet and, if given,
+    adds them to the monthly rollups.
+    fingerprints.start_import() must be called once per imported file before its first chunk.
+    The fingerprint index and the rollups are saved together with each appended chunk, so an
+    import that fails in a later chunk leaves BD2 and its indexes consistent.
+    Returns:
+        int: Number of new transactions
+    """
+    with metrics.stage(bank.name, "dedupe") as stage:
+        new_df = unified_df[fingerprints.filter_new(unified_df)]
+        stage.add(rows=len(unified_df))
+    with metrics.stage(bank.name, "store") as stage:
+        if rollup_index is not None:
+            rollup_index.add(new_df)
+        store.append(new_df)
+        fingerprints.save()
+        if rollup_index is not None:
+            rollup_index.save()
+        stage.add(rows=len(new_df))
+    return len(new_df)
+
+def merge_exports(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Merges the unified DataFrames of several exports of a bank into one DataFrame ordered by date.
+    Exports may overlap, so a transaction is identified by its fingerprint and its occurrence
+    rank within its export: the n-th identical transaction of an export is a duplicate if an
+    earlier export already has n of them. True repeats within an export are kept.
+    Args:
+        frames (list): Unified DataFrames, in the order of their files
+    Returns:
+        pd.DataFrame: Merged transactions, with a new index
+    """
+    runs, keys = [], []
+    for df in frames:
+        # Each export is sorted on its own, which is cheap as exports are already (reverse) date-ordered
+        df = balances.sort_chronologically(df)
+        fingerprints = dedupe_index.compute_fingerprints(df)
+        ranks = pd.Series(fingerprints).groupby(fingerprints, sort=False).cumcount().to_numpy()
+        runs.append(df)
+        keys.append(pd.DataFrame({"fingerprint": fingerprints, "rank": ranks}))
+    merged = unified_dtypes.concat(runs, ignore_index=True)
+    merged_keys = pd.concat(keys, ignore_index=True)
+
+    # k-way merge of the sorted runs: a stable sort of int64 keys is a timsort, which finds the
+    # runs and merges them in O(n log k). Undated rows sort last. On equal dates the earlier file wins
+    dates = merged["date"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    dates[np.isnat(merged["date"].to_numpy(dtype="datetime64[ns]"))] = np.iinfo(np.int64).max
+    order = np.argsort(dates, kind="stable")
+    duplicated = merged_keys.iloc[order].duplicated().to_numpy()
+    return merged.take(order[~duplicated]).reset_index(drop=True)
+
+def update_balances(bank: banks_format.Bank, transactions: pd.DataFrame, csv_files: List[Tuple[str, int, int]],
+                    results: List[FileResult], balance_index: balances.BalanceIndex) -> Optional[balances.BalanceReport]:
+    """
+    Computes the running balance of the transactions read from the files of a bank, checks it
+    against the balances stated by the bank and adds it to the balance index.
+    The opening balance is taken from the preamble of the earliest file; the preambles of the
+    other files and the footers are checked as balances at the end of their day.
+    Args:
+        transactions (pd.DataFrame): Unified transactions of the files, with 'date', 'amount' and 'balance'
+        csv_files (list): (csv_path, offset, previous_row_count) of each file, see process_bank_files
+        results (list): FileResult of each file
+    Returns:
+        BalanceReport, or None if the opening balance is unknown
+    """
+    openings, closings = [], []
+    for (csv_path, offset, _), result in zip(csv_files, results):
+        file_openings, file_closings = csv_processor.read_statement_balances(csv_path, bank)
+        closings.extend(file_closings)
+        # A preamble balance is the balance before the first transaction of the file, not of its new tail
+        if offset == 0 and file_openings and result.first_date is not None:
+            openings.append((pd.Timestamp(result.first_date) - pd.Timedelta(days=1), file_openings[-1][1]))
+    openings.sort()
+    report = balances.compute_balances(
+        transactions, bank.name, opening=openings[0][1] if openings else None, closing_balances=closings + openings[1:],
+        previous_balances=balance_index, continues=len(csv_files) == 1 and csv_files[0][1] > 0)
+    if report is None:
+        log.info(f"{bank.name}: the opening balance is unknown, the balance is not tracked")
+        return None
+    report.log_summary()
+    balance_index.add(report)
+    return report
+
+def _import_bank_files(bank: banks_format.Bank, csv_files: List[Tuple[str, int, int]], chunk_size: Optional[int],
+                       store_path: Optional[str], rules: Optional[List[classifier.CategoryRule]]) -> List[FileResult]:
+    store = None
+    if store_path:
+        store = transaction_store.TransactionStore(store_path)
+        fingerprints = dedupe_index.FingerprintIndex(get_fingerprint_index_path(store_path, bank))
+        # The tail of a single appended file continues the occurrences of its first rows
+        fingerprints.start_import(continues=len(csv_files) == 1 and csv_files[0][1] > 0)
+        rollup_index = rollups.RollupIndex(get_rollup_index_path(store_path), store)
+    results = [FileResult(0) for _ in csv_files]
+    if len(csv_files) == 1:
+        csv_path, offset, previous_row_count = csv_files[0]
+        frames = _parse_chunks(bank, csv_path, chunk_size, rules, offset, previous_row_count, results[0])
+    else:
+        frames = [_read_exports(bank, csv_files, chunk_size, rules, results)]
+    new_count, row_count = 0, 0
+    # Only the columns of the running balance are kept from each chunk
+    balance_frames = []
+    for unified_df in frames:
+        row_count += len(unified_df)
+        if store is not None:
+            new_count += store_new_transactions(bank, unified_df, fingerprints, store, rollup_index)
+            balance_frames.append(unified_df[["date", "amount", "balance"]])
+    if store is not None:
+        with metrics.stage(bank.name, "store"):
+            fingerprints.compact_if_needed()
+            balance_index = balances.BalanceIndex(get_balance_index_path(store_path, bank))
+            if update_balances(bank, pd.concat(balance_frames), csv_files, results, balance_index) is not None:
+                balance_index.save()
+            search_index.SearchIndex(get_search_index_path(store_path), store).update([bank.name])
+        log.info(f"{bank.name}: {new_count} new transactions, {row_count - new_count} already in BD2")
+    return results
+
+def _read_exports(bank: banks_format.Bank, csv_files: List[Tuple[str, int, int]], chunk_size: Optional[int],
+                  rules: Optional[List[classifier.CategoryRule]], results: List[FileResult]) -> pd.DataFrame:
+    """
+    Parses several export files of a bank in threads and merges them. Reading and tokenizing
+    the CSV files releases the GIL, so the files are read concurrently.
+    """
+    def parse(csv_file, result):
+        csv_path, offset, previous_row_count = csv_file
+        chunks = list(_parse_chunks(bank, csv_path, chunk_size, rules, offset, previous_row_count, result))
+        return unified_dtypes.concat(chunks)
+
+    with ThreadPoolExecutor(max_workers=min(len(csv_files), MAX_READ_THREADS)) as executor:
+        frames = list(executor.map(parse, csv_files, results))
+    with metrics.stage(bank.name, "dedupe") as stage:
+        merged = merge_exports(frames)
+        stage.add(rows=sum(len(df) for df in frames))
+    log.info(f"{bank.name}: merged {len(csv_files)} exports into {len(merged)} transactions, "
+             f"{sum(len(df) for df in frames) - len(merged)} in overlapping exports")
+    return merged
+
+def _parse_chunks(bank: banks_format.Bank, csv_path: str, chunk_size: Optional[int], rules: Optional[List[classifier.CategoryRule]],
+                  offset: int, previous_row_count: int, result: FileResult) -> Iterator[pd.DataFrame]:
+    """
+    Yields the unified, classified chunks of a file and adds their row counts and date range
+    to `result`.
+    """
+    category_classifier = classifier.compile_rules(rules) if rules else None
+    # Decimal separator inferred from the first chunk, used to check the rest of the file
+    decimal = None
+
+    def read_chunks():
+        if offset:
+            yield csv_processor.load_csv_tail(csv_path, bank, offset, previous_row_count)
+        elif chunk_size:
+            yield from csv_processor.iter_csv_chunks(csv_path, bank, chunksize=chunk_size)
+        else:
+            yield csv_processor.load_csv_file(csv_path, bank)
+
+    for df in _timed_chunks(read_chunks(), bank.name, os.path.getsize(csv_path) - offset):
+        with metrics.stage(bank.name, "validate") as stage:
+            report = validation.validate_dataframe(df, bank, decimal)
+            if decimal is None and report.decimal != bank.csv_decimal:
+                log.warning(f"{bank.name}: amounts in {csv_path} use '{report.decimal}' as decimal separator, "
+                            f"but the bank is configured with '{bank.csv_decimal}'.")
+            decimal = report.decimal
+            report.log_summary(bank.name)
+            result.invalid_row_count += len(report.error_rows())
+            stage.add(rows=len(df))
+        with metrics.stage(bank.name, "convert") as stage:
+            unified_df = csv_processor.create_unified_dataframe(df, bank)
+            stage.add(rows=len(unified_df))
+        if category_classifier is not None:
+            with metrics.stage(bank.name, "classify") as stage:
+                unified_df = unified_df.join(category_classifier.classify(unified_df))
+                stage.add(rows=len(unified_df))
+        result.row_count += len(unified_df)
+        dates = unified_df["date"].dropna()
+        if not dates.empty:
+            result.first_date = min(filter(None, [result.first_date, dates.min().strftime("%Y-%m-%d")]))
+            result.last_date = max(filter(None, [result.last_date, dates.max().strftime("%Y-%m-%d")]))
+        yield unified_df
+
+def _timed_chunks(chunks: Iterator[pd.DataFrame], bank_name: str, bytes_read: int) -> Iterator[pd.DataFrame]:
+    """
+    Yields the chunks of a file, measuring the time spent reading each one as the load stage.
+    """
+    while True:
+        with metrics.stage(bank_name, "load") as stage:
+            df = next(chunks, None)
+            if df is None:
+                break
+            stage.add(rows=len(df), bytes_read=bytes_read)
+            # The bytes of the file are counted once
+            bytes_read = 0
+        yield df
+
+def get_fingerprint_index_path(store_path: str, bank: banks_format.Bank) -> str:
+    """
+    Returns the path of the duplicate detection index of a bank, kept next to the BD2 store.
+    Fingerprints include the bank, so each bank has its own index.
+    """
+    return os.path.join(store_path, "_fingerprints", bank.name)
+
+def get_rollup_index_path(store_path: str) -> str:
+    """
+    Returns the folder of the monthly rollups, kept next to the BD2 store.
+    """
+    return os.path.join(store_path, "_rollups")
+
+def get_balance_index_path(store_path: str, bank: banks_format.Bank) -> str:
+    """
+    Returns the path of the end-of-day balance index of a bank, kept next to the BD2 store.
+    """
+    return os.path.join(store_path, "_balances", f"{bank.name}.json")
+
+def get_search_index_path(store_path: str) -> str:
+    """
+    Returns the folder of the full-text search index, kept next to the BD2 store.
+    """
+    return os.path.join(store_path, "_search")
+
+def get_coverage_index_path(store_path: str) -> str:
+    """
+    Returns the path of the date coverage index, kept next to the BD2 store.
+    """
+    return os.path.join(store_path, "_coverage.json")
+
+def get_own_range(file_check: Optional[import_manifest.FileCheck]) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """
+    Returns the date range already imported from an appended file, which its new rows may
+    overlap without being reported (see CoverageIndex.check), or None for other files.
+    """
+    if file_check is None or file_check.status != import_manifest.FileStatus.APPENDED or file_check.previous is None:
+        return None
+    return file_check.previous.first_date, file_check.previous.last_date
+
+def get_bank_files(banks_base_path: str, bank: banks_format.Bank) -> List[str]:
+    """
+    Returns the CSV files to import for a bank, sorted by name. The csv_filename of a bank may be
+    a glob pattern such as "export_*.csv"; if nothing matches it, the pattern itself is returned so
+    the missing file is reported.
+    """
+    csv_path = os.path.join(banks_base_path, bank.name, bank.csv_filename)
+    if not glob.has_magic(bank.csv_filename):
+        return [csv_path]
+    bank_dir = glob.escape(os.path.join(banks_base_path, bank.name))
+    return sorted(glob.glob(os.path.join(bank_dir, bank.csv_filename))) or [csv_path]
+
+def run_ingestion(banks_base_path: str, workers: int = 1, chunk_size: Optional[int] = None, store_path: Optional[str] = None,
+                  rules: Optional[List[classifier.CategoryRule]] = None, manifest_path: Optional[str] = None,
+                  force: bool = False, metrics_collector: Optional[metrics.MetricsCollector] = None) -> Tuple[Dict[str, bool], List[coverage_index.CoverageWarning]]:
+    """
+    Processes the CSV files of every bank and returns the result per bank.
+    With `workers` > 1 the files of each bank are parsed in a process pool; with a single worker
+    or a single bank everything runs in the current process, so no pool is started.
+    With a manifest, files that did not change since their last import are skipped and files
+    that only grew get just their new rows imported.
+    With a store, the date range of each imported file is checked against the dates already
+    covered in BD2 for gaps and overlaps.
+    Args:
+        banks_base_path (str): Base folder with one subfolder per bank.
+        workers (int): Maximum number of worker processes.
+        chunk_size (int, optional): Stream the files in chunks of this many rows.
+        store_path (str, optional): Base folder of the BD2 transaction store.
+        rules (list, optional): Category rules used to classify the transactions.
+        manifest_path (str, optional): Path of the import manifest.
+        force (bool): Import every file in full, even if the manifest says it did not change.
+        metrics_collector (MetricsCollector, optional): Collector of the stage metrics of every file,
+            including the ones processed in worker processes.
+    Returns:
+        tuple: Dictionary mapping bank names to True/False for success, and the list of
+        coverage warnings
+    """
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError(f"Invalid number of workers '{workers}'. It should be a positive integer.")
+
+    manifest = import_manifest.ImportManifest(manifest_path) if manifest_path else None
+    coverage = coverage_index.CoverageIndex(get_coverage_index_path(store_path)) if store_path else None
+    coverage_warnings: List[coverage_index.CoverageWarning] = []
+    csv_results = {}
+    tasks: List[Tuple[str, banks_format.Bank, List[Tuple[str, Optional[import_manifest.FileCheck]]]]] = []
+    for bank_name, error in banks_format.Bank.get_bank_errors().items():
+        log.error(f"Error processing bank {bank_name}: {error}")
+        csv_results[bank_name] = False
+    for bank in banks_format.Bank.get_banks().values():
+        csv_results[bank.name] = True
+        bank_files = []
+        for csv_path in get_bank_files(banks_base_path, bank):
+            file_check = None
+            if manifest is not None and os.path.exists(csv_path):
+                # Files with a footer cannot be imported by their tail only
+                file_check = manifest.check(csv_path, allow_append=bank.csv_last_row == 0)
+                if force:
+                    file_check = replace(file_check, status=import_manifest.FileStatus.CHANGED, offset=0)
+            bank_files.append((csv_path, file_check))
+        unchanged = [csv_path for csv_path, file_check in bank_files if _is_unchanged(file_check)]
+        if len(unchanged) == len(bank_files):
+            for csv_path, file_check in bank_files:
+                log.info(f"{bank.name}: {csv_path} did not change since its last import, skipped")
+                if file_check.touched:
+                    manifest.record(csv_path, file_check, 0)
+            continue
+        # All the exports of a bank are imported together, so overlapping exports are merged. The
+        # unchanged ones are read again, so the rows of a changed export are told apart from theirs
+        for csv_path in unchanged:
+            log.info(f"{bank.name}: {csv_path} did not change since its last import, merged with the changed exports")
+        tasks.append((bank.name, bank, bank_files))
+
+    collect_metrics = metrics_collector is not None
+    def task_args(bank, bank_files):
+        csv_files = []
+        for csv_path, file_check in bank_files:
+            # The exports of a bank with several files are merged in full, even if only one of them
+            # changed, so that repeats in the tail of an appended file are told apart from the rows
+            # of the other exports
+            if file_check is not None and file_check.status == import_manifest.FileStatus.APPENDED and len(bank_files) == 1:
+                csv_files.append((csv_path, file_check.offset, file_check.previous.row_count))
+            else:
+                csv_files.append((csv_path, 0, 0))
+        return (bank, csv_files, chunk_size, store_path, rules, collect_metrics)
+
+    def record(bank_name, bank_files, results):
+        for (csv_path, file_check), result in zip(bank_files, results or [None] * len(bank_files)):
+            _record_manifest(manifest, csv_path, file_check, result)
+            # Unchanged exports are only read again to be merged with the changed ones
+            if not _is_unchanged(file_check):
+                _record_coverage(coverage, coverage_warnings, bank_name, file_check, result)
+            _record_metrics(metrics_collector, result)
+
+    if workers == 1 or len(tasks) <= 1:
+        for bank_name, bank, bank_files in tasks:
+            log.info("\n" + f"Processing bank: {bank_name}")
+            log.info("="*30)
+            args = task_args(bank, bank_files)
+            record(bank_name, bank_files, _record_result(csv_results, bank_name, lambda: process_bank_files(*args)))
+    else:
+        pool_size = min(workers, len(tasks))
+        log.info("\n" + f"Processing {len(tasks)} banks with {pool_size} workers")
+        with ProcessPoolExecutor(max_workers=pool_size, initializer=setup_logging) as pool:
+            futures = [(bank_name, bank_files, pool.submit(process_bank_files, *task_args(bank, bank_files)))
+                       for bank_name, bank, bank_files in tasks]
+            for bank_name, bank_files, future in futures:
+                record(bank_name, bank_files, _record_result(csv_results, bank_name, future.result))
+
+    if manifest is not None:
+        manifest.save()
+    if coverage is not None:
+        coverage.save()
+    return csv_results, coverage_warnings
+
+def _is_unchanged(file_check: Optional[import_manifest.FileCheck]) -> bool:
+    return file_check is not None and file_check.status == import_manifest.FileStatus.UNCHANGED
+
+def _record_result(csv_results: Dict[str, bool], bank_name: str, get_results) -> Optional[List[FileResult]]:
+    """
+    Runs `get_results` and records the outcome of the files of a bank in `csv_results`.
+    A bank is successful only if all of its files were processed successfully.
+    Returns the FileResult of each file, or None if the import failed.
+    """
+    try:
+        results = get_results()
+        row_count = sum(result.row_count for result in results)
+        invalid_row_count = sum(result.invalid_row_count for result in results)
+        log.info(f"{bank_name}: {row_count} rows processed" +
+                 (f" from {len(results)} files" if len(results) > 1 else "") +
+                 (f", {invalid_row_count} with invalid values" if invalid_row_count else ""))
+        return results
+    except (ValueError, OSError) as e:
+        # Extract only the error message without the traceback, e.g. of a missing export file
+        log.error(f"Error processing bank {bank_name}: {str(e)}")
+        csv_results[bank_name] = False
+        return None
+
+def _record_manifest(manifest: Optional[import_manifest.ImportManifest], csv_path: str,
+                     file_check: Optional[import_manifest.FileCheck], result: Optional[FileResult]) -> None:
+    if manifest is not None and file_check is not None and result is not None:
+        manifest.record(csv_path, file_check, result.row_count, result.first_date, result.last_date)
+
+def _record_coverage(coverage: Optional[coverage_index.CoverageIndex], coverage_warnings: List[coverage_index.CoverageWarning],
+                     bank_name: str, file_check: Optional[import_manifest.FileCheck], result: Optional[FileResult]) -> None:
+    if coverage is not None and result is not None:
+        coverage_warnings.extend(coverage.check_and_add(bank_name, result.first_date, result.last_date, get_own_range(file_check)))
+
+def _record_metrics(metrics_collector: Optional[metrics.MetricsCollector], result: Optional[FileResult]) -> None:
+    if metrics_collector is not None and result is not None and result.stage_metrics:
+        metrics_collector.merge(result.stage_metrics)
@@ -1,48 +1,171 @@
+import argparse
 import os
-import pandas as pd
-import yaml_config as yaml_config
-import csv_processor as csv_processor
 import banks_format as banks_format
-import unified_format as udb
+from utils import yaml_config, metrics
 from utils.utils import log, setup_logging, print_processing_summary
+# ingest, format_detection and classifier import pandas, so they are only imported by the
+# commands that parse files. Listing banks or showing their configuration stays fast
 
-# TODO: in DB, read top rows of the CSV file and read the starting balance
 # TODO: add checks for every error!
-# - In the load transaction table, all entries should have a date, a description and an amount
 # - CSV tables should have at least x rows (at least 1 or 2?)
 
-# Initialize logging
-setup_logging()
-
-# Load base_path from local_settings.yaml
-local_settings = yaml_config.load_local_settings()
-banks_base_path = local_settings["banks_base_path"]
-log.info("\n" + f"Using banks base path: {banks_base_path}")
-
-# Load CSV file for each bank
-csv_results = {}
-for bank_cls in banks_format.Bank.__subclasses__():
-    try:
-        bank = bank_cls()  # instantiate the bank
-        log.info("\n" + f"Processing bank: {bank.name}")
-        log.info("="*30)
-                
-        df = csv_processor.load_csv_file(os.path.join(banks_base_path, bank.name, bank.csv_filename), bank)
-        
-        csv_results[bank.name] = True
-        
-    except ValueError as e:
-        # Extract only the error message without the traceback
-        log.error(f"Error processing bank {bank_cls.__name__}: {str(e)}")
-        csv_results[bank_cls.__name__] = False
-        continue
-      
-    # Create unified DataFrame
-    #unified_df = csv_processor.create_unified_dataframe(df, bank)
-    #log.info("\nUnified DataFrame Info:")
-    #csv_processor.print_csv_info(unified_df, f"{bank} (Unified)")
-
-
-# Print summary of processing results
-print_processing_summary(csv_results)
 
+def main():
+    parser = argparse.ArgumentParser(description="Import the bank CSV files.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes used to parse the bank files (default: 'workers' in local_settings.yaml, or 1)")
+    parser.add_argument("--detect", metavar="PATH",
+                        help="Detect the bank format of a CSV file, or of every CSV file in a directory, and exit")
+    parser.add_argument("--force", action="store_true",
+                        help="Import every bank file in full, even if it did not change since the last import")
+    parser.add_argument("--list-banks", action="store_true",
+                        help="List the supported banks and exit")
+    parser.add_argument("--bank-info", metavar="BANK",
+                        help="Show the CSV configuration of a bank and exit")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and import new or changed bank files as soon as they land")
+    parser.add_argument("--poll-interval", type=float, default=None,
+                        help="Seconds between two checks of the bank files in watch mode (default: 'poll_interval' in local_settings.yaml, or 5)")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="Recompute the monthly rollups from the transactions in BD2 and exit")
+    parser.add_argument("--balance", metavar="BANK",
+                        help="Show the balance of a bank at the end of --date, from the balances of the imported files, and exit")
+    parser.add_argument("--date", default=None,
+                        help="Date of --balance as YYYY-MM-DD (default: today)")
+    parser.add_argument("--search", metavar="TEXT",
+                        help="Show the transactions in BD2 whose description, extended description or origin contain every word of TEXT, and exit")
+    parser.add_argument("--start", help="First date of --search as YYYY-MM-DD")
+    parser.add_argument("--end", help="Last date of --search as YYYY-MM-DD")
+    parser.add_argument("--min-amount", type=float, help="Minimum absolute amount of --search, e.g. 50 for 50 EUR")
+    parser.add_argument("--max-amount", type=float, help="Maximum absolute amount of --search")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of transactions shown by --search (default: 50)")
+    parser.add_argument("--metrics", choices=["summary"] + list(metrics.FILE_FORMATS),
+                        help="Measure each import stage and show it in the summary; 'json' and 'prometheus' also write it to a file next to the log file")
+    args = parser.parse_args()
+
+    # Initialize logging. Metrics files are written next to the log file
+    log_path = setup_logging(log_to_file=args.metrics in metrics.FILE_FORMATS)
+
+    if args.list_banks:
+        for bank_name, bank in banks_format.Bank.get_banks().items():
+            log.info(f"{bank_name}: {bank.description}" if bank.description else bank_name)
+        for bank_name, error in banks_format.Bank.get_bank_errors().items():
+            log.error(f"{bank_name} (invalid configuration): {error}")
+        return
+
+    if args.bank_info:
+        try:
+            bank = banks_format.Bank.get_bank(args.bank_info)
+        except ValueError as e:
+            log.error(str(e))
+            return
+        for key, value in bank.get_info().items():
+            log.info(f"{key}: {value}")
+        return
+
+    if args.detect:
+        import format_detection as format_detection
+        if os.path.isdir(args.detect):
+            detected = format_detection.detect_directory(args.detect)
+        else:
+            detected = {args.detect: format_detection.detect_bank_format(args.detect)}
+        for csv_path, csv_format in detected.items():
+            log.info(f"{csv_path}: {csv_format.bank_name or 'unknown bank'} "
+                     f"(encoding '{csv_format.encoding}', delimiter '{csv_format.delimiter}', "
+                     f"header row {csv_format.header_row}, score {csv_format.score:.2f})")
+        return
+
+    import ingest as ingest
+    import classifier as classifier
+
+    # Load base_path from local_settings.yaml
+    local_settings = yaml_config.load_local_settings()
+    banks_base_path = local_settings["banks_base_path"]
+    log.info("\n" + f"Using banks base path: {banks_base_path}")
+    # Optional: stream the CSV files in chunks of this many rows to keep memory use flat
+    csv_chunk_size = local_settings.get("csv_chunk_size")
+    # Optional: folder of the BD2 transaction store. Nothing is stored if it is not set
+    bd2_path = local_settings.get("bd2_path")
+    # Optional: categories file used to classify the transactions
+    categories_path = local_settings.get("categories_path")
+    rules = classifier.rules_from_config(yaml_config.load_categories(categories_path)) if categories_path else None
+    # Manifest of the imported files, used to skip unchanged files
+    manifest_path = local_settings.get("manifest_path", os.path.join(banks_base_path, "import_manifest.json"))
+    workers = args.workers if args.workers is not None else local_settings.get("workers", 1)
+
+    if args.rebuild_rollups:
+        if not bd2_path:
+            log.error("Cannot rebuild the rollups: 'bd2_path' is not set in local_settings.yaml")
+            return
+        import rollups as rollups
+        import transaction_store as transaction_store
+        rollup_index = rollups.RollupIndex(ingest.get_rollup_index_path(bd2_path), transaction_store.TransactionStore(bd2_path))
+        rollup_index.rebuild()
+        rollup_index.save()
+        return
+
+    if args.balance:
+        if not bd2_path:
+            log.error("Cannot show the balance: 'bd2_path' is not set in local_settings.yaml")
+            return
+        import balances as balances
+        from datetime import date
+        try:
+            bank = banks_format.Bank.get_bank(args.balance)
+            day = date.fromisoformat(args.date) if args.date else date.today()
+        except ValueError as e:
+            log.error(str(e))
+            return
+        balance = balances.BalanceIndex(ingest.get_balance_index_path(bd2_path, bank)).balance_at(day)
+        if balance is None:
+            log.info(f"{bank.name}: no balance known on {day}")
+        else:
+            log.info(f"{bank.name}: balance at the end of {day}: {balance / 100:.2f}")
+        return
+
+    if args.search:
+        if not bd2_path:
+            log.error("Cannot search: 'bd2_path' is not set in local_settings.yaml")
+            return
+        import search_index as search_index
+        import transaction_store as transaction_store
+        index = search_index.SearchIndex(ingest.get_search_index_path(bd2_path), transaction_store.TransactionStore(bd2_path))
+        # Parts stored before the index existed, or by an interrupted import, are indexed first
+        index.update()
+        to_cents = lambda amount: round(amount * 100) if amount is not None else None
+        try:
+            found = index.search(args.search, start=args.start, end=args.end, min_amount=to_cents(args.min_amount),
+                                 max_amount=to_cents(args.max_amount), limit=args.limit)
+        except ValueError as e:
+            log.error(str(e))
+            return
+        for transaction in found.itertuples(index=False):
+            log.info(f"{transaction.date:%Y-%m-%d}  {transaction.bank:<8}{transaction.amount / 100:>12.2f}  "
+                     f"{transaction.description}" + (f" ({transaction.origin})" if isinstance(transaction.origin, str) else ""))
+        log.info(f"{len(found)} transactions found")
+        return
+
+    metrics_collector = metrics.MetricsCollector() if args.metrics else None
+
+    if args.watch:
+        import watcher as watcher
+        poll_interval = args.poll_interval if args.poll_interval is not None else local_settings.get("poll_interval", watcher.DEFAULT_POLL_INTERVAL)
+        # Runs until interrupted; a summary is printed after every poll that imported files
+        watcher.watch(banks_base_path, manifest_path, store_path=bd2_path, rules=rules, chunk_size=csv_chunk_size,
+                      workers=workers, poll_interval=poll_interval, metrics_collector=metrics_collector)
+    else:
+        # Load CSV file for each bank and convert it into the unified format
+        csv_results, coverage_warnings = ingest.run_ingestion(banks_base_path, workers=workers, chunk_size=csv_chunk_size, store_path=bd2_path, rules=rules,
+                                                                manifest_path=manifest_path, force=args.force, metrics_collector=metrics_collector)
+
+        # Print summary of processing results
+        print_processing_summary(csv_results, coverage_warnings, metrics_collector)
+
+    if args.metrics in metrics.FILE_FORMATS:
+        metrics_path = metrics.get_metrics_path(log_path, args.metrics)
+        metrics_collector.write(metrics_path, args.metrics)
+        log.info(f"Saved import metrics to {metrics_path}")
+
+
+if __name__ == "__main__":
+    main()
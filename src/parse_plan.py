@@ -0,0 +1,106 @@
+# Parse plans of the bank CSV files.
+# A plan is compiled once per bank configuration and tells the CSV loaders what to do with an
+# export: the rows to cut off before the header and after the table, which columns to read and
+# with which dtype, which columns feed each unified column and the converter of each unified
+# column, bound to the bank's decimal separator and date format. Columns mapped to
+# UnifiedHeaders.unused, or not mapped at all, are pruned before parsing, so the CSV engine never
+# tokenizes or allocates them.
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import banks_format as banks_format
+import unified_format as udb
+
+# Dtype each column is read with. Dates and texts are read as text, so IBANs or references keep
+# their leading zeros. The dtype of amounts is inferred for banks with "." decimals: the CSV
+# engine parses clean columns as floats, faster than the converters of csv_processor parse text,
+# and leaves any other column as text. Other banks read amounts as text (see _amount_dtype)
+_READ_DTYPES = {
+    udb.ParameterType.DATE: str,
+    udb.ParameterType.TEXT: str,
+    udb.ParameterType.CURRENCY: None,
+    udb.ParameterType.BOOLEAN: str,
+}
+
+
+def normalize_header(header) -> str:
+    """Returns a CSV header as it is matched against the header_map: stripped and in lower case."""
+    return str(header).strip().lower()
+
+
+@dataclass(frozen=True)
+class ParsePlan:
+    """Compiled CSV configuration of a bank. Use get_parse_plan to get a cached instance."""
+    bank_name: str
+    delimiter: str
+    # Preamble rows before the CSV header, and footer rows after the table
+    header_rows: int
+    footer_rows: int
+    # (normalized header, unified column) of the read columns, in header_map order
+    header_entries: Tuple[Tuple[str, udb.BankEntryType], ...]
+    # Normalized header -> dtype the column is read with, None if inferred
+    dtypes: Dict[str, Optional[type]]
+    # Unified column -> function that converts one of its source columns, see csv_processor
+    converters: Dict[udb.BankEntryType, Callable]
+
+    def usecols(self, headers: Iterable) -> List:
+        """Returns the headers of an export that are read, as pd.read_csv names them."""
+        return [header for header in headers if normalize_header(header) in self.dtypes]
+
+    def read_csv_kwargs(self, headers: Iterable) -> Dict:
+        """
+        Returns the pd.read_csv keyword arguments that read only the used columns of an export.
+        Args:
+            headers (list): All the headers of the export, e.g. read with nrows=0
+        """
+        usecols = self.usecols(headers)
+        return {
+            "delimiter": self.delimiter,
+            "usecols": usecols,
+            "dtype": {header: self.dtypes[normalize_header(header)] for header in usecols
+                      if self.dtypes[normalize_header(header)] is not None},
+        }
+
+    def sources(self, columns: Iterable) -> Dict[udb.BankEntryType, List]:
+        """
+        Returns the columns of a loaded DataFrame that feed each unified column, in header_map order.
+        """
+        df_columns = {normalize_header(column): column for column in columns}
+        sources: Dict[udb.BankEntryType, List] = {}
+        for header, entry in self.header_entries:
+            column = df_columns.get(header)
+            if column is not None:
+                sources.setdefault(entry, []).append(column)
+        return sources
+
+
+def get_parse_plan(bank: banks_format.Bank) -> ParsePlan:
+    """
+    Returns the parse plan of a bank. Plans are cached by bank configuration, so each bank is
+    compiled once per process.
+    """
+    return _compile_cached(bank.name, bank.csv_delimiter, bank.csv_header_row, bank.csv_last_row, bank.csv_decimal,
+                           bank.csv_date_format, tuple(bank.header_map.items()))
+
+@lru_cache(maxsize=None)
+def _compile_cached(bank_name: str, delimiter: str, header_row: int, last_row: int, decimal: str, date_format: Optional[str],
+                    header_map: Tuple[Tuple[str, udb.BankEntryType], ...]) -> ParsePlan:
+    # The converters work on pandas columns: csv_processor is imported here, and not with the
+    # module, so format_detection can match headers without loading pandas
+    import csv_processor as csv_processor
+    header_entries = tuple((normalize_header(header), entry) for header, entry in header_map if entry != udb.UnifiedHeaders.unused)
+    dtypes = {header: _amount_dtype(decimal) if entry.parameter_type == udb.ParameterType.CURRENCY else _READ_DTYPES[entry.parameter_type]
+              for header, entry in header_entries}
+    bound = {
+        udb.ParameterType.DATE: partial(csv_processor.parse_dates, date_format=date_format),
+        udb.ParameterType.CURRENCY: partial(csv_processor.parse_amounts, decimal=decimal),
+        udb.ParameterType.TEXT: csv_processor.parse_text,
+        udb.ParameterType.BOOLEAN: csv_processor.parse_booleans,
+    }
+    converters = {entry: bound[entry.parameter_type] for _, entry in header_entries}
+    return ParsePlan(bank_name, delimiter, header_row, -last_row, header_entries, dtypes, converters)
+
+def _amount_dtype(decimal: str) -> Optional[type]:
+    # The CSV engine only knows "." decimals: it would read "-1.500" of a bank with "," decimals
+    # as -1.5, so their amounts are read as text
+    return _READ_DTYPES[udb.ParameterType.CURRENCY] if decimal == "." else str
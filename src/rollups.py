@@ -0,0 +1,239 @@
+# Monthly rollups of BD2: sum, count, min and max of the amounts by month x bank x category, and by
+# month x bank x origin. They are updated from the new rows of each import only, so reports read a few
+# aggregates instead of scanning the stored history.
+# Each bank has its own rollup file, like the fingerprint indexes, so worker processes importing
+# different banks never write the same file.
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+import pandas as pd
+import transaction_store as transaction_store
+from utils.json_files import load_json, save_json_atomic
+from utils.utils import log
+
+# Unified columns the amounts are rolled up by, besides the bank and the month
+DIMENSIONS = ["category", "origin"]
+# Key of the rows without a value in a dimension, e.g. transactions that matched no category
+NO_VALUE = ""
+
+MONTH_FORMAT = transaction_store.TransactionStore.MONTH_FORMAT
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """Aggregate of the amounts, in cents, of the transactions of one group."""
+    sum: int
+    count: int
+    min: int
+    max: int
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def merge(self, other: "Rollup") -> "Rollup":
+        return Rollup(self.sum + other.sum, self.count + other.count, min(self.min, other.min), max(self.max, other.max))
+
+
+class RollupIndex:
+    """
+    Persistent monthly rollups, stored as <path>/<bank>.json. Bank files are loaded on first use.
+    Min and max cannot be subtracted, so rows that change (e.g. reclassified rows) are handled by
+    recomputing the groups of their (bank, month) partitions from BD2 with `refresh`.
+    """
+    ROLLUP_EXTENSION = ".json"
+
+    def __init__(self, path: str, store: Optional[transaction_store.TransactionStore] = None):
+        """
+        Args:
+            path (str): Folder of the rollup files
+            store (TransactionStore, optional): BD2 store. Banks that are in BD2 but have no rollup
+                file yet are rolled up from it when first loaded.
+        """
+        self.path = path
+        self.store = store
+        # Bank -> dimension -> month -> key -> Rollup
+        self._banks: Dict[str, Dict[str, Dict[str, Dict[str, Rollup]]]] = {}
+        self._changed = set()
+        os.makedirs(path, exist_ok=True)
+
+    def add(self, df: pd.DataFrame) -> None:
+        """
+        Adds the transactions of a unified DataFrame to the rollups. Only new transactions should
+        be added, and before they are appended to BD2: a bank without rollups yet is first rolled
+        up from BD2, which would then count them twice.
+        Rows without a date or amount are not rolled up, as they are not stored either.
+        """
+        df = df[df["date"].notna() & df["amount"].notna()]
+        for bank_name in df["bank"].unique():
+            self._load(str(bank_name))
+        for (bank_name, dimension, month, key), rollup in _aggregate(df).items():
+            months = self._banks[bank_name][dimension].setdefault(month, {})
+            previous = months.get(key)
+            months[key] = rollup if previous is None else previous.merge(rollup)
+            self._changed.add(bank_name)
+
+    def refresh(self, bank: str, months: Iterable[str]) -> None:
+        """
+        Recomputes the rollups of some months of a bank from BD2, e.g. after their transactions
+        were reclassified. Only the partitions of those months are read.
+        Args:
+            bank (str): Bank name
+            months (list): Months as 'YYYY-MM'
+        """
+        if self.store is None:
+            raise ValueError("Cannot refresh the rollups without the BD2 store.")
+        months = sorted(set(months))
+        if not months:
+            return
+        dimensions = self._load(bank, bootstrap=False)
+        for month in months:
+            for dimension in DIMENSIONS:
+                dimensions[dimension].pop(month, None)
+        for month in months:
+            start = pd.Timestamp(month + "-01")
+            df = self._read_store([bank], start, start + pd.offsets.MonthEnd(0))
+            for (_, dimension, row_month, key), rollup in _aggregate(df).items():
+                dimensions[dimension].setdefault(row_month, {})[key] = rollup
+        self._changed.add(bank)
+
+    def discard(self, bank: str) -> None:
+        """
+        Forgets the unsaved changes to the rollups of a bank, e.g. the rows of an import that
+        failed to be stored. Its rollups are loaded again from its file on next use.
+        """
+        self._banks.pop(bank, None)
+        self._changed.discard(bank)
+
+    def rebuild(self) -> None:
+        """
+        Recomputes the rollups of every bank in BD2, one bank at a time.
+        """
+        if self.store is None:
+            raise ValueError("Cannot rebuild the rollups without the BD2 store.")
+        banks = sorted({bank_name for bank_name, _, _ in self.store.partitions()})
+        for bank_name in banks:
+            self._banks[bank_name] = self._rollup_store(bank_name)
+            self._changed.add(bank_name)
+        log.info(f"Rebuilt the rollups of {len(banks)} banks from {self.store}")
+
+    def get(self, bank: str, month: str, dimension: str = "category", key: str = NO_VALUE) -> Optional[Rollup]:
+        """
+        Returns the rollup of one group, or None if it has no transactions.
+        Args:
+            bank (str): Bank name
+            month (str): Month as 'YYYY-MM'
+            dimension (str): One of DIMENSIONS
+            key (str): Value of the dimension, e.g. the category name
+        """
+        _check_dimension(dimension)
+        return self._load(bank)[dimension].get(month, {}).get(key)
+
+    def total(self, bank: str, month: str) -> Optional[Rollup]:
+        """
+        Returns the rollup of all the transactions of a bank in one month, or None.
+        """
+        rollups = list(self._load(bank)["category"].get(month, {}).values())
+        if not rollups:
+            return None
+        total = rollups[0]
+        for rollup in rollups[1:]:
+            total = total.merge(rollup)
+        return total
+
+    def to_dataframe(self, dimension: str = "category", banks: Optional[Iterable[str]] = None,
+                     start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """
+        Returns the rollups of a dimension as a table, sorted by bank, month and key.
+        Args:
+            dimension (str): One of DIMENSIONS
+            banks (list, optional): Bank names. All banks with rollups if None.
+            start, end (str, optional): Inclusive range of months as 'YYYY-MM'
+        Returns:
+            pd.DataFrame: Columns bank, month, <dimension>, sum, count, min, max
+        """
+        _check_dimension(dimension)
+        records = []
+        for bank_name in sorted(banks if banks is not None else self._bank_names()):
+            for month, keys in sorted(self._load(bank_name)[dimension].items()):
+                if (start is not None and month < start) or (end is not None and month > end):
+                    continue
+                for key, rollup in sorted(keys.items()):
+                    records.append((bank_name, month, key, rollup.sum, rollup.count, rollup.min, rollup.max))
+        return pd.DataFrame(records, columns=["bank", "month", dimension, "sum", "count", "min", "max"])
+
+    def save(self) -> None:
+        """
+        Writes the rollup files of the banks that changed.
+        """
+        for bank_name in sorted(self._changed):
+            data = {dimension: {month: {key: [rollup.sum, rollup.count, rollup.min, rollup.max] for key, rollup in keys.items()}
+                                for month, keys in sorted(months.items())}
+                    for dimension, months in self._banks[bank_name].items()}
+            save_json_atomic(self._bank_path(bank_name), data, ensure_ascii=False)
+        self._changed = set()
+
+    def _load(self, bank: str, bootstrap: bool = True) -> Dict[str, Dict[str, Dict[str, Rollup]]]:
+        dimensions = self._banks.get(bank)
+        if dimensions is not None:
+            return dimensions
+        bank_path = self._bank_path(bank)
+        if os.path.exists(bank_path):
+            data = load_json(bank_path)
+            dimensions = {dimension: {month: {key: Rollup(*values) for key, values in keys.items()}
+                                      for month, keys in data.get(dimension, {}).items()}
+                          for dimension in DIMENSIONS}
+        elif bootstrap and self.store is not None and self.store.partitions([bank]):
+            log.info(f"{bank}: no rollups yet, rolling up the transactions in {self.store}")
+            dimensions = self._rollup_store(bank)
+            self._changed.add(bank)
+        else:
+            dimensions = {dimension: {} for dimension in DIMENSIONS}
+        self._banks[bank] = dimensions
+        return dimensions
+
+    def _rollup_store(self, bank: str) -> Dict[str, Dict[str, Dict[str, Rollup]]]:
+        dimensions = {dimension: {} for dimension in DIMENSIONS}
+        for (_, dimension, month, key), rollup in _aggregate(self._read_store([bank])).items():
+            dimensions[dimension].setdefault(month, {})[key] = rollup
+        return dimensions
+
+    def _read_store(self, banks: List[str], start=None, end=None) -> pd.DataFrame:
+        df = self.store.read(banks=banks, start=start, end=end)
+        if "date" not in df.columns or "amount" not in df.columns:
+            return pd.DataFrame(columns=["bank", "date", "amount"])
+        return df[df["date"].notna() & df["amount"].notna()]
+
+    def _bank_names(self) -> List[str]:
+        stored = [entry.name[:-len(self.ROLLUP_EXTENSION)] for entry in os.scandir(self.path)
+                  if entry.is_file() and entry.name.endswith(self.ROLLUP_EXTENSION)]
+        return sorted(set(stored) | set(self._banks))
+
+    def _bank_path(self, bank: str) -> str:
+        return os.path.join(self.path, bank + self.ROLLUP_EXTENSION)
+
+def _aggregate(df: pd.DataFrame) -> Dict[tuple, Rollup]:
+    """
+    Groups the transactions of a unified DataFrame by bank, month and the value of each dimension.
+    Returns:
+        dict: (bank, dimension, month, key) -> Rollup
+    """
+    rollups = {}
+    if df.empty:
+        return rollups
+    months = pd.to_datetime(df["date"]).dt.strftime(MONTH_FORMAT)
+    amounts = pd.array(df["amount"], dtype="Int64")
+    for dimension in DIMENSIONS:
+        if dimension in df.columns:
+            keys = df[dimension].astype("string").fillna(NO_VALUE)
+        else:
+            keys = pd.Series(NO_VALUE, index=df.index, dtype="string")
+        grouped = pd.DataFrame({"bank": df["bank"].astype("string"), "month": months, "key": keys, "amount": amounts}) \
+            .groupby(["bank", "month", "key"], sort=False)["amount"].agg(["sum", "count", "min", "max"])
+        for (bank_name, month, key), values in zip(grouped.index, grouped.itertuples(index=False, name=None)):
+            rollups[(str(bank_name), dimension, str(month), str(key))] = Rollup(*(int(value) for value in values))
+    return rollups
+
+def _check_dimension(dimension: str) -> None:
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Invalid rollup dimension '{dimension}'. It should be one of {DIMENSIONS}.")
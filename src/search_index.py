@@ -0,0 +1,327 @@
+# Full-text search over the transactions in BD2.
+# An inverted index maps every token of the description, info_extended and origin columns to the
+# sorted ids of the transactions that contain it. Tokens are normalized like the category keywords
+# (case-folded, without accents), so "MÜLLER", "Muller" and "müller" are the same token.
+# Like the store, the index is append-only: each import adds a segment with the postings of its
+# new part files, so indexing never rereads the history. Segments are folders of .npy files,
+# which queries memory-map and binary-search without loading them. Once a bank has too many
+# segments, its smallest ones are merged from their postings, so queries open a bounded number
+# of segments however many imports there were.
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+import pandas as pd
+import transaction_store as transaction_store
+import unified_dtypes as unified_dtypes
+from classifier import normalize_text
+from utils.json_files import load_json, save_json_atomic
+from utils.utils import log
+
+# Unified columns whose text is indexed
+TEXT_COLUMNS = ["description", "info_extended", "origin"]
+# Columns read from the part files to index them
+_INDEX_COLUMNS = ["date", "amount"] + TEXT_COLUMNS
+# Amount stored for transactions without one; never within an amount range
+_NO_AMOUNT = np.iinfo(np.int64).min
+_TOKEN_PATTERN = re.compile(r"\w+")
+# Segments per bank above which the smallest ones are merged, leaving half of them
+MAX_SEGMENTS = 8
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits a text into normalized tokens."""
+    return _TOKEN_PATTERN.findall(normalize_text(text))
+
+
+class _Segment:
+    """
+    Postings and per-transaction columns of the part files indexed together. Transactions are
+    numbered from 0 within the segment.
+    """
+    META_FILE = "segment.json"
+    ARRAYS = ["tokens", "offsets", "postings", "days", "amounts", "parts", "rows"]
+
+    def __init__(self, path: str):
+        self.path = path
+        meta = load_json(os.path.join(path, self.META_FILE))
+        # Part files, relative to the store base path
+        self.part_paths: List[str] = meta["parts"]
+        self.first_day: int = meta["first_day"]
+        self.last_day: int = meta["last_day"]
+        # Names of the segments merged into this one, left behind if the merge was interrupted
+        self.replaces: List[str] = meta.get("replaces", [])
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        if name not in self.ARRAYS:
+            raise AttributeError(name)
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return self._arrays[name]
+
+    def postings_of(self, token: str) -> np.ndarray:
+        position = int(np.searchsorted(self.tokens, token))
+        if position == len(self.tokens) or self.tokens[position] != token:
+            return np.zeros(0, dtype=np.int32)
+        return self.postings[self.offsets[position]:self.offsets[position + 1]]
+
+
+class SearchIndex:
+    """
+    Inverted index of the transactions of a BD2 store, with one folder of segments per bank.
+    """
+    SEGMENT_PREFIX = "seg-"
+
+    def __init__(self, path: str, store: transaction_store.TransactionStore):
+        """
+        Args:
+            path (str): Folder of the index
+            store (TransactionStore): Store whose transactions are indexed
+        """
+        self.path = path
+        self.store = store
+        # Segments are never modified, so they are opened once per segment folder
+        self._opened: Dict[str, _Segment] = {}
+        os.makedirs(path, exist_ok=True)
+
+    def update(self, banks: Optional[Iterable[str]] = None) -> int:
+        """
+        Indexes the part files of BD2 that are not indexed yet, in a new segment per bank.
+        Only the partition folders are listed to find them; indexed parts are not read again.
+        Each bank should be updated by one process at a time.
+        Args:
+            banks (list, optional): Bank names to update. All banks if None.
+        Returns:
+            int: Number of transactions indexed
+        """
+        by_bank: Dict[str, List[str]] = {}
+        for bank_name, _, partition_dir in self.store.partitions(banks):
+            for part_path in transaction_store.list_parts(partition_dir):
+                by_bank.setdefault(bank_name, []).append(os.path.relpath(part_path, self.store.base_path))
+        indexed = 0
+        for bank_name, part_paths in by_bank.items():
+            known = self._indexed_parts(bank_name)
+            new_parts = [part_path for part_path in part_paths if part_path not in known]
+            if new_parts:
+                indexed += self._write_segment(bank_name, new_parts)
+                self._merge_segments(bank_name)
+        return indexed
+
+    def search(self, query: str, start=None, end=None, min_amount: Optional[int] = None, max_amount: Optional[int] = None,
+               banks: Optional[Iterable[str]] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        """
+        Returns the transactions that contain every token of `query` in their description,
+        info_extended or origin, within the date and amount ranges.
+        Amounts are compared by their absolute value, so "over 50 EUR" matches both payments and
+        incomes of at least 50 EUR.
+        Args:
+            query (str): Free text, e.g. "amazon"
+            start, end (date-like, optional): Inclusive date range
+            min_amount, max_amount (int, optional): Inclusive range of the absolute amount, in cents
+            banks (list, optional): Bank names to search. All banks if None.
+            limit (int, optional): Maximum number of transactions, the most recent first
+        Returns:
+            pd.DataFrame: Matching transactions sorted by date, most recent first
+        """
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            raise ValueError(f"Invalid search query '{query}'. It should contain at least one word.")
+        first_day = _to_day(start) if start is not None else None
+        last_day = _to_day(end) if end is not None else None
+
+        matches: List[Tuple[np.ndarray, List[str], np.ndarray, np.ndarray]] = []
+        for segment in self._segments(banks):
+            if (first_day is not None and segment.last_day < first_day) or (last_day is not None and segment.first_day > last_day):
+                continue
+            # Intersect the postings from the rarest token on
+            postings = sorted((segment.postings_of(token) for token in tokens), key=len)
+            ids = np.asarray(postings[0])
+            for token_postings in postings[1:]:
+                if not len(ids):
+                    break
+                ids = np.intersect1d(ids, token_postings, assume_unique=True)
+            if not len(ids):
+                continue
+            days = np.asarray(segment.days[ids])
+            amounts = np.asarray(segment.amounts[ids])
+            keep = amounts != _NO_AMOUNT if min_amount is not None or max_amount is not None else np.ones(len(ids), dtype=bool)
+            if first_day is not None:
+                keep &= days >= first_day
+            if last_day is not None:
+                keep &= days <= last_day
+            if min_amount is not None:
+                keep &= np.abs(amounts) >= min_amount
+            if max_amount is not None:
+                keep &= np.abs(amounts) <= max_amount
+            ids = ids[keep]
+            if len(ids):
+                matches.append((days[keep], segment.part_paths, np.asarray(segment.parts[ids]), np.asarray(segment.rows[ids])))
+        if not matches:
+            return pd.DataFrame()
+
+        days = np.concatenate([match[0] for match in matches])
+        locations = [(part_paths[part], int(row)) for _, part_paths, parts, rows in matches for part, row in zip(parts.tolist(), rows.tolist())]
+        order = np.argsort(-days, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return self._read_rows([locations[i] for i in order.tolist()])
+
+    def _read_rows(self, locations: List[Tuple[str, int]]) -> pd.DataFrame:
+        """Reads the transactions at (part path, row) locations, in that order, opening each part file once."""
+        rows_by_part: Dict[str, Tuple[List[int], List[int]]] = {}
+        for position, (part_path, row) in enumerate(locations):
+            rows, positions = rows_by_part.setdefault(part_path, ([], []))
+            rows.append(row)
+            positions.append(position)
+        frames = []
+        for part_path, (rows, positions) in rows_by_part.items():
+            part_df = transaction_store.read_part(os.path.join(self.store.base_path, part_path), None).iloc[rows]
+            frames.append(part_df.set_axis(positions))
+        return unified_dtypes.concat(frames).sort_index().reset_index(drop=True)
+
+    def _write_segment(self, bank_name: str, part_paths: List[str]) -> int:
+        frames = []
+        for part_number, part_path in enumerate(part_paths):
+            df = transaction_store.read_part(os.path.join(self.store.base_path, part_path), None)
+            df = df.reindex(columns=_INDEX_COLUMNS)
+            df["part"] = part_number
+            df["row"] = np.arange(len(df), dtype=np.int32)
+            frames.append(df)
+        df = unified_dtypes.concat(frames, ignore_index=True)
+        if df.empty:
+            return 0
+
+        days = (pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]") - _EPOCH).astype(np.int32)
+        amounts = pd.array(df["amount"], dtype="Int64").fillna(_NO_AMOUNT).to_numpy(dtype=np.int64)
+        tokens, offsets, postings = _build_postings(df)
+        arrays = {"tokens": tokens, "offsets": offsets, "postings": postings, "days": days, "amounts": amounts,
+                  "parts": df["part"].to_numpy(dtype=np.int32), "rows": df["row"].to_numpy(dtype=np.int32)}
+        self._save_segment(bank_name, arrays, {"parts": part_paths})
+        log.info(f"{bank_name}: indexed {len(df)} transactions with {len(tokens)} distinct words for search")
+        return len(df)
+
+    def _merge_segments(self, bank_name: str) -> None:
+        """
+        Merges the smallest segments of a bank into one once it has more than MAX_SEGMENTS, so
+        that half of them are left. Segment sizes then grow geometrically, and each transaction
+        is merged a logarithmic number of times. The postings are merged as they are; the part
+        files are not read again.
+        """
+        segments = self._segments([bank_name])
+        if len(segments) <= MAX_SEGMENTS:
+            return
+        merged = sorted(segments, key=lambda segment: len(segment.days))[:len(segments) - MAX_SEGMENTS // 2 + 1]
+        tokens = np.unique(np.concatenate([np.asarray(segment.tokens) for segment in merged]))
+        total = sum(len(segment.days) for segment in merged)
+        keys, part_paths, parts = [], [], []
+        base = 0
+        for segment in merged:
+            # (merged token id, merged transaction id) of each posting of the segment
+            token_ids = np.repeat(np.searchsorted(tokens, segment.tokens), np.diff(segment.offsets))
+            keys.append(token_ids.astype(np.int64) * total + np.asarray(segment.postings, dtype=np.int64) + base)
+            parts.append(np.asarray(segment.parts) + len(part_paths))
+            part_paths.extend(segment.part_paths)
+            base += len(segment.days)
+        keys = np.sort(np.concatenate(keys))
+        arrays = {"tokens": tokens, "offsets": np.searchsorted(keys // total, np.arange(len(tokens) + 1)).astype(np.int64),
+                  "postings": (keys % total).astype(np.int32),
+                  "days": np.concatenate([np.asarray(segment.days) for segment in merged]),
+                  "amounts": np.concatenate([np.asarray(segment.amounts) for segment in merged]),
+                  "parts": np.concatenate(parts).astype(np.int32),
+                  "rows": np.concatenate([np.asarray(segment.rows) for segment in merged])}
+        self._save_segment(bank_name, arrays, {"parts": part_paths,
+                                               "replaces": [os.path.basename(segment.path) for segment in merged]})
+        for segment in merged:
+            self._remove_segment(segment)
+        log.info(f"{bank_name}: merged {len(merged)} search index segments with {total} transactions")
+
+    def _save_segment(self, bank_name: str, arrays: Dict[str, np.ndarray], meta: Dict) -> None:
+        bank_dir = os.path.join(self.path, bank_name)
+        os.makedirs(bank_dir, exist_ok=True)
+        segment_name = f"{self.SEGMENT_PREFIX}{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        tmp_dir = os.path.join(bank_dir, f".{segment_name}.tmp")
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        days = arrays["days"]
+        save_json_atomic(os.path.join(tmp_dir, _Segment.META_FILE),
+                         {**meta, "first_day": int(days.min()), "last_day": int(days.max())})
+        # Readers never see a half-written segment
+        os.replace(tmp_dir, os.path.join(bank_dir, segment_name))
+
+    def _remove_segment(self, segment: _Segment) -> None:
+        self._opened.pop(segment.path, None)
+        # Release the memory maps before the files are removed
+        segment._arrays.clear()
+        shutil.rmtree(segment.path, ignore_errors=True)
+
+    def _indexed_parts(self, bank_name: str) -> Set[str]:
+        return {part_path for segment in self._segments([bank_name]) for part_path in segment.part_paths}
+
+    def _segments(self, banks: Optional[Iterable[str]] = None) -> List[_Segment]:
+        bank_names = banks if banks is not None else [entry.name for entry in os.scandir(self.path) if entry.is_dir()]
+        segments = []
+        for bank_name in sorted(bank_names):
+            bank_dir = os.path.join(self.path, bank_name)
+            if not os.path.isdir(bank_dir):
+                continue
+            bank_segments = [self._open_segment(entry.path) for entry in sorted(os.scandir(bank_dir), key=lambda entry: entry.name)
+                             if entry.is_dir() and entry.name.startswith(self.SEGMENT_PREFIX)]
+            # Segments that were merged, but not removed yet
+            replaced = {name for segment in bank_segments for name in segment.replaces}
+            for segment in bank_segments:
+                if os.path.basename(segment.path) in replaced:
+                    self._remove_segment(segment)
+                else:
+                    segments.append(segment)
+        return segments
+
+    def _open_segment(self, path: str) -> _Segment:
+        segment = self._opened.get(path)
+        if segment is None:
+            segment = self._opened[path] = _Segment(path)
+        return segment
+
+def _build_postings(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds the postings of the text columns of a DataFrame. Each distinct text is tokenized
+    once; the (token, transaction) pairs of the rows are then expanded with numpy.
+    Returns:
+        tuple: sorted tokens, offsets of the postings of each token (one more than tokens), and
+        the concatenated postings, each sorted by transaction id
+    """
+    token_ids: Dict[str, int] = {}
+    pair_keys = []
+    for column in TEXT_COLUMNS:
+        codes, uniques = pd.factorize(df[column], use_na_sentinel=True)
+        value_tokens = [[token_ids.setdefault(token, len(token_ids)) for token in set(tokenize(str(value)))] for value in uniques]
+        # Code -1 (missing text) has no tokens
+        lengths = np.array([len(tokens) for tokens in value_tokens] + [0], dtype=np.int64)
+        value_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        flat_tokens = np.fromiter((token for tokens in value_tokens for token in tokens), dtype=np.int64, count=int(lengths.sum()))
+        row_lengths = lengths[codes]
+        docs = np.repeat(np.arange(len(df), dtype=np.int64), row_lengths)
+        # Position of each pair within the tokens of its row
+        within = np.arange(len(docs), dtype=np.int64) - np.repeat(np.cumsum(row_lengths) - row_lengths, row_lengths)
+        pair_tokens = flat_tokens[np.repeat(value_offsets[codes], row_lengths) + within]
+        pair_keys.append(pair_tokens * len(df) + docs)
+
+    # Renumber the tokens in sorted order, so the token array can be binary-searched
+    tokens = np.array(sorted(token_ids), dtype=str) if token_ids else np.zeros(0, dtype="<U1")
+    sorted_ids = np.empty(len(token_ids), dtype=np.int64)
+    sorted_ids[[token_ids[token] for token in tokens.tolist()]] = np.arange(len(token_ids))
+    keys = np.concatenate(pair_keys) if pair_keys else np.zeros(0, dtype=np.int64)
+    keys = np.sort(sorted_ids[keys // len(df)] * len(df) + keys % len(df))
+    # A token in several columns of the same row gives repeated pairs
+    keys = keys[np.append(True, keys[1:] != keys[:-1])] if len(keys) else keys
+    postings = (keys % len(df)).astype(np.int32)
+    offsets = np.searchsorted(keys // len(df), np.arange(len(tokens) + 1)).astype(np.int64)
+    return tokens, offsets, postings
+
+def _to_day(value) -> int:
+    return int((np.datetime64(pd.Timestamp(value).date(), "D") - _EPOCH).astype(np.int64))
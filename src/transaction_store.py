@@ -0,0 +1,169 @@
+# On-disk store of the unified transactions (BD2).
+# Transactions are partitioned by bank and month, e.g. <base_path>/bank=DB/month=2024-01/part-*.parquet
+# Appending only adds new part files to the affected partitions, the history is never rewritten.
+import os
+import uuid
+import time
+import pandas as pd
+import unified_dtypes as unified_dtypes
+from typing import Iterable, List, Optional, Tuple
+from utils.utils import log
+
+# Parquet files need pyarrow; without it the partitions are stored as pickle files
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+PARQUET_EXTENSION = ".parquet"
+PICKLE_EXTENSION = ".pkl"
+
+
+class TransactionStore:
+    BANK_PREFIX = "bank="
+    MONTH_PREFIX = "month="
+    MONTH_FORMAT = "%Y-%m"
+
+    def __init__(self, base_path: str):
+        if not isinstance(base_path, str) or not base_path:
+            raise ValueError(f"Invalid store path '{base_path}'. It should be a non-empty string.")
+        self.base_path = base_path
+        os.makedirs(self.base_path, exist_ok=True)
+
+    def __str__(self):
+        return f"TransactionStore({self.base_path})"
+
+    def append(self, df: pd.DataFrame) -> List[str]:
+        """
+        Appends unified transactions to the store. Only one new part file per touched
+        (bank, month) partition is written; existing files are left untouched.
+        Args:
+            df (pd.DataFrame): Unified DataFrame with at least the 'bank' and 'date' columns
+        Returns:
+            list: Paths of the written part files
+        Raises:
+            ValueError: If the DataFrame lacks the 'bank' or 'date' column
+        """
+        missing = [column for column in ("bank", "date") if column not in df.columns]
+        if missing:
+            raise ValueError(f"Cannot store transactions without the columns {missing}.")
+        if df.empty:
+            return []
+
+        undated = df["date"].isna()
+        if undated.any():
+            log.warning(f"{int(undated.sum())} transactions without a date were not stored.")
+            df = df[~undated]
+
+        months = df["date"].dt.strftime(self.MONTH_FORMAT)
+        written = []
+        for (bank_name, month), partition_df in df.groupby([df["bank"], months], sort=True, observed=True):
+            partition_dir = self._partition_dir(str(bank_name), month)
+            os.makedirs(partition_dir, exist_ok=True)
+            written.append(_write_part(partition_df.reset_index(drop=True), partition_dir))
+        log.info(f"Stored {len(df)} transactions in {len(written)} partitions of {self}")
+        return written
+
+    def partitions(self, banks: Optional[Iterable[str]] = None, start=None, end=None) -> List[Tuple[str, str, str]]:
+        """
+        Lists the partitions that may contain transactions of the given banks and date range.
+        Pruning uses only the directory names, no file is opened.
+        Args:
+            banks (list, optional): Bank names to keep. All banks if None.
+            start, end (date-like, optional): Inclusive date range to keep.
+        Returns:
+            list: Tuples of (bank name, month as 'YYYY-MM', partition directory)
+        """
+        bank_filter = set(banks) if banks is not None else None
+        first_month = pd.Timestamp(start).strftime(self.MONTH_FORMAT) if start is not None else None
+        last_month = pd.Timestamp(end).strftime(self.MONTH_FORMAT) if end is not None else None
+
+        found = []
+        for bank_entry in sorted(_list_dirs(self.base_path, self.BANK_PREFIX)):
+            bank_name = bank_entry[len(self.BANK_PREFIX):]
+            if bank_filter is not None and bank_name not in bank_filter:
+                continue
+            bank_dir = os.path.join(self.base_path, bank_entry)
+            for month_entry in sorted(_list_dirs(bank_dir, self.MONTH_PREFIX)):
+                month = month_entry[len(self.MONTH_PREFIX):]
+                if first_month is not None and month < first_month:
+                    continue
+                if last_month is not None and month > last_month:
+                    continue
+                found.append((bank_name, month, os.path.join(bank_dir, month_entry)))
+        return found
+
+    def read(self, columns: Optional[List[str]] = None, banks: Optional[Iterable[str]] = None, start=None, end=None) -> pd.DataFrame:
+        """
+        Reads transactions from the store. Only the partitions of the requested banks and
+        months are opened, and only the requested columns are read from them.
+        Args:
+            columns (list, optional): Columns to read. All columns if None.
+            banks (list, optional): Bank names to read. All banks if None.
+            start, end (date-like, optional): Inclusive date range to read.
+        Returns:
+            pd.DataFrame: Transactions sorted by partition (bank, month)
+        """
+        read_columns = None
+        if columns is not None:
+            read_columns = list(columns)
+            if (start is not None or end is not None) and "date" not in read_columns:
+                read_columns.append("date")
+
+        frames = []
+        for _, _, partition_dir in self.partitions(banks, start, end):
+            for part_path in list_parts(partition_dir):
+                frames.append(read_part(part_path, read_columns))
+        if not frames:
+            return pd.DataFrame(columns=columns if columns is not None else [])
+
+        df = unified_dtypes.concat(frames, ignore_index=True)
+        if start is not None:
+            df = df[df["date"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["date"] <= pd.Timestamp(end)]
+        if columns is not None:
+            df = df[list(columns)]
+        return df.reset_index(drop=True)
+
+    def _partition_dir(self, bank_name: str, month: str) -> str:
+        return os.path.join(self.base_path, f"{self.BANK_PREFIX}{bank_name}", f"{self.MONTH_PREFIX}{month}")
+
+def _list_dirs(path: str, prefix: str) -> List[str]:
+    if not os.path.isdir(path):
+        return []
+    return [entry.name for entry in os.scandir(path) if entry.is_dir() and entry.name.startswith(prefix)]
+
+def list_parts(partition_dir: str) -> List[str]:
+    """Returns the part files of a partition folder, oldest first."""
+    return sorted(
+        entry.path for entry in os.scandir(partition_dir)
+        if entry.is_file() and entry.name.startswith("part-")
+        and entry.name.endswith((PARQUET_EXTENSION, PICKLE_EXTENSION))
+    )
+
+def _write_part(df: pd.DataFrame, partition_dir: str) -> str:
+    """
+    Writes a new part file. The file is written under a temporary name and then renamed,
+    so readers never see a half-written part.
+    """
+    extension = PARQUET_EXTENSION if PARQUET_AVAILABLE else PICKLE_EXTENSION
+    # Part names sort by creation time
+    part_path = os.path.join(partition_dir, f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}{extension}")
+    tmp_path = os.path.join(partition_dir, f".{os.path.basename(part_path)}.tmp")
+    if PARQUET_AVAILABLE:
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, part_path)
+    return part_path
+
+def read_part(part_path: str, columns: Optional[List[str]]) -> pd.DataFrame:
+    """Reads the given columns, or all of them if None, of a part file."""
+    if part_path.endswith(PARQUET_EXTENSION):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError(f"Reading '{part_path}' requires pyarrow. Please install it.")
+        return pd.read_parquet(part_path, columns=columns)
+    df = pd.read_pickle(part_path)
+    return df[columns] if columns is not None else df
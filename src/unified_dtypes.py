@@ -0,0 +1,63 @@
+# Compact in-memory types of the unified transactions (BD2).
+# Amounts are Int64 cents and dates datetime64. Texts are Arrow-backed strings when pyarrow is
+# installed, and the columns whose values repeat from row to row (bank, IBAN, origin and
+# transaction type) are categoricals: each distinct value is stored once and every row keeps a
+# small integer code.
+# Frames with categoricals must be concatenated with `concat`: pd.concat turns categoricals with
+# different categories, e.g. those of two part files, back into object columns.
+from typing import Iterable
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = pd.StringDtype("python")
+
+# Unified text columns stored as categoricals
+CATEGORY_COLUMNS = ["bank", "iban", "origin", "transaction_type"]
+# Unified text columns stored as strings
+STRING_COLUMNS = ["description", "info_extended"]
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a unified DataFrame with the compact types of its text columns. Columns that
+    already have them are not copied, so compacting a compact DataFrame is cheap.
+    """
+    converted = {}
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not _is_compact_category(df[column]):
+            values = df[column].astype(STRING_DTYPE) if not isinstance(df[column].dtype, pd.CategoricalDtype) else df[column]
+            codes, categories = pd.factorize(values, sort=True, use_na_sentinel=True)
+            converted[column] = pd.Series(pd.Categorical.from_codes(codes, pd.Index(categories, dtype=STRING_DTYPE)),
+                                          index=df.index, name=column)
+    for column in STRING_COLUMNS:
+        if column in df.columns and df[column].dtype != STRING_DTYPE:
+            converted[column] = df[column].astype(STRING_DTYPE)
+    return df.assign(**converted) if converted else df
+
+def concat(frames: Iterable[pd.DataFrame], ignore_index: bool = False) -> pd.DataFrame:
+    """
+    Concatenates unified DataFrames, keeping their categorical columns categorical: the
+    categories of each column are first unified across the frames.
+    """
+    frames = [compact(df) for df in frames]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True) if ignore_index else frames[0]
+    for column in CATEGORY_COLUMNS:
+        if not all(column in df.columns for df in frames):
+            continue
+        categories = frames[0][column].cat.categories
+        if all(df[column].cat.categories.equals(categories) for df in frames[1:]):
+            continue
+        categories = pd.Index(sorted(set().union(*(df[column].cat.categories for df in frames))), dtype=STRING_DTYPE)
+        frames = [df.assign(**{column: df[column].cat.set_categories(categories)}) for df in frames]
+    return pd.concat(frames, ignore_index=ignore_index)
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """Returns the bytes used by a DataFrame, including the contents of its strings."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def _is_compact_category(series: pd.Series) -> bool:
+    return isinstance(series.dtype, pd.CategoricalDtype) and series.cat.categories.dtype == STRING_DTYPE
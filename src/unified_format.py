@@ -1,8 +1,7 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, List, Optional
-import banks_format as banks
-import pandas as pd
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 class ParameterType(Enum):
     """Defines the data types for bank transaction parameters."""
@@ -35,13 +34,14 @@ class UnifiedHeaders:
     
     # Define class variables as BankParamType instances
     date =              BankEntryType("Fecha",                   ParameterType.DATE,                   True)  
-    #bank =              BankParamType("Banco",                   ParameterType.TEXT,                  False)
+    bank =              BankEntryType("Banco",                   ParameterType.TEXT,                   False)
     amount =            BankEntryType("Importe",                 ParameterType.CURRENCY,               True)
     transaction_type =  BankEntryType("Tipo de transacción",     ParameterType.TEXT,                   False)
     iban =              BankEntryType("IBAN",                    ParameterType.TEXT,                   False)
     origin =            BankEntryType("Origen",                  ParameterType.TEXT,                   False)
     description =       BankEntryType("Descripción",             ParameterType.TEXT,                   True)
     info_extended =     BankEntryType("Descripción extendida",   ParameterType.TEXT,                   False)
+    balance =           BankEntryType("Saldo",                   ParameterType.CURRENCY,               False)
     unused =            BankEntryType("Unused",                  ParameterType.TEXT,                   False)
 
     @classmethod
@@ -52,16 +52,7 @@ class UnifiedHeaders:
         Returns:
             dict: Dictionary mapping column names to BankParamType objects
         """
-        mandatory_cols = {}
-        
-        for attr_name in dir(cls):
-            # Skip private/magic attributes
-            if not attr_name.startswith('_'):
-                attr_value = getattr(cls, attr_name)
-                # Check if it's a BankParamType instance and if it's mandatory
-                if isinstance(attr_value, BankEntryType) and attr_value.mandatory:
-                    mandatory_cols[attr_name] = attr_value
-        return mandatory_cols
+        return {attr_name: attr_value for attr_name, attr_value in _scan_columns(cls) if attr_value.mandatory}
     
     @classmethod
     def get_all_columns(cls) -> Dict[str, BankEntryType]:
@@ -71,17 +62,7 @@ class UnifiedHeaders:
         Returns:
             dict: Dictionary mapping column names to BankParamType objects
         """
-        all_cols = {}
-        
-        for attr_name in dir(cls):
-            # Skip private/magic attributes
-            if not attr_name.startswith('_'):
-                attr_value = getattr(cls, attr_name)
-                # Check if it's a BankParamType instance
-                if isinstance(attr_value, BankEntryType):
-                    all_cols[attr_name] = attr_value
-
-        return all_cols
+        return dict(_scan_columns(cls))
     
     @classmethod
     def validate_minimum_column_mapping(cls, header_map: Dict, bank_name: str) -> None:
@@ -98,3 +79,18 @@ class UnifiedHeaders:
             missing_names = ", ".join(missing)
             raise ValueError(f"Missing mandatory columns {missing_names} in header_map of bank '{bank_name}'. Please add it to the header mapping.")
 
+@lru_cache(maxsize=None)
+def _scan_columns(cls) -> Tuple[Tuple[str, BankEntryType], ...]:
+    """
+    Walks the attributes of a headers class once and returns its BankEntryType columns,
+    sorted by attribute name.
+    """
+    columns = []
+    for attr_name in dir(cls):
+        # Skip private/magic attributes
+        if not attr_name.startswith('_'):
+            attr_value = getattr(cls, attr_name)
+            # Check if it's a BankParamType instance
+            if isinstance(attr_value, BankEntryType):
+                columns.append((attr_name, attr_value))
+    return tuple(columns)
@@ -0,0 +1,40 @@
+# Reading and writing of the JSON files kept next to BD2 and the bank files: the import manifest,
+# the coverage, balance and rollup indexes and the metrics.
+# Files are written to a temporary file that then replaces the old one, so a reader, or the next
+# run after a crash, never sees a half-written file.
+import json
+import os
+from contextlib import contextmanager
+from typing import Any, Iterator, TextIO
+
+
+def load_json(path: str) -> Any:
+    """
+    Loads a JSON file.
+    Raises:
+        RuntimeError: If the file is not valid JSON
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            raise RuntimeError(f"Error parsing '{path}': {e}")
+
+def save_json_atomic(path: str, data: Any, **kwargs) -> None:
+    """
+    Writes `data` as JSON with atomic_write. Keyword arguments are passed to json.dump.
+    """
+    with atomic_write(path) as f:
+        json.dump(data, f, **kwargs)
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[TextIO]:
+    """
+    Opens a temporary text file that replaces `path` once the block exits without errors.
+    The folder of `path` is created if needed.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        yield f
+    os.replace(tmp_path, path)
@@ -0,0 +1,205 @@
+# Per-stage metrics of the imports: wall time, rows, bytes read and peak memory per bank and stage.
+# Stages are measured with `with metrics.stage(bank_name, "load") as stage:`. While no collector
+# is active, stage() returns a shared no-op object, so instrumented code costs one global lookup.
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+from utils.json_files import atomic_write
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Not available on Windows: peak memory is not reported
+    RESOURCE_AVAILABLE = False
+
+# Stages of an import, in pipeline order
+STAGES = ["load", "validate", "convert", "classify", "dedupe", "store"]
+# Formats of the metrics file written next to the log file
+FILE_FORMATS = {"json": ".metrics.json", "prometheus": ".prom"}
+
+
+@dataclass
+class StageMetrics:
+    """Totals of one stage of one bank. peak_memory is the peak RSS of the process, in bytes."""
+    seconds: float = 0.0
+    rows: int = 0
+    bytes_read: int = 0
+    peak_memory: Optional[int] = None
+    calls: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def merge(self, other: "StageMetrics") -> None:
+        self.seconds += other.seconds
+        self.rows += other.rows
+        self.bytes_read += other.bytes_read
+        self.calls += other.calls
+        if other.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, other.peak_memory)
+
+
+class _StageTimer:
+    """
+    Measures one run of a stage. Time spent in nested stages is left out, so the stages of a
+    bank add up to its total time.
+    """
+
+    def __init__(self, collector: "MetricsCollector", key: Tuple[str, str]):
+        self._collector = collector
+        self._key = key
+        self._rows = 0
+        self._bytes_read = 0
+        self._nested_seconds = 0.0
+        self._start = 0.0
+
+    def add(self, rows: int = 0, bytes_read: int = 0) -> None:
+        self._rows += rows
+        self._bytes_read += bytes_read
+
+    def __enter__(self) -> "_StageTimer":
+        self._collector._open.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._start
+        self._collector._open.pop()
+        if self._collector._open:
+            self._collector._open[-1]._nested_seconds += elapsed
+        self._collector.record(self._key[0], self._key[1], StageMetrics(
+            elapsed - self._nested_seconds, self._rows, self._bytes_read, _peak_memory(), 1))
+
+
+class _NullStage:
+    """Stage of a disabled collector: does nothing."""
+    __slots__ = ()
+
+    def add(self, rows: int = 0, bytes_read: int = 0) -> None:
+        pass
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+
+class MetricsCollector:
+
+    def __init__(self):
+        self.stages: Dict[Tuple[str, str], StageMetrics] = {}
+        # Stages can be measured from several threads at once, e.g. while reading the exports of a bank
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _open(self) -> List[_StageTimer]:
+        """Stages open in the current thread, innermost last."""
+        if not hasattr(self._local, "open"):
+            self._local.open = []
+        return self._local.open
+
+    def stage(self, bank_name: str, stage_name: str) -> _StageTimer:
+        return _StageTimer(self, (bank_name, stage_name))
+
+    def record(self, bank_name: str, stage_name: str, stage_metrics: StageMetrics) -> None:
+        with self._lock:
+            self.stages.setdefault((bank_name, stage_name), StageMetrics()).merge(stage_metrics)
+
+    def merge(self, records: List[Tuple[str, str, StageMetrics]]) -> None:
+        """Adds the records of another collector, e.g. one that ran in a worker process."""
+        for bank_name, stage_name, stage_metrics in records:
+            self.record(bank_name, stage_name, stage_metrics)
+
+    def get_records(self) -> List[Tuple[str, str, StageMetrics]]:
+        """Returns (bank, stage, metrics) records, which can be sent back from a worker process."""
+        return [(bank_name, stage_name, stage_metrics) for (bank_name, stage_name), stage_metrics in self.stages.items()]
+
+    def format_summary(self) -> List[str]:
+        """Returns a table with one line per bank and stage, in pipeline order."""
+        stage_order = {stage_name: i for i, stage_name in enumerate(STAGES)}
+        lines = [f"{'Bank':<10}{'Stage':<10}{'Time (s)':>10}{'Rows':>12}{'Rows/s':>12}{'MB read':>10}{'Peak MB':>10}"]
+        for (bank_name, stage_name), m in sorted(self.stages.items(), key=lambda item: (item[0][0], stage_order.get(item[0][1], len(STAGES)))):
+            peak = f"{m.peak_memory / 2**20:.0f}" if m.peak_memory is not None else "-"
+            mb_read = f"{m.bytes_read / 2**20:.1f}" if m.bytes_read else "-"
+            lines.append(f"{bank_name:<10}{stage_name:<10}{m.seconds:>10.3f}{m.rows:>12,}{m.rows_per_second:>12,.0f}{mb_read:>10}{peak:>10}")
+        return lines
+
+    def write(self, metrics_path: str, file_format: str = "json") -> None:
+        """
+        Writes the metrics as JSON or in the Prometheus textfile format.
+        Raises:
+            ValueError: If the format is not one of FILE_FORMATS
+        """
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"Invalid metrics format '{file_format}'. Available options: {list(FILE_FORMATS)}")
+        with atomic_write(metrics_path) as f:
+            if file_format == "json":
+                json.dump([{"bank": bank_name, "stage": stage_name, **asdict(m), "rows_per_second": m.rows_per_second}
+                           for (bank_name, stage_name), m in self.stages.items()], f, indent=2)
+            else:
+                f.write(self._format_prometheus())
+
+    def _format_prometheus(self) -> str:
+        metrics = [
+            ("bank_import_stage_seconds", "Wall time of the import stage", lambda m: m.seconds),
+            ("bank_import_stage_rows", "Rows handled by the import stage", lambda m: m.rows),
+            ("bank_import_stage_bytes_read", "Bytes read by the import stage", lambda m: m.bytes_read),
+            ("bank_import_stage_peak_memory_bytes", "Peak RSS of the process at the end of the import stage", lambda m: m.peak_memory),
+        ]
+        lines = []
+        for name, help_text, value in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for (bank_name, stage_name), m in self.stages.items():
+                if value(m) is not None:
+                    lines.append(f'{name}{{bank="{_escape_label(bank_name)}",stage="{stage_name}"}} {value(m)}')
+        return "\n".join(lines) + "\n"
+
+
+_active: Optional[MetricsCollector] = None
+
+def stage(bank_name: str, stage_name: str):
+    """
+    Returns a context manager that measures a stage in the active collector, or a no-op one.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(bank_name, stage_name)
+
+@contextmanager
+def collecting(enabled: bool = True) -> Iterator[Optional[MetricsCollector]]:
+    """
+    Activates a new collector for the duration of the block, or none if not `enabled`.
+    The previously active collector is restored afterwards.
+    """
+    global _active
+    previous = _active
+    _active = MetricsCollector() if enabled else None
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+def get_metrics_path(log_path: str, file_format: str = "json") -> str:
+    """Returns the path of the metrics file kept next to a log file."""
+    return os.path.splitext(log_path)[0] + FILE_FORMATS[file_format]
+
+def _peak_memory() -> Optional[int]:
+    if not RESOURCE_AVAILABLE:
+        return None
+    # Linux reports KB, macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,5 +1,5 @@
 import logging as log
-from datetime import datetime
+from datetime import date, datetime
 import os
 
 # Add colorama for colored console output
@@ -46,6 +46,8 @@ def setup_logging(show_time=False, show_logger=False, show_level=False, log_to_f
         show_logger (bool): Include logger name in log output
         show_level (bool): Include log level in log output
         log_to_file (bool): Enable or disable logging to a file
+    Returns:
+        str: Path of the log file, or None if not logging to a file
     """
     # Build log format string
     format_parts = []
@@ -62,6 +64,7 @@ def setup_logging(show_time=False, show_logger=False, show_level=False, log_to_f
     handlers = []
 
     # Add file handler if enabled
+    log_file = None
     if log_to_file:
         log_dir = "logs"
         os.makedirs(log_dir, exist_ok=True)
@@ -82,13 +85,16 @@ def setup_logging(show_time=False, show_logger=False, show_level=False, log_to_f
         level=log.INFO,
         handlers=handlers
     )
-    
-def print_processing_summary(results):
+    return log_file
+
+def print_processing_summary(results, coverage_warnings=None, metrics_collector=None):
     """
     Print a summary of processing results for banks.
     
     Args:
         results (dict): Dictionary mapping bank names to True/False for success
+        coverage_warnings (list): Optional gap and overlap warnings of the imported date ranges
+        metrics_collector (MetricsCollector): Optional per-stage metrics of the imported files
     """
     log.info("\n" + "="*50)
     log.info("PROCESSING SUMMARY")
@@ -103,3 +109,27 @@ def print_processing_summary(results):
         log.error(f"Failed to process: {', '.join(failed)}")
 
     log.info(f"Total: {len(results)} banks, {len(successful)} successful, {len(failed)} failed")
+
+    if coverage_warnings:
+        gaps = [warning for warning in coverage_warnings if warning.kind == "gap"]
+        overlaps = [warning for warning in coverage_warnings if warning.kind == "overlap"]
+        for warning in gaps:
+            log.warning(f"Potential gap: {warning}")
+        for warning in overlaps:
+            log.info(f"Overlap: {warning}")
+        log.info(f"Date coverage: {len(gaps)} potential gaps, {len(overlaps)} overlaps with imported data")
+
+    if metrics_collector is not None and metrics_collector.stages:
+        log.info("")
+        for line in metrics_collector.format_summary():
+            log.info(line)
+
+def to_date(value) -> date:
+    """
+    Returns a date given as an ISO string ('YYYY-MM-DD'), a datetime or pd.Timestamp, or a date.
+    """
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if hasattr(value, "date") and callable(value.date):
+        return value.date()
+    return value
@@ -0,0 +1,198 @@
+# Value and format consistency checks of the bank CSV data (requirement 1.5).
+# Columns are checked as a whole, once per distinct value, and every problem is recorded as a bit
+# in a per-row error mask instead of raising on the first bad cell.
+from dataclasses import dataclass, field
+from enum import IntFlag
+from typing import Dict, List, Optional, Tuple
+import re
+import numpy as np
+import pandas as pd
+import banks_format as banks_format
+import parse_plan as parse_plan
+import unified_format as udb
+from utils.utils import log
+
+# Words accepted as yes/no values
+BOOLEAN_VALUES = {
+    "true": True, "1": True, "yes": True, "y": True, "si": True, "sí": True, "ja": True, "x": True,
+    "false": False, "0": False, "no": False, "n": False, "nein": False,
+}
+# Currency symbols and codes allowed around an amount
+_CURRENCY_PATTERN = r"[\s€]|EUR"
+# Control characters and the replacement character left by a wrong encoding
+_INVALID_TEXT_PATTERN = "[\\x00-\\x08\\x0b\\x0c\\x0e-\\x1f\ufffd]"
+
+
+class ValidationError(IntFlag):
+    """Bits of the per-row error masks."""
+    MISSING = 1             # Mandatory value is empty
+    INVALID_DATE = 2        # Date does not match the date format
+    INVALID_AMOUNT = 4      # Amount is not a number
+    DECIMAL_SEPARATOR = 8   # Amount uses the other decimal separator than the rest of the file
+    INVALID_BOOLEAN = 16    # Not a yes/no value
+    INVALID_TEXT = 32       # Text with control or replacement characters
+
+
+@dataclass
+class ValidationReport:
+    """
+    Errors found in a DataFrame loaded from a bank CSV file.
+    column_errors maps each checked CSV column, and each mandatory unified column for MISSING
+    errors, to a uint8 array with the ValidationError bits of every row.
+    """
+    row_count: int
+    decimal: str
+    thousands: str
+    date_formats: Dict[str, str] = field(default_factory=dict)
+    column_errors: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def row_errors(self) -> np.ndarray:
+        """Returns the combined error bits of every row."""
+        errors = np.zeros(self.row_count, dtype=np.uint8)
+        for column_errors in self.column_errors.values():
+            errors |= column_errors
+        return errors
+
+    @property
+    def is_valid(self) -> bool:
+        return not any(column_errors.any() for column_errors in self.column_errors.values())
+
+    def error_rows(self) -> np.ndarray:
+        """Returns the positions of the rows with at least one error."""
+        return np.flatnonzero(self.row_errors)
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Returns the number of rows with each error, per column. Columns without errors are left out."""
+        counts = {}
+        for column, column_errors in self.column_errors.items():
+            column_counts = {flag.name: int(np.count_nonzero(column_errors & flag)) for flag in ValidationError}
+            column_counts = {name: count for name, count in column_counts.items() if count}
+            if column_counts:
+                counts[column] = column_counts
+        return counts
+
+    def log_summary(self, bank_name: str, max_examples: int = 5) -> None:
+        if self.is_valid:
+            log.info(f"All {self.row_count} rows of {bank_name} passed the value checks.")
+            return
+        for column, column_counts in self.counts().items():
+            rows = np.flatnonzero(self.column_errors[column])[:max_examples].tolist()
+            details = ", ".join(f"{count} {name.lower().replace('_', ' ')}" for name, count in column_counts.items())
+            log.warning(f"{bank_name} column '{column}': {details} (rows {rows}...)")
+        log.warning(f"{bank_name}: {len(self.error_rows())} of {self.row_count} rows have invalid values.")
+
+
+def validate_dataframe(df: pd.DataFrame, bank: banks_format.Bank, decimal: Optional[str] = None) -> ValidationReport:
+    """
+    Checks every mapped column of a DataFrame loaded from a bank CSV file against the type of
+    its unified column, and that no row lacks a mandatory value.
+    Args:
+        df (pd.DataFrame): DataFrame loaded from the bank CSV file
+        bank (banks_format.Bank): Bank instance containing the header_map
+        decimal (str, optional): Decimal separator of the file. Inferred from the amounts if not given,
+            e.g. from the first chunk of a file to check the following chunks.
+    Returns:
+        ValidationReport: Per-row error masks of every column
+    """
+    sources = parse_plan.get_parse_plan(bank).sources(df.columns)
+
+    currency_columns = [column for entry, columns in sources.items() if entry.parameter_type == udb.ParameterType.CURRENCY for column in columns]
+    if decimal is None:
+        decimal = infer_decimal_separator([df[column] for column in currency_columns], bank.csv_decimal)
+    report = ValidationReport(len(df), decimal, "," if decimal == "." else ".")
+
+    for entry, columns in sources.items():
+        present = np.zeros(len(df), dtype=bool)
+        for column in columns:
+            codes, uniques = pd.factorize(df[column], use_na_sentinel=True)
+            values = pd.Series(uniques, dtype=object).astype("string").str.strip()
+            unique_errors = _check_values(values, entry.parameter_type, bank, report, column)
+            # Empty values never have format errors; code -1 (missing value) picks the trailing 0
+            unique_errors = np.append(np.where(values.fillna("") == "", 0, unique_errors), 0).astype(np.uint8)
+            unique_present = np.append((values.fillna("") != "").to_numpy(dtype=bool), False)
+            report.column_errors[column] = unique_errors[codes]
+            present |= unique_present[codes]
+        if entry.mandatory:
+            name = _get_column_name(entry)
+            report.column_errors[name] = np.where(present, 0, ValidationError.MISSING).astype(np.uint8)
+
+    # Mandatory unified columns without any source column are missing in every row
+    for name, entry in udb.UnifiedHeaders.get_mandatory_columns().items():
+        if entry not in sources:
+            report.column_errors[name] = np.full(len(df), ValidationError.MISSING, dtype=np.uint8)
+    return report
+
+def infer_decimal_separator(columns: List[pd.Series], default: str = ".") -> str:
+    """
+    Infers the decimal separator of a file from its amount columns.
+    The last separator of an amount is its decimal separator when both separators are used
+    ("1.234,56") or when it is not followed by exactly three digits ("12,5"). Amounts such as
+    "1.234" are ambiguous and not counted.
+    Args:
+        columns (list): Amount columns
+        default (str): Separator returned when no amount gives evidence
+    Returns:
+        str: "." or ","
+    """
+    evidence = {".": 0, ",": 0}
+    for column in columns:
+        values, counts = _distinct_with_counts(column)
+        text = values.str.replace(_CURRENCY_PATTERN, "", regex=True)
+        for separator, other in ((".", ","), (",", ".")):
+            decimal, thousands = re.escape(separator), re.escape(other)
+            pattern = rf".*{decimal}(\d{{1,2}}|\d{{4,}})|.*{thousands}.*{decimal}\d+"
+            matches = text.str.fullmatch(pattern).fillna(False).to_numpy(dtype=bool)
+            evidence[separator] += int(counts[matches].sum())
+    if evidence["."] == evidence[","]:
+        return default
+    return max(evidence, key=evidence.get)
+
+def detect_date_format(values: pd.Series, sample_size: int = 1000) -> str:
+    """
+    Returns the date format of Bank.DATE_FORMATS that parses most values of a sample.
+    """
+    sample = values.dropna().drop_duplicates().head(sample_size)
+    best_format, best_count = banks_format.Bank.DATE_FORMATS[0], -1
+    for date_format in banks_format.Bank.DATE_FORMATS:
+        count = pd.to_datetime(sample, format=date_format, errors="coerce").notna().sum()
+        if count > best_count:
+            best_format, best_count = date_format, count
+    return best_format
+
+def _check_values(values: pd.Series, parameter_type: udb.ParameterType, bank: banks_format.Bank,
+                  report: ValidationReport, column: str) -> np.ndarray:
+    """
+    Returns the error bits of distinct, stripped values of a column.
+    """
+    if parameter_type == udb.ParameterType.DATE:
+        date_format = bank.csv_date_format or detect_date_format(values)
+        report.date_formats[column] = date_format
+        parsed = pd.to_datetime(values, format=date_format, errors="coerce")
+        return np.where(parsed.isna(), ValidationError.INVALID_DATE, 0)
+    if parameter_type == udb.ParameterType.CURRENCY:
+        text = values.str.replace(_CURRENCY_PATTERN, "", regex=True)
+        valid = text.str.fullmatch(_amount_pattern(report.decimal, report.thousands)).fillna(False)
+        swapped = text.str.fullmatch(_amount_pattern(report.thousands, report.decimal)).fillna(False)
+        return np.select([valid.to_numpy(dtype=bool), swapped.to_numpy(dtype=bool)],
+                         [0, ValidationError.DECIMAL_SEPARATOR], ValidationError.INVALID_AMOUNT)
+    if parameter_type == udb.ParameterType.BOOLEAN:
+        known = values.str.lower().isin(list(BOOLEAN_VALUES)).to_numpy(dtype=bool)
+        return np.where(known, 0, ValidationError.INVALID_BOOLEAN)
+    invalid = values.str.contains(_INVALID_TEXT_PATTERN, regex=True).fillna(False).to_numpy(dtype=bool)
+    return np.where(invalid, ValidationError.INVALID_TEXT, 0)
+
+def _amount_pattern(decimal: str, thousands: str) -> str:
+    decimal, thousands = re.escape(decimal), re.escape(thousands)
+    return rf"[+-]?(\d{{1,3}}({thousands}\d{{3}})+|\d+)({decimal}\d+)?-?"
+
+def _distinct_with_counts(column: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    values = pd.Series(uniques, dtype=object).astype("string").str.strip()
+    return values, np.bincount(codes, minlength=len(uniques))
+
+def _get_column_name(entry: udb.BankEntryType) -> str:
+    for name, column in udb.UnifiedHeaders.get_all_columns().items():
+        if column == entry:
+            return name
+    return entry.description
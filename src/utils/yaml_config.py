@@ -1,4 +1,3 @@
-import yaml
 import os
 
 #variable names in local_settings.yaml
@@ -15,6 +14,8 @@ def load_local_settings(local_settings_path="local_settings.yaml"):
     Returns:
         dict: Parsed local settings as a Python dictionary.
     """
+    # yaml is imported on first use, so commands that do not read settings start faster
+    import yaml
     if not os.path.exists(local_settings_path):
         raise FileNotFoundError(f"Required file '{local_settings_path}' not found. Please create it and add your base_path.")
     with open(local_settings_path, "r", encoding="utf-8") as f:
@@ -27,3 +28,69 @@ def load_local_settings(local_settings_path="local_settings.yaml"):
             raise KeyError(f"'{var1}' not found in '{local_settings_path}'.")
     return local_settings
 
+
+def load_categories(categories_path="categories.yaml"):
+    """
+    Loads the user-defined categories for the transaction classification.
+    The file maps group categories to categories, and categories to their keywords:
+
+        Food:
+          Groceries:
+            keywords: [mercadona, edeka, lidl]
+            priority: 10
+          Restaurants: [restaurante, bar, pizzeria]
+
+    Args:
+        categories_path (str): Path to the categories YAML file.
+
+    Returns:
+        dict: Parsed categories as a Python dictionary.
+    """
+    import yaml
+    if not os.path.exists(categories_path):
+        raise FileNotFoundError(f"Categories file '{categories_path}' not found.")
+    with open(categories_path, "r", encoding="utf-8") as f:
+        try:
+            categories = yaml.safe_load(f) or {}
+        except yaml.YAMLError as e:
+            raise RuntimeError(f"Error parsing '{categories_path}': {e}")
+    if not isinstance(categories, dict):
+        raise ValueError(f"'{categories_path}' should map group categories to categories.")
+    return categories
+
+
+def load_bank_definitions(banks_path="banks.yaml"):
+    """
+    Loads the banks defined in YAML, which need no Bank subclass. The file maps bank names to
+    the arguments of banks_format.Bank, with the unified column names as header_map values:
+
+        ING:
+          description: ING Direct
+          csv_delimiter: ";"
+          csv_decimal: ","
+          csv_header_row: 3
+          csv_date_format: "%d/%m/%Y"
+          header_map:
+            F. VALOR: date
+            DESCRIPCIÓN: description
+            IMPORTE (€): amount
+            SALDO (€): balance
+            CATEGORÍA: unused
+
+    Args:
+        banks_path (str): Path to the banks YAML file.
+
+    Returns:
+        dict: Bank definitions by bank name.
+    """
+    import yaml
+    if not os.path.exists(banks_path):
+        raise FileNotFoundError(f"Banks file '{banks_path}' not found.")
+    with open(banks_path, "r", encoding="utf-8") as f:
+        try:
+            banks = yaml.safe_load(f) or {}
+        except yaml.YAMLError as e:
+            raise RuntimeError(f"Error parsing '{banks_path}': {e}")
+    if not isinstance(banks, dict) or not all(isinstance(definition, dict) for definition in banks.values()):
+        raise ValueError(f"'{banks_path}' should map bank names to their configuration.")
+    return banks
@@ -0,0 +1,230 @@
+# Watch mode: a long-running process that imports new or changed bank files as soon as they land.
+# The bank files are polled, so it works the same on every OS. Parsing runs in a pool of worker
+# processes that stays up between files, while the bank registry, the fingerprint and balance
+# indexes, the rollups and the BD2 store stay open in the main process, so each import only pays
+# for its own rows.
+import asyncio
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import balances as balances
+import banks_format as banks_format
+import classifier as classifier
+import coverage_index as coverage_index
+import dedupe_index as dedupe_index
+import import_manifest as import_manifest
+import ingest as ingest
+import rollups as rollups
+import search_index as search_index
+import transaction_store as transaction_store
+from utils import metrics
+from utils.utils import log, setup_logging, print_processing_summary
+
+# Seconds between two polls of the bank files
+DEFAULT_POLL_INTERVAL = 5.0
+
+
+class BankWatcher:
+    """
+    Polls the files of every bank and imports each new or changed file.
+    A file is imported once its size and modification time did not change between two polls,
+    so files that are still being written or downloaded are not parsed half-way.
+    """
+
+    def __init__(self, banks_base_path: str, manifest_path: str, store_path: Optional[str] = None,
+                 rules: Optional[List[classifier.CategoryRule]] = None, chunk_size: Optional[int] = None,
+                 workers: int = 1, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 metrics_collector: Optional[metrics.MetricsCollector] = None):
+        """
+        Args:
+            banks_base_path (str): Base folder with one subfolder per bank.
+            manifest_path (str): Path of the import manifest, which tells new and changed files apart.
+            store_path (str, optional): Base folder of the BD2 transaction store.
+            rules (list, optional): Category rules used to classify the transactions.
+            chunk_size (int, optional): Stream the files in chunks of this many rows.
+            workers (int): Number of worker processes that parse the files.
+            poll_interval (float): Seconds between two polls.
+            metrics_collector (MetricsCollector, optional): Collector of the stage metrics of every import.
+        """
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError(f"Invalid number of workers '{workers}'. It should be a positive integer.")
+        if poll_interval <= 0:
+            raise ValueError(f"Invalid poll interval '{poll_interval}'. It should be a positive number of seconds.")
+        self.banks_base_path = banks_base_path
+        self.store_path = store_path
+        self.rules = rules
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.metrics_collector = metrics_collector
+        self.banks = banks_format.Bank.get_banks()
+        for bank_name, error in banks_format.Bank.get_bank_errors().items():
+            log.error(f"Bank {bank_name} is not watched: {error}")
+        self.manifest = import_manifest.ImportManifest(manifest_path)
+        self.store = transaction_store.TransactionStore(store_path) if store_path else None
+        self.coverage = coverage_index.CoverageIndex(ingest.get_coverage_index_path(store_path)) if store_path else None
+        self.rollups = rollups.RollupIndex(ingest.get_rollup_index_path(store_path), self.store) if store_path else None
+        self.search_index = search_index.SearchIndex(ingest.get_search_index_path(store_path), self.store) if store_path else None
+        # Fingerprint and balance indexes of each bank, loaded on its first import and kept open
+        self._fingerprints: Dict[str, dedupe_index.FingerprintIndex] = {}
+        self._balances: Dict[str, balances.BalanceIndex] = {}
+        # (size, mtime_ns) of every file on the previous poll
+        self._last_seen: Dict[str, Tuple[int, int]] = {}
+        # (size, mtime_ns) of the files whose import failed, not retried until they change
+        self._failed: Dict[str, Tuple[int, int]] = {}
+        # Whether the manifest recorded files that did not change but were touched since the last save
+        self._manifest_changed = False
+        # Serializes the writes to BD2, the manifest and the indexes
+        self._store_lock: Optional[asyncio.Lock] = None
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        """
+        Polls the bank files until `stop` is set (or SIGINT/SIGTERM is received).
+        """
+        stop = stop or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Not supported on Windows or outside the main thread: Ctrl+C still raises KeyboardInterrupt
+                pass
+        self._store_lock = asyncio.Lock()
+        log.info(f"Watching {len(self.banks)} banks in {self.banks_base_path} every {self.poll_interval:g} s with {self.workers} workers")
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=setup_logging) as pool:
+            while not stop.is_set():
+                await self.poll(pool)
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        log.info("Stopped watching the bank files")
+
+    async def poll(self, pool: ProcessPoolExecutor) -> Dict[str, bool]:
+        """
+        Imports the files that changed since their last import and did not change since the
+        previous poll, all of them concurrently.
+        Returns:
+            dict: Dictionary mapping the bank names of the imported files to True/False for success
+        """
+        ready = []
+        for bank in self.banks.values():
+            for csv_path in ingest.get_bank_files(self.banks_base_path, bank):
+                if self._is_ready(csv_path):
+                    ready.append((bank, csv_path))
+        if not ready:
+            return {}
+
+        outcomes = await asyncio.gather(*(self._import_file(pool, bank, csv_path) for bank, csv_path in ready))
+        csv_results = {}
+        coverage_warnings: List[coverage_index.CoverageWarning] = []
+        for (bank, _), (success, warnings) in zip(ready, outcomes):
+            if success is None:
+                continue
+            csv_results[bank.name] = csv_results.get(bank.name, True) and success
+            coverage_warnings.extend(warnings)
+        if csv_results or self._manifest_changed:
+            self.manifest.save()
+            self._manifest_changed = False
+        if csv_results:
+            if self.coverage is not None:
+                self.coverage.save()
+            print_processing_summary(csv_results, coverage_warnings, self.metrics_collector)
+        return csv_results
+
+    def _is_ready(self, csv_path: str) -> bool:
+        try:
+            stat = os.stat(csv_path)
+        except OSError:
+            self._last_seen.pop(csv_path, None)
+            return False
+        current = (stat.st_size, stat.st_mtime_ns)
+        previous = self._last_seen.get(csv_path)
+        self._last_seen[csv_path] = current
+        # Still being written, or already failed in this state
+        return current == previous and self._failed.get(csv_path) != current
+
+    async def _import_file(self, pool: ProcessPoolExecutor, bank: banks_format.Bank, csv_path: str):
+        """
+        Imports one file: the manifest check runs in a thread, the parsing in the worker pool,
+        and the deduplication and storage in the main process.
+        Returns:
+            tuple: (True/False for success, or None if the file did not change; coverage warnings)
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            # Files with a footer cannot be imported by their tail only
+            file_check = await loop.run_in_executor(None, self.manifest.check, csv_path, bank.csv_last_row == 0)
+            if file_check.status == import_manifest.FileStatus.UNCHANGED:
+                if file_check.touched:
+                    self.manifest.record(csv_path, file_check, 0)
+                    self._manifest_changed = True
+                return None, []
+
+            offset, previous_row_count = 0, 0
+            if file_check.status == import_manifest.FileStatus.APPENDED:
+                offset, previous_row_count = file_check.offset, file_check.previous.row_count
+            log.info(f"{bank.name}: importing {csv_path} ({file_check.status.value})")
+            unified_df, result = await loop.run_in_executor(
+                pool, ingest.parse_bank_file, bank, csv_path, self.chunk_size, self.rules, offset, previous_row_count,
+                self.metrics_collector is not None)
+            async with self._store_lock:
+                if self.store is not None:
+                    await loop.run_in_executor(None, self._store, bank, unified_df, csv_path, offset, result)
+        except (ValueError, OSError, RuntimeError) as e:
+            # Invalid, moved or unreadable files and corrupt indexes only fail their own import,
+            # the other files are still watched
+            log.error(f"Error processing bank {bank.name}: {str(e)}")
+            self._failed[csv_path] = self._last_seen.get(csv_path)
+            return False, []
+
+        self._failed.pop(csv_path, None)
+        log.info(f"{bank.name}: {result.row_count} rows processed")
+        if self.metrics_collector is not None and result.stage_metrics:
+            self.metrics_collector.merge(result.stage_metrics)
+        self.manifest.record(csv_path, file_check, result.row_count, result.first_date, result.last_date)
+        warnings = []
+        if self.coverage is not None:
+            warnings = self.coverage.check_and_add(bank.name, result.first_date, result.last_date, ingest.get_own_range(file_check))
+        return True, warnings
+
+    def _store(self, bank: banks_format.Bank, unified_df, csv_path: str, offset: int, result: ingest.FileResult) -> None:
+        fingerprints = self._fingerprints.get(bank.name)
+        if fingerprints is None:
+            fingerprints = dedupe_index.FingerprintIndex(ingest.get_fingerprint_index_path(self.store_path, bank))
+            self._fingerprints[bank.name] = fingerprints
+        balance_index = self._balances.get(bank.name)
+        if balance_index is None:
+            balance_index = balances.BalanceIndex(ingest.get_balance_index_path(self.store_path, bank))
+            self._balances[bank.name] = balance_index
+        try:
+            with metrics.collecting(self.metrics_collector is not None) as collector:
+                fingerprints.start_import(continues=offset > 0)
+                new_count = ingest.store_new_transactions(bank, unified_df, fingerprints, self.store, self.rollups)
+                with metrics.stage(bank.name, "store"):
+                    fingerprints.compact_if_needed()
+                    if ingest.update_balances(bank, unified_df, [(csv_path, offset, 0)], [result], balance_index) is not None:
+                        balance_index.save()
+                    self.search_index.update([bank.name])
+        except Exception:
+            # The open indexes of the bank may count rows that were never stored. They are dropped
+            # while the store lock is held, so the next import of the bank loads them from their files
+            self._fingerprints.pop(bank.name, None)
+            self._balances.pop(bank.name, None)
+            if self.rollups is not None:
+                self.rollups.discard(bank.name)
+            raise
+        if collector is not None:
+            self.metrics_collector.merge(collector.get_records())
+        log.info(f"{bank.name}: {new_count} new transactions, {len(unified_df) - new_count} already in BD2")
+
+def watch(banks_base_path: str, manifest_path: str, **kwargs) -> None:
+    """
+    Runs a BankWatcher until it is interrupted. Keyword arguments are passed to BankWatcher.
+    """
+    watcher = BankWatcher(banks_base_path, manifest_path, **kwargs)
+    try:
+        asyncio.run(watcher.run())
+    except KeyboardInterrupt:
+        log.info("Stopped watching the bank files")
@@ -0,0 +1,37 @@
+# Shared fixtures of the tests. The modules of src are imported like main.py imports them.
+import os
+import sys
+from typing import List
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import banks_format as banks_format  # noqa: E402
+
+N26_HEADER = ('"Booking Date","Value Date","Partner Name","Partner Iban","Type","Payment Reference",'
+              '"Account Name","Amount (EUR)","Original Amount","Original Currency","Exchange Rate"')
+
+
+def n26_row(date: str, description: str, amount: str, partner: str = "Cafe") -> str:
+    """Returns a row of an N26 export."""
+    return (f'"{date}","{date}","{partner}","DE89370400440532013000","Presentment","{description}",'
+            f'"Main Account","{amount}","","",""')
+
+def write_n26(path, rows: List[str], mode: str = "w") -> None:
+    """Writes an N26 export, or appends rows to it with mode "a"."""
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        if mode == "w":
+            f.write(N26_HEADER + "\n")
+        f.writelines(row + "\n" for row in rows)
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """
+    Folder with the exports of N26, the only bank imported by the tests. The tests run inside
+    it, so no banks.yaml or logs of the repository are picked up.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(banks_format.Bank, "get_banks", classmethod(lambda cls: {"N26": banks_format.N26()}))
+    monkeypatch.setattr(banks_format.Bank, "get_bank_errors", classmethod(lambda cls: {}))
+    (tmp_path / "banks" / "N26").mkdir(parents=True)
+    return tmp_path
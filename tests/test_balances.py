@@ -0,0 +1,83 @@
+from datetime import date
+import pandas as pd
+import balances as balances
+import banks_format as banks_format
+import csv_processor as csv_processor
+
+
+def _transactions(rows):
+    """Unified transactions from (date, amount, balance) tuples, in cents; balance may be None."""
+    dates, amounts, provided = zip(*rows)
+    return pd.DataFrame({"date": pd.to_datetime(list(dates)), "amount": pd.array(amounts, dtype="Int64"),
+                         "balance": pd.array(provided, dtype="Int64")})
+
+def _daily(report):
+    return {day.date().isoformat(): int(cents) for day, cents in report.daily.items()}
+
+
+def test_saldo_mismatch_carries_the_bank_balance():
+    df = _transactions([("2024-03-01", -100, 900), ("2024-03-02", -200, 690), ("2024-03-03", -300, None),
+                        ("2024-03-04", -100, 290), ("2024-03-05", -50, None)])
+    report = balances.compute_balances(df, "Abanca")
+    # The opening balance is the first Saldo minus its amount
+    assert (report.opening, report.opening_date) == (1000, date(2024, 2, 29))
+    # The bank balance wins, and the rows after it continue from it
+    assert report.mismatches == [balances.BalanceMismatch(date(2024, 3, 2), 690, 700)]
+    assert _daily(report) == {"2024-03-01": 900, "2024-03-02": 690, "2024-03-03": 390, "2024-03-04": 290, "2024-03-05": 240}
+
+def test_newest_first_export_is_balanced_in_chronological_order():
+    # Two transactions on the same day, listed newest first like Abanca does
+    df = _transactions([("2024-03-02", -50, 800), ("2024-03-02", -150, 850), ("2024-03-01", 1000, 1000)])
+    report = balances.compute_balances(df, "Abanca")
+    assert report.opening == 0
+    assert report.mismatches == []
+    assert _daily(report) == {"2024-03-01": 1000, "2024-03-02": 800}
+
+def test_statement_preamble_and_footer_are_checkpoints(tmp_path):
+    bank = banks_format.DB()
+    header = ";".join(bank.header_map)
+    rows = ["01.03.2024;01.03.2024;Lastschrift;Edeka;Einkauf 1;;;;;;;-34,56;;;;;;;EUR",
+            "15.03.2024;15.03.2024;Gutschrift;Firma;Gehalt;;;;;;;2.000,00;;;;;;;EUR"]
+    csv_path = tmp_path / "importar.csv"
+    csv_path.write_text("\n".join(["Umsätze Girokonto;Zeitraum: 01.03.2024 - 31.03.2024;;;", "",
+                                   "Kontostand vom 29.02.2024:;;;1.234,56 EUR", "", header] + rows +
+                                  ["Kontostand;31.03.2024;;;3.100,00;EUR"]) + "\n", encoding="cp1252")
+    openings, closings = csv_processor.read_statement_balances(str(csv_path), bank)
+    assert openings == [(pd.Timestamp("2024-02-29"), 123456)]
+    assert closings == [(pd.Timestamp("2024-03-31"), 310000)]
+
+    df = _transactions([("2024-03-01", -3456, None), ("2024-03-15", 200000, None)])
+    report = balances.compute_balances(df, "DB", opening=openings[0][1], closing_balances=closings)
+    assert report.closing == 320000
+    assert report.mismatches == [balances.BalanceMismatch(date(2024, 3, 31), 310000, 320000)]
+
+def test_appended_tail_continues_the_indexed_balance(tmp_path):
+    index = balances.BalanceIndex(str(tmp_path / "DB.json"))
+    index.add(balances.compute_balances(_transactions([("2024-03-01", -100, None), ("2024-03-02", -100, None)]), "DB", opening=1000))
+    assert index.balance_at("2024-02-29") == 1000
+    assert index.balance_at(date(2024, 3, 2)) == 800
+    assert index.balance_at("2024-02-28") is None
+
+    # The tail starts with a second transaction of the last imported day
+    tail = _transactions([("2024-03-02", -50, None), ("2024-03-04", -50, None)])
+    report = balances.compute_balances(tail, "DB", previous_balances=index, continues=True)
+    assert (report.opening, report.opening_date) == (800, date(2024, 3, 2))
+    assert report.mismatches == []
+    index.add(report)
+    index.save()
+    index = balances.BalanceIndex(str(tmp_path / "DB.json"))
+    assert [index.balance_at(f"2024-03-0{day}") for day in range(1, 6)] == [900, 750, 750, 700, 700]
+    # Without continues, a different opening on a covered day is a mismatch
+    report = balances.compute_balances(_transactions([("2024-03-02", -50, None)]), "DB", opening=850, previous_balances=index)
+    assert report.mismatches == [balances.BalanceMismatch(date(2024, 3, 1), 850, 900)]
+
+def test_index_replaces_the_balances_of_reimported_days(tmp_path):
+    index = balances.BalanceIndex(str(tmp_path / "N26.json"))
+    index.add(balances.compute_balances(_transactions([(f"2024-03-{day:02d}", -100, None) for day in (1, 5, 10, 20)]), "N26", opening=1000))
+    assert index.covers("2024-02-29") and index.covers("2024-03-20")
+    assert not index.covers("2024-02-28") and not index.covers("2024-03-21")
+
+    # A re-import of 5 to 10 March with a missing transaction added on the 7th
+    index.add(balances.compute_balances(_transactions([("2024-03-05", -100, None), ("2024-03-07", -30, None), ("2024-03-10", -100, None)]),
+                                        "N26", opening=900))
+    assert [index.balance_at(f"2024-03-{day:02d}") for day in (1, 4, 5, 6, 7, 10, 19, 20)] == [900, 900, 800, 800, 770, 670, 670, 600]
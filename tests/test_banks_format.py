@@ -0,0 +1,29 @@
+import banks_format as banks_format
+
+BANKS_YAML = """
+ING:
+  description: ING Direct
+  csv_delimiter: ";"
+  csv_decimal: ","
+  header_map:
+    F. VALOR: date
+    DESCRIPCION: description
+    IMPORTE: amount
+Broken:
+  header_map:
+    Fecha: date
+"""
+
+
+def test_banks_list_includes_the_banks_defined_in_yaml(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "banks.yaml").write_text(BANKS_YAML, encoding="utf-8")
+    banks_format._load_registry.cache_clear()
+    try:
+        assert banks_format.Bank.get_banks_list() == list(banks_format.Bank.get_banks())
+        assert {"N26", "Abanca", "DB", "ING"} <= set(banks_format.Bank.get_banks_list())
+        # Banks with an invalid definition are reported by get_bank_errors instead
+        assert "Broken" not in banks_format.Bank.get_banks_list()
+        assert "Broken" in banks_format.Bank.get_bank_errors()
+    finally:
+        banks_format._load_registry.cache_clear()
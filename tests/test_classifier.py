@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import classifier as classifier
+from classifier import CategoryRule
+
+
+def _classify(rules, descriptions):
+    df = pd.DataFrame({"description": pd.array(descriptions, dtype="string")})
+    return classifier.compile_rules(rules).classify(df)["category"].fillna("").tolist()
+
+
+def test_higher_priority_wins_then_definition_order():
+    rules = [CategoryRule("Food", "Living", ("mercadona",)), CategoryRule("Fuel", "Car", ("repsol",)),
+             CategoryRule("Refunds", "Income", ("devolucion",), priority=1)]
+    assert _classify(rules, ["REPSOL MERCADONA", "Mercadona repsol", "devolucion repsol", "Bizum"]) == \
+        ["Food", "Food", "Refunds", ""]
+
+def test_overlapping_and_nested_keywords():
+    rules = [CategoryRule("Low", "G", ("abc", "market")), CategoryRule("High", "G", ("bcd", "ark"), priority=1)]
+    assert _classify(rules, ["xabcdx", "xabcx", "supermarket", "mark"]) == ["High", "Low", "High", "High"]
+
+def test_texts_are_normalized_like_the_keywords():
+    rules = [CategoryRule("Bakery", "Food", ("Panadería  Peña",)), CategoryRule("Street", "Misc", ("strasse",))]
+    assert _classify(rules, ["PANADERIA PENA 12", "panaderia \t pena", "Hauptstraße 1", "panaderiapena"]) == \
+        ["Bakery", "Bakery", "Street", ""]
+
+def test_missing_values_and_other_columns():
+    rules = [CategoryRule("Salary", "Income", ("acme",))]
+    df = pd.DataFrame({"description": pd.array([None, "Nomina"], dtype="string"),
+                       "origin": pd.array(["ACME Corp", None], dtype="string")})
+    result = classifier.compile_rules(rules).classify(df)
+    assert result["category"].fillna("").tolist() == ["Salary", ""]
+    assert result["group"].fillna("").tolist() == ["Income", ""]
+
+def test_automaton_matches_long_and_batched_texts(monkeypatch):
+    monkeypatch.setattr(classifier, "BATCH_CHARS", 64)
+    automaton = classifier.KeywordAutomaton(["needle", "pin"], [1, 0])
+    texts = np.array(["x" * 200 + "needle", "", "pin", "haystack", "a pin and a needle"], dtype=object)
+    assert automaton.best_matches(texts).tolist() == [1, automaton.NO_MATCH, 0, automaton.NO_MATCH, 0]
+    assert automaton.best_match("no match") is None
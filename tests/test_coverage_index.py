@@ -0,0 +1,26 @@
+from datetime import date
+import coverage_index as coverage_index
+
+
+def test_gaps_and_overlaps(tmp_path):
+    index = coverage_index.CoverageIndex(str(tmp_path / "coverage.json"))
+    assert index.check_and_add("N26", "2024-01-01", "2024-01-31") == []
+    warnings = index.check_and_add("N26", "2024-03-15", "2024-04-30")
+    assert [(w.kind, w.start, w.end) for w in warnings] == [("gap", date(2024, 2, 1), date(2024, 3, 14))]
+    warnings = index.check_and_add("N26", "2024-01-20", "2024-02-10")
+    assert [(w.kind, w.start, w.end) for w in warnings] == [("overlap", date(2024, 1, 20), date(2024, 1, 31))]
+    assert index.get_intervals("N26") == [(date(2024, 1, 1), date(2024, 2, 10)), (date(2024, 3, 15), date(2024, 4, 30))]
+    # Other banks have their own ranges
+    assert index.check_and_add("DB", "2024-01-01", "2024-01-31") == []
+
+def test_own_range_of_an_appended_file_is_not_an_overlap(tmp_path):
+    index = coverage_index.CoverageIndex(str(tmp_path / "coverage.json"))
+    index.check_and_add("N26", "2024-01-01", "2024-01-31")
+    index.check_and_add("N26", "2024-02-01", "2024-02-29")
+    # The tail of the February file starts on its last imported day
+    assert index.check_and_add("N26", "2024-02-29", "2024-03-10", own_range=("2024-02-01", "2024-02-29")) == []
+    # Overlaps outside the range of the file are still reported
+    warnings = index.check("N26", date(2024, 1, 25), date(2024, 2, 5), own_range=(date(2024, 2, 1), date(2024, 2, 29)))
+    assert [(w.kind, w.start, w.end) for w in warnings] == [("overlap", date(2024, 1, 25), date(2024, 1, 31))]
+    index.save()
+    assert coverage_index.CoverageIndex(str(tmp_path / "coverage.json")).get_intervals("N26") == [(date(2024, 1, 1), date(2024, 3, 10))]
@@ -0,0 +1,23 @@
+import pandas as pd
+import banks_format as banks_format
+import csv_processor as csv_processor
+
+ABANCA_HEADER = "Fecha ctble;Fecha valor;Concepto;Importe;Moneda;Saldo;Moneda;Concepto ampliado"
+
+
+def test_amounts_with_comma_decimals(tmp_path):
+    csv_path = tmp_path / "importar.csv"
+    rows = [("2024-03-01", "Transfer", "-1.500", "2.000"), ("2024-03-02", "Coffee", "-3,20", "1.996,80"),
+            ("2024-03-03", "Shop", "-1.234,5", "762,30"), ("2024-03-04", "Refund", "12", "774,30"),
+            ("2024-03-05", "Fee", "-0,3", "774,00")]
+    csv_path.write_text("\n".join([ABANCA_HEADER] + [f"{date};{date};{description};{amount};EUR;{balance};EUR;"
+                                                     for date, description, amount, balance in rows]) + "\n", encoding="utf-8")
+    bank = banks_format.Abanca()
+    unified_df = csv_processor.create_unified_dataframe(csv_processor.load_csv_file(str(csv_path), bank), bank)
+    assert unified_df["amount"].tolist() == [-150000, -320, -123450, 1200, -30]
+    assert unified_df["balance"].tolist() == [200000, 199680, 76230, 77430, 77400]
+
+def test_numeric_amounts_are_parsed_with_the_bank_decimal_separator():
+    assert csv_processor.parse_amounts(pd.Series([-1.5, 2.25]), banks_format.N26().csv_decimal).tolist() == [-150, 225]
+    # Integers that reach a bank with "," decimals are amounts without decimals
+    assert csv_processor.parse_amounts(pd.Series([-1500, 12]), banks_format.Abanca().csv_decimal).tolist() == [-150000, 1200]
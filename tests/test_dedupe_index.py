@@ -0,0 +1,53 @@
+import pandas as pd
+import dedupe_index as dedupe_index
+
+
+def _transactions(count, repeats=1):
+    return pd.DataFrame({
+        "bank": ["N26"] * count * repeats,
+        "date": pd.to_datetime(["2024-01-01"] * count * repeats),
+        "amount": [-(i % count) - 1 for i in range(count * repeats)],
+        "description": [f"Order {i % count}" for i in range(count * repeats)],
+        "iban": [""] * count * repeats,
+    })
+
+
+def test_full_bloom_filter_is_compacted(tmp_path):
+    path = str(tmp_path / "N26")
+    index = dedupe_index.FingerprintIndex(path, bloom_capacity=10)
+    index.start_import()
+    assert index.filter_new(_transactions(100)).all()
+    index.save()
+    assert index.compact_if_needed()
+    assert not index.compact_if_needed()
+
+    index = dedupe_index.FingerprintIndex(path, bloom_capacity=10)
+    assert index._bloom.estimated_false_positive_rate() <= index.false_positive_rate
+    index.start_import()
+    assert not index.filter_new(_transactions(100)).any()
+    index.start_import()
+    assert index.filter_new(_transactions(100, repeats=2)).sum() == 100
+
+def test_superseded_records_are_compacted(tmp_path):
+    path = str(tmp_path / "N26")
+    # Each import adds one more repeat of the same transactions, appending a record for each
+    for repeats in range(1, 4):
+        index = dedupe_index.FingerprintIndex(path, use_bloom=False)
+        index.start_import()
+        assert index.filter_new(_transactions(50, repeats)).sum() == 50
+        index.save()
+    assert index._record_count() == 150
+    assert index.compact_if_needed()
+    assert index._record_count() == 50
+    index = dedupe_index.FingerprintIndex(path, use_bloom=False)
+    index.start_import()
+    assert not index.filter_new(_transactions(50, 3)).any()
+
+def test_bloom_filter_counts_distinct_fingerprints(tmp_path):
+    index = dedupe_index.FingerprintIndex(str(tmp_path / "N26"))
+    for repeats in range(1, 4):
+        index.start_import()
+        # Two chunks of the same import
+        index.filter_new(_transactions(50, repeats))
+        index.filter_new(_transactions(50))
+    assert index._bloom.num_items == 50
@@ -0,0 +1,179 @@
+import json
+import os
+import pytest
+import banks_format as banks_format
+import dedupe_index as dedupe_index
+import import_manifest as import_manifest
+import ingest as ingest
+import rollups as rollups
+import transaction_store as transaction_store
+from conftest import n26_row, write_n26
+
+
+@pytest.fixture
+def exports(workspace, monkeypatch):
+    """Folder of N26 with several export files, imported together."""
+    bank = banks_format.N26()
+    bank.csv_filename = "export_*.csv"
+    monkeypatch.setattr(banks_format.Bank, "get_banks", classmethod(lambda cls: {"N26": bank}))
+    return workspace / "banks" / "N26"
+
+
+def _ingest(workspace, force=False):
+    csv_results, coverage_warnings = ingest.run_ingestion(str(workspace / "banks"), store_path=str(workspace / "bd2"),
+                                                          manifest_path=str(workspace / "import_manifest.json"), force=force)
+    assert csv_results["N26"]
+    return coverage_warnings
+
+def _stored(workspace):
+    return transaction_store.TransactionStore(str(workspace / "bd2")).read(banks=["N26"])
+
+def _manifest_row_count(workspace):
+    with open(workspace / "import_manifest.json", encoding="utf-8") as f:
+        return sum(entry["row_count"] for entry in json.load(f).values())
+
+def _rollup_count(workspace):
+    return rollups.RollupIndex(ingest.get_rollup_index_path(str(workspace / "bd2"))).to_dataframe()["count"].sum()
+
+def _days(first, last):
+    return [n26_row(f"2024-01-{day:02d}", f"Shop {day}", f"-{day}.00") for day in range(first, last + 1)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_missing_export_fails_only_its_bank(workspace, monkeypatch, workers):
+    monkeypatch.setattr(banks_format.Bank, "get_banks", classmethod(lambda cls: {"N26": banks_format.N26(), "Abanca": banks_format.Abanca()}))
+    write_n26(workspace / "banks" / "N26" / "importar.csv", _days(1, 5))
+    csv_results, _ = ingest.run_ingestion(str(workspace / "banks"), workers=workers, store_path=str(workspace / "bd2"),
+                                          manifest_path=str(workspace / "import_manifest.json"))
+    assert csv_results == {"N26": True, "Abanca": False}
+    assert len(_stored(workspace)) == 5
+    assert _manifest_row_count(workspace) == 5
+
+def test_appended_tail_keeps_same_day_repeats(workspace):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    write_n26(csv_path, [n26_row("2024-03-01", "Rent", "-500.00"), n26_row("2024-03-02", "Salary", "1500.00"),
+                         n26_row("2024-03-03", "Bakery", "-2.40"), n26_row("2024-03-04", "Lunch", "-9.90"),
+                         n26_row("2024-03-04", "Coffee", "-3.00")])
+    _ingest(workspace)
+    assert len(_stored(workspace)) == 5
+
+    # A second coffee on the same day, exported after the first import
+    write_n26(csv_path, [n26_row("2024-03-04", "Coffee", "-3.00")], mode="a")
+    _ingest(workspace)
+    stored = _stored(workspace)
+    assert len(stored) == 6
+    assert (stored["description"] == "Coffee").sum() == 2
+    assert _manifest_row_count(workspace) == 6
+
+    # The fingerprint index counts both coffees, so a full re-import adds nothing
+    index = dedupe_index.FingerprintIndex(ingest.get_fingerprint_index_path(str(workspace / "bd2"), banks_format.Bank.get_bank("N26")))
+    index.start_import()
+    assert not index.filter_new(stored).any()
+
+def test_failed_import_leaves_bd2_and_indexes_consistent(workspace):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    dates = [f"2024-{month:02d}-{day:02d}" for month in range(1, 13) for day in range(1, 29)]
+    rows = [n26_row(dates[i % len(dates)], f"Order {i}", f"-{i % 90 + 1}.25") for i in range(20000)]
+    write_n26(csv_path, rows)
+    # An invalid UTF-8 byte far from the start and the end of the file, found by a later chunk
+    content = csv_path.read_bytes()
+    bad_offset = content.index(b'"Order 15000"')
+    csv_path.write_bytes(content[:bad_offset] + b"\xff" + content[bad_offset + 1:])
+
+    csv_results, _ = ingest.run_ingestion(str(workspace / "banks"), chunk_size=2000, store_path=str(workspace / "bd2"),
+                                          manifest_path=str(workspace / "import_manifest.json"))
+    assert not csv_results["N26"]
+    stored = _stored(workspace)
+    assert 0 < len(stored) < len(rows)
+    index = dedupe_index.FingerprintIndex(ingest.get_fingerprint_index_path(str(workspace / "bd2"), banks_format.Bank.get_bank("N26")))
+    assert sum(index._load_counts().values()) == len(stored)
+
+    # Once the file is fixed, the rows stored by the failed import are not stored again
+    write_n26(csv_path, rows)
+    csv_results, _ = ingest.run_ingestion(str(workspace / "banks"), chunk_size=2000, store_path=str(workspace / "bd2"),
+                                          manifest_path=str(workspace / "import_manifest.json"))
+    assert csv_results["N26"]
+    assert len(_stored(workspace)) == len(rows)
+    assert _rollup_count(workspace) == len(rows)
+
+def test_appended_tail_is_imported_alone(workspace):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    write_n26(csv_path, _days(1, 10))
+    _ingest(workspace)
+    # The tail starts on the last imported day of the file, which is no overlap
+    write_n26(csv_path, [n26_row("2024-01-10", "Lunch", "-9.00")] + _days(11, 12), mode="a")
+    assert _ingest(workspace) == []
+    stored = _stored(workspace)
+    assert sorted(stored["description"]) == sorted([f"Shop {day}" for day in range(1, 13)] + ["Lunch"])
+    assert _manifest_row_count(workspace) == 13
+    with open(workspace / "import_manifest.json", encoding="utf-8") as f:
+        entry = next(iter(json.load(f).values()))
+    assert (entry["first_date"], entry["last_date"]) == ("2024-01-01", "2024-01-12")
+
+def test_touched_file_is_recorded_again(workspace, monkeypatch):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    write_n26(csv_path, _days(1, 10))
+    _ingest(workspace)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    ingest.run_ingestion(str(workspace / "banks"), store_path=str(workspace / "bd2"), manifest_path=str(workspace / "import_manifest.json"))
+
+    # The new modification time is recorded, so the next run trusts it without hashing the file
+    hashed = []
+    monkeypatch.setattr(import_manifest, "_hash_stream", lambda *args: hashed.append(args))
+    csv_results, _ = ingest.run_ingestion(str(workspace / "banks"), store_path=str(workspace / "bd2"),
+                                          manifest_path=str(workspace / "import_manifest.json"))
+    assert csv_results == {"N26": True}
+    assert not hashed
+    assert _manifest_row_count(workspace) == 10
+
+def test_overlapping_exports_are_stored_once(exports):
+    write_n26(exports / "export_1.csv", _days(1, 10))
+    # Exports newest first, like some banks do
+    write_n26(exports / "export_2.csv", _days(6, 15)[::-1])
+    _ingest(exports.parent.parent)
+    stored = _stored(exports.parent.parent)
+    assert len(stored) == 15
+    assert stored.sort_values("date")["description"].tolist() == [f"Shop {day}" for day in range(1, 16)]
+
+def test_reimport_of_exports_is_idempotent(exports):
+    workspace = exports.parent.parent
+    coffee = n26_row("2024-01-07", "Coffee", "-3.00")
+    write_n26(exports / "export_1.csv", _days(1, 10) + [coffee, coffee])
+    write_n26(exports / "export_2.csv", _days(6, 15) + [coffee, coffee])
+    _ingest(workspace)
+    assert len(_stored(workspace)) == 17
+
+    _ingest(workspace, force=True)
+    assert len(_stored(workspace)) == 17
+    assert _rollup_count(workspace) == 17
+
+def test_appended_export_is_merged_with_the_others(exports):
+    workspace = exports.parent.parent
+    write_n26(exports / "export_1.csv", _days(1, 10))
+    write_n26(exports / "export_2.csv", _days(6, 15))
+    _ingest(workspace)
+    # A new day and a second, identical transaction on the last day
+    write_n26(exports / "export_2.csv", _days(16, 16) + _days(15, 15), mode="a")
+    _ingest(workspace)
+    stored = _stored(workspace)
+    assert len(stored) == 17
+    assert (stored["description"] == "Shop 15").sum() == 2
+    _ingest(workspace, force=True)
+    assert len(_stored(workspace)) == 17
+
+def test_appended_export_repeats_are_merged_with_unchanged_exports(exports):
+    workspace = exports.parent.parent
+    coffee = n26_row("2024-01-07", "Coffee", "-3.00")
+    write_n26(exports / "export_1.csv", _days(1, 10) + [coffee, coffee])
+    write_n26(exports / "export_2.csv", _days(6, 15) + [coffee])
+    _ingest(workspace)
+    assert (_stored(workspace)["description"] == "Coffee").sum() == 2
+
+    # The second coffee of export_1 shows up in export_2 too, which is the only changed export
+    write_n26(exports / "export_2.csv", [coffee], mode="a")
+    _ingest(workspace)
+    assert (_stored(workspace)["description"] == "Coffee").sum() == 2
+    _ingest(workspace, force=True)
+    assert len(_stored(workspace)) == 17
+    assert _rollup_count(workspace) == 17
@@ -0,0 +1,45 @@
+import pandas as pd
+import ingest as ingest
+
+
+def _export(rows):
+    """Unified DataFrame of an export, from (date, description, amount in cents) rows."""
+    return pd.DataFrame({
+        "bank": "N26",
+        "date": pd.to_datetime([date for date, _, _ in rows]),
+        "amount": pd.array([amount for _, _, amount in rows], dtype="Int64"),
+        "description": pd.array([description for _, description, _ in rows], dtype="string"),
+        "iban": pd.array([None] * len(rows), dtype="string"),
+    })
+
+def _days(first, last):
+    return [(f"2024-01-{day:02d}", f"Shop {day}", -100 * day) for day in range(first, last + 1)]
+
+def _keys(df):
+    return list(zip(df["date"].dt.strftime("%Y-%m-%d"), df["description"], df["amount"]))
+
+
+def test_overlapping_exports_are_merged_once_in_date_order():
+    merged = ingest.merge_exports([_export(_days(5, 15)), _export(_days(1, 10))])
+    assert _keys(merged) == _days(1, 15)
+    assert merged.index.tolist() == list(range(15))
+
+def test_reversed_exports_keep_the_order_of_same_day_transactions():
+    rows = _days(1, 3) + [("2024-01-03", "Coffee", -300), ("2024-01-03", "Lunch", -1200)] + _days(4, 6)
+    newest_first = _export(rows[::-1])
+    assert _keys(ingest.merge_exports([newest_first])) == rows
+    assert _keys(ingest.merge_exports([_export(rows[:5]), newest_first])) == rows
+
+def test_repeats_are_kept_up_to_the_largest_count_of_one_export():
+    coffee = ("2024-01-05", "Coffee", -300)
+    first = _export(_days(1, 5) + [coffee, coffee])
+    second = _export(_days(5, 8) + [coffee, coffee, coffee])
+    merged = ingest.merge_exports([first, second])
+    assert _keys(merged).count(coffee) == 3
+    assert len(merged) == len(_days(1, 8)) + 3
+
+def test_undated_transactions_are_merged_last():
+    undated = ("NaT", "Unknown", -1)
+    merged = ingest.merge_exports([_export([undated] + _days(1, 2)), _export(_days(2, 3))])
+    assert _keys(merged)[:3] == _days(1, 3)
+    assert len(merged) == 4 and pd.isna(merged["date"].iloc[-1])
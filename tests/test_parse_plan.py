@@ -0,0 +1,30 @@
+import pandas as pd
+import banks_format as banks_format
+import parse_plan as parse_plan
+
+
+def test_amounts_of_comma_decimal_banks_are_read_as_text():
+    plan = parse_plan.get_parse_plan(banks_format.Abanca())
+    kwargs = plan.read_csv_kwargs(["Fecha ctble", "Concepto", "Importe", "Saldo", "Moneda"])
+    assert kwargs["usecols"] == ["Fecha ctble", "Concepto", "Importe", "Saldo"]
+    assert kwargs["dtype"]["Importe"] is str
+    assert kwargs["dtype"]["Saldo"] is str
+
+def test_amounts_of_dot_decimal_banks_are_inferred():
+    plan = parse_plan.get_parse_plan(banks_format.N26())
+    assert "Amount (EUR)" not in plan.read_csv_kwargs(["Booking Date", "Amount (EUR)"])["dtype"]
+
+def test_plans_are_cached_by_configuration():
+    bank = banks_format.N26()
+    assert parse_plan.get_parse_plan(bank) is parse_plan.get_parse_plan(banks_format.N26())
+    bank.csv_decimal = ","
+    assert parse_plan.get_parse_plan(bank).dtypes["amount (eur)"] is str
+
+def test_converters_are_bound_to_the_bank_configuration():
+    plan = parse_plan.get_parse_plan(banks_format.Abanca())
+    amount = banks_format.Abanca().header_map["Importe"]
+    assert plan.converters[amount](pd.Series(["-1.500,25", "12"])).tolist() == [-150025, 1200]
+    bank = banks_format.N26()
+    bank.csv_date_format = "%d/%m/%Y"
+    date = bank.header_map["Booking Date"]
+    assert parse_plan.get_parse_plan(bank).converters[date](pd.Series(["02/03/2024"])).tolist() == [pd.Timestamp("2024-03-02")]
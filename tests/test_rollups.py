@@ -0,0 +1,35 @@
+import shutil
+import pandas as pd
+import rollups as rollups
+import transaction_store as transaction_store
+
+
+def _transactions(month, categories):
+    return pd.DataFrame({
+        "bank": ["N26"] * len(categories),
+        "date": pd.to_datetime([f"{month}-{day + 1:02d}" for day in range(len(categories))]),
+        "amount": [-100 * (day + 1) for day in range(len(categories))],
+        "category": categories,
+        "origin": ["Cafe"] * len(categories),
+    })
+
+
+def test_refresh_recomputes_only_the_given_months(tmp_path):
+    store = transaction_store.TransactionStore(str(tmp_path / "bd2"))
+    index = rollups.RollupIndex(str(tmp_path / "rollups"), store)
+    df = pd.concat([_transactions("2024-01", ["Food", "Food", ""]), _transactions("2024-02", ["Food", ""])], ignore_index=True)
+    index.add(df)
+    store.append(df)
+    index.save()
+    assert index.get("N26", "2024-01", key="Food") == rollups.Rollup(-300, 2, -200, -100)
+
+    # The January rows are reclassified in BD2, and February is left as it is
+    shutil.rmtree(store._partition_dir("N26", "2024-01"))
+    store.append(_transactions("2024-01", ["Food", "Rent", "Rent"]))
+    index = rollups.RollupIndex(str(tmp_path / "rollups"), store)
+    index.refresh("N26", ["2024-01"])
+    assert index.get("N26", "2024-01", key="Food") == rollups.Rollup(-100, 1, -100, -100)
+    assert index.get("N26", "2024-01", key="Rent") == rollups.Rollup(-500, 2, -300, -200)
+    assert index.get("N26", "2024-01") is None
+    assert index.get("N26", "2024-02", key="Food") == rollups.Rollup(-100, 1, -100, -100)
+    assert index.total("N26", "2024-02").count == 2
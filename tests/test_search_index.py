@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+import pytest
+import search_index as search_index
+import transaction_store as transaction_store
+
+
+def _transactions(rows):
+    """Unified transactions of N26 from (date, description, origin, amount in cents) tuples."""
+    dates, descriptions, origins, amounts = zip(*rows)
+    return pd.DataFrame({
+        "bank": ["N26"] * len(rows),
+        "date": pd.to_datetime(list(dates)),
+        "description": list(descriptions),
+        "info_extended": [None] * len(rows),
+        "origin": list(origins),
+        "amount": pd.array(amounts, dtype="Int64"),
+    })
+
+@pytest.fixture
+def index(tmp_path):
+    store = transaction_store.TransactionStore(str(tmp_path / "bd2"))
+    store.append(_transactions([
+        ("2023-12-20", "AMAZON EU Marketplace", "Amazon", -8990),
+        ("2024-01-05", "Amazon Prime", "Prime Video", -899),
+        ("2024-02-10", "Bäckerei Müller", "Müller", -350),
+        ("2024-03-15", "amazon.de Rückerstattung", "Amazon", 6000),
+        ("2024-04-01", "Amazon Marketplace", "Amazon", None),
+    ]))
+    search = search_index.SearchIndex(str(tmp_path / "search"), store)
+    assert search.update() == 5
+    return search
+
+
+def test_tokens_are_case_folded_without_accents():
+    assert search_index.tokenize("Bäckerei MÜLLER, Straße") == ["backerei", "muller", "strasse"]
+    assert search_index.tokenize("amazon.de*Ref 123") == ["amazon", "de", "ref", "123"]
+
+def test_every_token_must_match(index):
+    assert index.search("muller").description.tolist() == ["Bäckerei Müller"]
+    assert index.search("MÜLLER backerei").description.tolist() == ["Bäckerei Müller"]
+    # Tokens of different columns of the same transaction
+    assert index.search("amazon video").description.tolist() == ["Amazon Prime"]
+    assert index.search("amazon muller").empty
+    # Most recent first
+    assert index.search("amazon").description.tolist() == [
+        "Amazon Marketplace", "amazon.de Rückerstattung", "Amazon Prime", "AMAZON EU Marketplace"]
+    assert index.search("amazon", limit=1).description.tolist() == ["Amazon Marketplace"]
+    with pytest.raises(ValueError):
+        index.search("...")
+
+def test_date_and_amount_filters(index):
+    assert index.search("amazon", start="2024-01-01", end="2024-03-15").description.tolist() == [
+        "amazon.de Rückerstattung", "Amazon Prime"]
+    # Absolute amounts in cents; transactions without an amount never match an amount range
+    assert index.search("amazon", min_amount=5000).description.tolist() == ["amazon.de Rückerstattung", "AMAZON EU Marketplace"]
+    assert index.search("amazon", max_amount=1000).description.tolist() == ["Amazon Prime"]
+    assert index.search("amazon", start="2024-01-01", min_amount=5000).description.tolist() == ["amazon.de Rückerstattung"]
+
+def test_segments_are_merged(tmp_path):
+    store = transaction_store.TransactionStore(str(tmp_path / "bd2"))
+    search = search_index.SearchIndex(str(tmp_path / "search"), store)
+    for day in range(1, 21):
+        store.append(_transactions([(f"2024-01-{day:02d}", f"Shop {day} coffee", "Cafe", -100 * day)]))
+        assert search.update(["N26"]) == 1
+        assert len(search._segments(["N26"])) <= search_index.MAX_SEGMENTS
+    assert search.update(["N26"]) == 0
+
+    # A new index over the same folder, as opened by another run
+    search = search_index.SearchIndex(str(tmp_path / "search"), store)
+    found = search.search("coffee")
+    assert found.description.tolist() == [f"Shop {day} coffee" for day in range(20, 0, -1)]
+    assert found.amount.tolist() == [-100 * day for day in range(20, 0, -1)]
+    assert search.search("shop 7").description.tolist() == ["Shop 7 coffee"]
+    assert search.search("coffee", start="2024-01-10", end="2024-01-11", min_amount=1100).description.tolist() == ["Shop 11 coffee"]
+    assert len(os.listdir(tmp_path / "search" / "N26")) == len(search._segments(["N26"]))
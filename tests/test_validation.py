@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import banks_format as banks_format
+from utils import validation
+
+
+def _n26(rows):
+    """DataFrame as loaded from an N26 export, from (date, description, amount) tuples."""
+    dates, descriptions, amounts = zip(*rows)
+    return pd.DataFrame({"Booking Date": list(dates), "Payment Reference": list(descriptions), "Amount (EUR)": list(amounts)},
+                        dtype="string")
+
+
+def test_decimal_separator_is_inferred_from_the_majority():
+    assert validation.infer_decimal_separator([pd.Series(["-12,50", "1.234,56", "3,1", "-1.500"])]) == ","
+    assert validation.infer_decimal_separator([pd.Series(["-12.50 €", "1,234.56", "EUR 3.1"])], default=",") == "."
+    # Counted per row, not per distinct value
+    assert validation.infer_decimal_separator([pd.Series(["1,5"] * 3 + ["2.5", "3.75"])]) == ","
+
+def test_ambiguous_amounts_give_no_evidence():
+    # "1.234" is 1.234 or 1234: the bank's separator is kept
+    assert validation.infer_decimal_separator([pd.Series(["1.234", "-5.000", None])], default=",") == ","
+    assert validation.infer_decimal_separator([pd.Series(["1,234"])], default=".") == "."
+    assert validation.infer_decimal_separator([], default=",") == ","
+
+def test_amounts_with_the_other_separator_are_flagged():
+    df = _n26([("2024-03-01", "Rent", "-500.00"), ("2024-03-02", "Salary", "1,500.00"), ("2024-03-03", "Lunch", "-9,90"),
+               ("2024-03-04", "Shop", "1.234"), ("2024-03-05", "Shop", "12 EUR"), ("2024-03-06", "Shop", "abc"),
+               ("2024-03-07", "Shop", "-1.234,56")])
+    report = validation.validate_dataframe(df, banks_format.N26())
+    assert (report.decimal, report.thousands) == (".", ",")
+    errors = report.column_errors["Amount (EUR)"]
+    assert errors.tolist() == [0, 0, validation.ValidationError.DECIMAL_SEPARATOR, 0, 0,
+                               validation.ValidationError.INVALID_AMOUNT, validation.ValidationError.DECIMAL_SEPARATOR]
+    assert report.counts()["Amount (EUR)"] == {"INVALID_AMOUNT": 1, "DECIMAL_SEPARATOR": 2}
+
+    # The separator inferred from the first chunk is used for the next ones
+    report = validation.validate_dataframe(_n26([("2024-03-08", "Shop", "-3,50")]), banks_format.N26(), decimal=".")
+    assert report.column_errors["Amount (EUR)"].tolist() == [validation.ValidationError.DECIMAL_SEPARATOR]
+
+def test_missing_mandatory_values():
+    df = _n26([("2024-03-01", "Rent", "-500.00"), (None, "Salary", "1500.00"), ("2024-03-03", "  ", None),
+               ("03/04/2024", "Lunch", "-9.90")])
+    report = validation.validate_dataframe(df, banks_format.N26())
+    assert report.column_errors["date"].tolist() == [0, validation.ValidationError.MISSING, 0, 0]
+    assert report.column_errors["description"].tolist() == [0, 0, validation.ValidationError.MISSING, 0]
+    assert report.column_errors["amount"].tolist() == [0, 0, validation.ValidationError.MISSING, 0]
+    # Empty values are missing, not badly formatted
+    assert report.column_errors["Amount (EUR)"].tolist() == [0, 0, 0, 0]
+    assert report.column_errors["Booking Date"].tolist() == [0, 0, 0, validation.ValidationError.INVALID_DATE]
+    assert report.error_rows().tolist() == [1, 2, 3]
+    assert not report.is_valid
+
+def test_mandatory_column_without_a_source_is_missing_everywhere():
+    df = _n26([("2024-03-01", "Rent", "-500.00"), ("2024-03-02", "Salary", "1500.00")]).drop(columns="Payment Reference")
+    report = validation.validate_dataframe(df, banks_format.N26())
+    assert np.array_equal(report.column_errors["description"], [validation.ValidationError.MISSING] * 2)
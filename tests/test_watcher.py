@@ -0,0 +1,81 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import import_manifest as import_manifest
+import ingest as ingest
+import watcher as watcher
+from conftest import n26_row, write_n26
+
+
+def _poll_twice(bank_watcher):
+    # A file is imported once it did not change between two polls
+    async def poll():
+        bank_watcher._store_lock = asyncio.Lock()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            await bank_watcher.poll(pool)
+            return await bank_watcher.poll(pool)
+    return asyncio.run(poll())
+
+def _watcher(workspace):
+    return watcher.BankWatcher(str(workspace / "banks"), str(workspace / "import_manifest.json"),
+                               store_path=str(workspace / "bd2"))
+
+
+def test_corrupt_index_fails_only_its_import(workspace):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    write_n26(csv_path, [n26_row(f"2024-03-0{day}", f"Shop {day}", "-1.00") for day in range(1, 6)])
+    bank_watcher = _watcher(workspace)
+    rollup_path = os.path.join(ingest.get_rollup_index_path(str(workspace / "bd2")), "N26.json")
+    with open(rollup_path, "w", encoding="utf-8") as f:
+        f.write("{not json")
+
+    assert _poll_twice(bank_watcher) == {"N26": False}
+    # The failed file is retried once it changes, and the watcher still imports it
+    os.remove(rollup_path)
+    write_n26(csv_path, [n26_row("2024-03-06", "Shop 6", "-1.00")], mode="a")
+    assert _poll_twice(bank_watcher) == {"N26": True}
+
+def test_file_removed_before_its_import(workspace, monkeypatch):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    write_n26(csv_path, [n26_row(f"2024-03-0{day}", f"Shop {day}", "-1.00") for day in range(1, 6)])
+    bank_watcher = _watcher(workspace)
+    check = bank_watcher.manifest.check
+
+    def check_removed(path, allow_append=True):
+        os.remove(path)
+        return check(path, allow_append)
+    monkeypatch.setattr(bank_watcher.manifest, "check", check_removed)
+    assert _poll_twice(bank_watcher) == {"N26": False}
+
+def test_touched_file_is_hashed_once(workspace, monkeypatch):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    write_n26(csv_path, [n26_row(f"2024-03-0{day}", f"Shop {day}", "-1.00") for day in range(1, 6)])
+    bank_watcher = _watcher(workspace)
+    assert _poll_twice(bank_watcher) == {"N26": True}
+
+    # The same export downloaded again
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert _poll_twice(bank_watcher) == {}
+    hashed = []
+    monkeypatch.setattr(import_manifest, "_hash_stream", lambda *args: hashed.append(args))
+    assert _poll_twice(bank_watcher) == {}
+    assert not hashed
+    assert import_manifest.ImportManifest(str(workspace / "import_manifest.json")).check(str(csv_path)).status == import_manifest.FileStatus.UNCHANGED
+
+def test_failed_store_does_not_keep_unstored_rows_in_the_indexes(workspace, monkeypatch):
+    csv_path = workspace / "banks" / "N26" / "importar.csv"
+    write_n26(csv_path, [n26_row(f"2024-03-0{day}", f"Shop {day}", "-1.00") for day in range(1, 6)])
+    bank_watcher = _watcher(workspace)
+    append = bank_watcher.store.append
+
+    def append_failing(df):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(bank_watcher.store, "append", append_failing)
+    assert _poll_twice(bank_watcher) == {"N26": False}
+
+    monkeypatch.setattr(bank_watcher.store, "append", append)
+    write_n26(csv_path, [n26_row("2024-03-06", "Shop 6", "-1.00")], mode="a")
+    assert _poll_twice(bank_watcher) == {"N26": True}
+    assert len(bank_watcher.store.read(banks=["N26"])) == 6
+    assert bank_watcher.rollups.total("N26", "2024-03").count == 6